@@ -2,20 +2,113 @@
 """
 Owns the "read a batch of samples, write them, buffer them, decide whether to
 keep going" loop. This module has no knowledge of how (or whether) the
-results get displayed: it only ever imports aves.io and the standard
-library, so it can be imported and tested without matplotlib or Tk
-installed.
+results get displayed: it only ever imports aves.io, aves.transforms,
+aves.metrics and the standard library, so it can be imported and tested
+without matplotlib or Tk installed.
+
+Acquisition.step() blocks on the input device, so it runs in a thread of
+its own (the GUI's, or a background one). AsyncAcquisition is the same
+loop for an asyncio event loop instead: it waits for the serial port to
+be readable with ``loop.add_reader()`` and reads what arrived without
+blocking, so acquisition can share the loop of e.g. the aves.web server,
+and stopping it is cancelling its task.
+
+Either reads a fixed number of samples per step (``samples_per_step``),
+or, given an AdaptiveBatching, sizes each batch to the measured sample
+rate so that steps come at roughly a target latency, however fast or
+slow the sensor is.
 """
 
+import asyncio
 import datetime
+import logging
+import sys
+import time
+from collections import deque
+
+from aves.alarms import describe
+from aves.metrics import Metrics
+from aves.transforms import to_columns, to_rows
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveBatching(object):
+    """
+    Sizes batches to a target latency instead of a fixed number of
+    samples: each step waits for about ``target_latency * rate`` samples,
+    the rate being measured as acquisition goes, kept within
+    ``min_samples`` and ``max_samples``, and never waits longer than the
+    ``deadline`` (seconds, default: four times the target latency), even
+    if that means a smaller batch than min_samples or none at all.
+
+    A slow sensor then gets small batches, plotted as soon as they are
+    worth it, and a fast one larger ones, with less overhead per sample.
+    """
+
+    #: Weight of the latest batch in the measured rate.
+    SMOOTHING = 0.3
+
+    #: Batches (of max_samples) read ahead that may wait for the next
+    #: steps, beyond which the oldest of them are dropped.
+    MAX_BACKLOG_BATCHES = 10
+
+    def __init__(self, target_latency, min_samples=1, max_samples=1000, deadline=None):
+        if target_latency <= 0:
+            raise ValueError(f"The target latency must be positive, got {target_latency}")
+        if not 1 <= min_samples <= max_samples:
+            raise ValueError(
+                f"Batch bounds must satisfy 1 <= min <= max, got {min_samples} and {max_samples}")
+        self.target_latency = target_latency
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.deadline = deadline if deadline is not None else 4 * target_latency
+        #: Measured samples per second (None until two batches finished)
+        self.rate = None
+        self._last_finish = None
+        self._batch_start = None
+
+    def size(self):
+        "How many samples the next batch should have."
+        if self.rate is None:
+            return self.min_samples
+        return min(self.max_samples, max(self.min_samples, round(self.rate * self.target_latency)))
+
+    def start(self):
+        "Marks the start of a batch, for wait()."
+        self._batch_start = time.monotonic()
+
+    def wait(self, count):
+        """
+        How long to wait for more samples, with count of them in the batch
+        so far, or None if the batch is complete.
+        """
+        now = time.monotonic()
+        size = self.size()
+        left = self._batch_start + self.deadline - now
+        if count >= size or left <= 0:
+            return None
+        if self.rate:
+            left = min(left, (size - count) / self.rate)
+        # Not less than a millisecond, to never spin
+        return max(left, 0.001)
+
+    def finished(self, count):
+        "Accounts for a batch of count samples in the measured rate."
+        now = time.monotonic()
+        if self._last_finish is not None and now > self._last_finish:
+            rate = count / (now - self._last_finish)
+            self.rate = rate if self.rate is None else (
+                self.SMOOTHING * rate + (1 - self.SMOOTHING) * self.rate)
+        self._last_finish = now
 
 
 class Acquisition(object):
     """
     Reads samples from idev, optionally writes them to outfile, and
-    buffers them in buffers. A presentation layer (a GUI, a script, a
-    test) reads buffers.data after each step() -- it is never called
-    into from here.
+    buffers them in buffers, in the order they were read. A presentation
+    layer (a GUI, a script, a test) reads buffers (e.g. buffers.last())
+    after each step() -- it is never called into from here.
 
     Args:
         idev: An open aves.io.ReadSensorAbstract instance.
@@ -25,16 +118,55 @@ class Acquisition(object):
         tmeas (float): Stop once this many seconds have elapsed since
             construction (default: unlimited).
         samples_per_step (int): How many samples step() reads at a time.
+        batching (AdaptiveBatching): Size batches to the sample rate
+            instead, see AdaptiveBatching (default: samples_per_step).
+        metrics (aves.metrics.Metrics): Where to record how long each part
+            of a step takes (default: a Metrics of its own).
+        gap_detector (aves.gaps.GapDetector): Checks every batch for lost
+            samples, marking them in the outfile (default: no checks).
+        alarms (aves.alarms.Alarms): Checked against every batch as
+            stored, logging what fires or clears and marking it in the
+            outfile (default: no alarms).
+        on_alarm: Called with each event of the alarms (see
+            aves.alarms.Alarms.check), from the thread acquiring.
+        memory_budget (aves.memory.MemoryBudget): Checked after every
+            step, to keep memory use within it (default: no budget).
+        transforms (aves.transforms.TransformPipeline): Stages every
+            batch goes through between being read and being written and
+            buffered (default: none).
     """
 
     def __init__(self, idev, buffers, outfile=None, tmeas=float('inf'),
-                 samples_per_step=10):
+                 samples_per_step=10, memory_budget=None, transforms=None,
+                 batching=None, metrics=None, gap_detector=None, alarms=None,
+                 on_alarm=None):
         self.idev = idev
         self.buffers = buffers
         self.outfile = outfile
         self.tmeas = tmeas
         self.samples_per_step = samples_per_step
+        self.memory_budget = memory_budget
+        self.transforms = transforms
+        self.batching = batching
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.gap_detector = gap_detector
+        self.alarms = alarms
+        self.on_alarm = on_alarm
+        self._bytes_read = 0
         self._start = datetime.datetime.now()
+        self._pending = deque()
+        # Samples read beyond the batch being returned, for the next step
+        self._backlog = []
+        self._last_arrival = None
+
+    def call_soon(self, callback, *args):
+        """
+        Runs callback(*args) at the start of the next step(), in whatever
+        thread runs the steps. Safe to call from any thread: use it to
+        change things the acquisition is using (e.g. resize buffers) from
+        outside the thread driving it.
+        """
+        self._pending.append((callback, args))
 
     def step(self):
         """
@@ -44,12 +176,146 @@ class Acquisition(object):
         Returns:
             list: The samples read (possibly empty).
         """
-        samples = self.idev.readsamples(num_samples=self.samples_per_step)
-        if self.outfile is not None:
-            self.outfile.write(samples)
-        self.buffers.extendleft(samples)
+        self._run_pending()
+        start = time.perf_counter_ns()
+        if self.batching is not None and hasattr(self.idev, "readsamples_nowait"):
+            batch = self._adaptive_batch()
+            try:
+                while True:
+                    time.sleep(next(batch))
+            except StopIteration as done:
+                samples = done.value
+        else:
+            samples = self.idev.readsamples(num_samples=self._batch_size())
+            if self.batching is not None:
+                self.batching.finished(len(samples))
+        self._count_read(samples, start)
+        return self._store(samples)
+
+    def _count_read(self, samples, start):
+        "Records the read that started at start (perf_counter_ns) in metrics."
+        metrics = self.metrics
+        metrics.record("read", time.perf_counter_ns() - start)
+        metrics.add("samples", len(samples))
+        bytes_read = getattr(self.idev, "bytes_read", 0)
+        metrics.add("bytes", bytes_read - self._bytes_read)
+        self._bytes_read = bytes_read
+
+    def _batch_size(self):
+        return self.samples_per_step if self.batching is None else self.batching.size()
+
+    def _adaptive_batch(self):
+        """
+        Collects a batch from a device that can be read without waiting,
+        as the batching says. A generator yielding how long to wait before
+        reading again, and returning the batch: step() and step_async()
+        each wait in their own way.
+        """
+        batching = self.batching
+        batching.start()
+        samples, self._backlog = self._backlog, []
+        while True:
+            arrived = self.idev.readsamples_nowait()
+            now = time.monotonic()
+            if arrived or self._last_arrival is None:
+                self._last_arrival = now
+            samples += arrived
+            if self.idev.stop_sampling:
+                break
+            if not arrived and now - self._last_arrival > self.idev.timeout:
+                self.idev.timed_out()
+                break
+            wait = batching.wait(len(samples))
+            if wait is None:
+                break
+            yield wait
+        samples, backlog = samples[:batching.max_samples], samples[batching.max_samples:]
+        limit = batching.MAX_BACKLOG_BATCHES * batching.max_samples
+        if len(backlog) > limit:
+            dropped = len(backlog) - limit
+            backlog = backlog[dropped:]
+            self.metrics.add("dropped_samples", dropped)
+            logger.warning(
+                "Dropping %d samples read ahead: the device sends more than %d samples "
+                "per step, and acquisition cannot keep up (raise --max-batch?)",
+                dropped, batching.max_samples)
+        self._backlog = backlog
+        batching.finished(len(samples))
         return samples
 
+    def _run_pending(self):
+        while self._pending:
+            callback, args = self._pending.popleft()
+            callback(*args)
+
+    def _store(self, samples):
+        """
+        Transforms (if there are transforms), writes (if there is an
+        outfile) and buffers samples. Returns the samples as stored.
+        """
+        metrics = self.metrics
+        if self.gap_detector is not None and samples:
+            self._check_gaps(samples)
+        start = time.perf_counter_ns()
+        if self.transforms is not None and samples:
+            columns = self.transforms(to_columns(samples), metrics=metrics)
+            samples = to_rows(columns)
+            transformed = time.perf_counter_ns()
+            metrics.record("transform", transformed - start)
+            if self.alarms is not None:
+                self._check_alarms(columns)
+                transformed = time.perf_counter_ns()
+            self.buffers.extend_columns(columns)
+            buffered = time.perf_counter_ns()
+            metrics.record("buffer", buffered - transformed)
+            if self.outfile is not None:
+                self.outfile.write(samples)
+                metrics.record("write", time.perf_counter_ns() - buffered)
+        else:
+            if self.alarms is not None and samples:
+                self._check_alarms(to_columns(samples))
+                start = time.perf_counter_ns()
+            if self.outfile is not None:
+                self.outfile.write(samples)
+                written = time.perf_counter_ns()
+                metrics.record("write", written - start)
+                start = written
+            self.buffers.extend(samples)
+            metrics.record("buffer", time.perf_counter_ns() - start)
+        if self.memory_budget is not None:
+            self.memory_budget.check(self.buffers)
+        return samples
+
+    def _check_gaps(self, samples):
+        "Counts, logs and (if there is an outfile) marks the gaps in samples."
+        gaps = self.gap_detector.check(samples)
+        if not gaps:
+            return
+        lost = sum(count for _, _, count in gaps)
+        self.metrics.add("lost_samples", lost)
+        logger.warning(
+            "%d samples lost in %d gaps in %r (%.2f%% lost so far); is the host keeping up?",
+            lost, len(gaps), self.gap_detector.column, 100 * self.gap_detector.loss_rate)
+        if self.outfile is not None and hasattr(self.outfile, "comment"):
+            for gap in gaps:
+                self.outfile.comment(self.gap_detector.describe(gap))
+
+    def _check_alarms(self, columns):
+        "Checks the alarms on a batch, and reports what fired or cleared."
+        start = time.perf_counter_ns()
+        events = self.alarms.check(columns)
+        self.metrics.record("alarms", time.perf_counter_ns() - start)
+        for event in events:
+            if event["active"]:
+                self.metrics.add("alarms")
+                logger.warning("%s", describe(event))
+            else:
+                logger.info("%s", describe(event))
+            if self.outfile is not None and hasattr(self.outfile, "comment"):
+                self.outfile.comment(describe(event))
+            if self.on_alarm is not None:
+                self.on_alarm(event)
+
     def should_stop(self):
         """
         True once the time limit has been reached or the input device has
@@ -58,3 +324,98 @@ class Acquisition(object):
         """
         elapsed = (datetime.datetime.now() - self._start).total_seconds()
         return elapsed > self.tmeas or self.idev.stop_sampling
+
+
+def can_wait_on(idev):
+    """
+    Whether an AsyncAcquisition can wait on the open device idev with
+    ``loop.add_reader()``: it has to be readable without blocking and
+    have a file descriptor, and the event loop has to support
+    add_reader(). Neither holds on Windows, whose default event loop
+    (ProactorEventLoop) has no add_reader() and whose pyserial ports
+    have no fileno(); read such devices with a blocking Acquisition in a
+    thread instead.
+    """
+    if sys.platform == "win32" or not hasattr(idev, "readsamples_nowait"):
+        return False
+    try:
+        idev.fileno()
+    except (NotImplementedError, AttributeError, OSError):
+        return False
+    return True
+
+
+class AsyncAcquisition(Acquisition):
+    """
+    Acquisition for an asyncio event loop (see the module docstring):
+    await step_async() instead of calling step(), from the loop's thread.
+
+    Input devices that can be read without blocking (that have
+    ``readsamples_nowait()``, ``fileno()`` and ``timeout``, like
+    aves.io.ReadSensorSerial, see can_wait_on()) are waited on with
+    ``loop.add_reader()``, and each step waits for samples_per_step of
+    them, as step() does.
+    Any other device (e.g. a recording being replayed) is read with
+    blocking readsamples() calls in the loop's default executor. With an
+    AdaptiveBatching, the former are read again after sleeping as long as
+    the batching says, rather than as soon as anything arrives.
+    """
+
+    async def step_async(self):
+        """
+        Like step(), without blocking the event loop. Cancelling it stops
+        waiting for samples; a blocking read already under way in the
+        executor is finished first, so the device can then be closed.
+        """
+        self._run_pending()
+        start = time.perf_counter_ns()
+        if hasattr(self.idev, "readsamples_nowait") and self.batching is not None:
+            batch = self._adaptive_batch()
+            try:
+                while True:
+                    await asyncio.sleep(next(batch))
+            except StopIteration as done:
+                samples = done.value
+        elif can_wait_on(self.idev):
+            samples = await self._read_when_ready()
+        else:
+            samples = await self._read_in_executor()
+            if self.batching is not None:
+                self.batching.finished(len(samples))
+        self._count_read(samples, start)
+        return self._store(samples)
+
+    async def _read_when_ready(self):
+        """
+        Waits for samples_per_step samples, like step() does, or until the
+        port times out. Samples beyond them wait for the next step.
+        """
+        loop = asyncio.get_running_loop()
+        size = max(self.samples_per_step, 1)
+        samples, self._backlog = self._backlog, []
+        while True:
+            if len(samples) < size:
+                samples += self.idev.readsamples_nowait()
+            if len(samples) >= size or self.idev.stop_sampling:
+                break
+            readable = loop.create_future()
+            fd = self.idev.fileno()
+            loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+            try:
+                await asyncio.wait_for(readable, self.idev.timeout)
+            except asyncio.TimeoutError:
+                self.idev.timed_out()
+                break
+            finally:
+                loop.remove_reader(fd)
+        samples, self._backlog = samples[:size], samples[size:]
+        return samples
+
+    async def _read_in_executor(self):
+        loop = asyncio.get_running_loop()
+        read = loop.run_in_executor(None, self.idev.readsamples, self._batch_size())
+        try:
+            return await asyncio.shield(read)
+        except asyncio.CancelledError:
+            await read
+            raise
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Alarms on the live samples: rules in the config that the acquisition
+checks every batch against as it stores it, rather than a script polling
+the buffers and possibly missing what happened between two polls.
+
+Each ``[[alarms]]`` table is one rule:
+
+    [[alarms]]
+    name = "Overheating"
+    column = "Temperature"
+    above = 80            # fires at 80 or more...
+    hysteresis = 2        # ...and clears below 78 (default: 0)
+    debounce = 5          # only after 5 samples in a row (default: 1)
+
+    [[alarms]]
+    name = "Supply out of range"
+    column = "Vcc"
+    outside = [4.75, 5.25]
+    debounce = 100
+
+Instead of ``above``, ``below`` fires at a value or less, ``outside`` at
+values off a [low, high] range, and ``rising`` (``falling``) when the
+column rises (falls) by at least that much from one sample to the next.
+Levels are in the column's converted units, and the column may be one a
+transform adds (see aves.transforms, whose stages read columns kept in
+a raw dtype converted, so what they add is in converted units too). An
+alarm fires once its condition has held for ``debounce`` samples in a
+row, and stays active until the column is back past the level by
+``hysteresis`` (inside the range by that much, for ``outside``): a value
+hovering around the level does not fire and clear it over and over.
+
+Alarms.check() goes over each rule with a few vectorized numpy
+operations per batch, whatever its length, and returns what fired or
+cleared in it. aves.acquisition.Acquisition logs those events, counts
+them in its metrics ("alarms"), writes them to the recording as comment
+lines, and hands them to its on_alarm callback, e.g. to cut power in a
+safety interlock. aves.web sends them to the browsers, and serves the
+active alarms at GET /api/alarms.
+"""
+
+import collections
+import threading
+
+import numpy as np
+
+from aves.io import TIME_COMPUTER
+from aves.utils import require_keys
+
+#: Conditions an [[alarms]] table may give, see the module docstring.
+CONDITIONS = ("above", "below", "outside", "rising", "falling")
+
+#: Events Alarms keeps for snapshot().
+RECENT_EVENTS = 100
+
+
+def _run_lengths(met, carry):
+    """
+    How many samples in a row, up to each one, met is True for, the
+    first ones continuing the carry samples before the batch.
+    """
+    index = np.arange(len(met))
+    # The last sample that did not meet the condition (-1: none yet)
+    last_unmet = np.maximum.accumulate(np.where(met, -1, index))
+    return np.where(last_unmet < 0, index + 1 + carry, index - last_unmet)
+
+
+class Alarm(object):
+    "One ``[[alarms]]`` table, see the module docstring."
+
+    def __init__(self, config, where):
+        require_keys(config, ["name", "column"], where)
+        self.name = config["name"]
+        self.column = config["column"]
+        given = [condition for condition in CONDITIONS if condition in config]
+        if len(given) != 1:
+            raise ValueError(
+                f"{where} needs exactly one of " + ", ".join(repr(c) for c in CONDITIONS))
+        self.condition = given[0]
+        level = config[self.condition]
+        if self.condition == "outside":
+            if (not isinstance(level, list) or len(level) != 2
+                    or not float(level[0]) < float(level[1])):
+                raise ValueError(f"{where}'s 'outside' must be a [low, high] range")
+            self.level = (float(level[0]), float(level[1]))
+        else:
+            self.level = float(level)
+        self.hysteresis = float(config.get("hysteresis", 0))
+        if self.hysteresis < 0:
+            raise ValueError(f"{where}'s 'hysteresis' must be 0 or more")
+        self.debounce = config.get("debounce", 1)
+        if (not isinstance(self.debounce, int) or isinstance(self.debounce, bool)
+                or self.debounce < 1):
+            raise ValueError(f"{where}'s 'debounce' must be a positive integer")
+        #: Whether the alarm is active, as of the last sample checked
+        self.active = False
+        # Samples in a row (up to debounce) that met the condition, and
+        # the value before the batch being checked
+        self._run = 0
+        self._previous = None
+
+    def _met(self, values, steps):
+        "Whether the condition holds at each value."
+        if self.condition == "above":
+            return values >= self.level
+        if self.condition == "below":
+            return values <= self.level
+        if self.condition == "outside":
+            return (values < self.level[0]) | (values > self.level[1])
+        if self.condition == "rising":
+            return steps >= self.level
+        return steps <= -self.level
+
+    def _cleared(self, values, steps):
+        "Whether each value is back past the level by the hysteresis."
+        margin = self.hysteresis
+        if self.condition == "above":
+            return values < self.level - margin
+        if self.condition == "below":
+            return values > self.level + margin
+        if self.condition == "outside":
+            return (values > self.level[0] + margin) & (values < self.level[1] - margin)
+        if self.condition == "rising":
+            return steps < self.level - margin
+        return steps > margin - self.level
+
+    def update(self, values):
+        """
+        Checks the next values of the column (a float numpy array), and
+        returns the indices where the alarm fired or cleared, and whether
+        it was active from each of them on.
+        """
+        previous = values[0] if self._previous is None else self._previous
+        self._previous = values[-1]
+        steps = np.diff(values, prepend=previous)
+        runs = _run_lengths(self._met(values, steps), self._run)
+        self._run = int(min(runs[-1], self.debounce))
+        fires = runs >= self.debounce
+        clears = self._cleared(values, steps)
+        # Active from the last sample that fired it on, until one clears
+        # it: of these events, the latest one so far holds at each sample
+        index = np.arange(len(values))
+        last_event = np.maximum.accumulate(np.where(fires | clears, index, -1))
+        active = np.where(last_event < 0, self.active, fires[last_event])
+        before = np.concatenate([[self.active], active[:-1]])
+        changes = np.flatnonzero(active != before)
+        self.active = bool(active[-1])
+        return changes, active[changes]
+
+
+class Alarms(object):
+    """
+    The config's ``[[alarms]]`` tables, checked together on each batch
+    (see the module docstring).
+
+    Args:
+        tables (list): The config's ``alarms`` list.
+        scales (dict): Factors to convert columns read raw to their units
+            with (see aves.io's dtype), before comparing them to levels.
+        config_file (str): Only used to name the file in error messages.
+    """
+
+    def __init__(self, tables, scales=None, config_file="config.toml"):
+        self.alarms = []
+        for i, table in enumerate(tables):
+            alarm = Alarm(table, f"{config_file}'s 'alarms[{i}]' entry")
+            if any(other.name == alarm.name for other in self.alarms):
+                raise ValueError(
+                    f"{config_file}'s 'alarms' has more than one named {alarm.name!r}")
+            self.alarms.append(alarm)
+        self._scales = scales or {}
+        self._lock = threading.Lock()
+        self._recent = collections.deque(maxlen=RECENT_EVENTS)
+        # The event that fired each active alarm, by name
+        self._fired = {}
+
+    def check(self, columns):
+        """
+        Checks the next batch (one numpy array per column, see
+        aves.transforms.to_columns) against every alarm. Returns the
+        events in it, in order, as dicts: {"name", "column", "condition",
+        "active" (whether it fired or cleared), "value", "time" (the
+        sample's time_computer, if any)}.
+        """
+        events = []
+        for alarm in self.alarms:
+            # aves.wiring.build_alarms checks the column against the config
+            assert alarm.column in columns, alarm.column
+            values = np.asarray(columns[alarm.column], dtype=np.float64)
+            if not len(values):
+                continue
+            values = values * self._scales.get(alarm.column, 1.0)
+            changes, active = alarm.update(values)
+            for index, state in zip(changes.tolist(), active.tolist()):
+                events.append((index, {
+                    "name": alarm.name,
+                    "column": alarm.column,
+                    "condition": alarm.condition,
+                    "active": state,
+                    "value": float(values[index]),
+                    "time": (str(columns[TIME_COMPUTER][index])
+                             if TIME_COMPUTER in columns else None),
+                }))
+        events = [event for _, event in sorted(events, key=lambda pair: pair[0])]
+        if events:
+            with self._lock:
+                self._recent.extend(events)
+                for event in events:
+                    if event["active"]:
+                        self._fired[event["name"]] = event
+                    else:
+                        self._fired.pop(event["name"], None)
+        return events
+
+    @property
+    def active(self):
+        "Names of the alarms active now."
+        return [alarm.name for alarm in self.alarms if alarm.active]
+
+    def snapshot(self):
+        """
+        The active alarms (the events that fired them) and the latest
+        events, as a JSON-able dict (what aves.web serves at GET
+        /api/alarms). Safe to call from another thread than the one
+        checking.
+        """
+        with self._lock:
+            return {"active": list(self._fired.values()), "events": list(self._recent)}
+
+
+def describe(event):
+    "An event returned by Alarms.check() as text, for logs and recordings."
+    return "alarm {!r} {}: {}={!r}".format(
+        event["name"], "fired" if event["active"] else "cleared",
+        event["column"], event["value"])
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+A persistent cache of parsed recordings, so opening the same file again in
+aves.explorer does not re-parse its text.
+
+Each cached recording is a directory under the cache directory holding:
+
+ - meta.json: what the entry was built from (path, size, mtime, columns)
+   and how many samples and level-of-detail (LOD) levels it has.
+ - col<i>.npy: one binary column per output column, loaded back with
+   numpy's mmap_mode, so a cache hit costs a few milliseconds no matter
+   how long the recording is. The first column is kept as text, like
+   ReadSensorFile does; the rest are float64, or the dtype the config's
+   ``output.dtypes`` declares for them (e.g. uint16, a quarter of the
+   size).
+ - lod<k>_col<i>_min.npy / lod<k>_col<i>_max.npy: the LOD pyramid. Level
+   k holds the minimum and maximum of every LOD_FACTOR**k consecutive
+   samples of each numeric column, so a long recording can be drawn with
+   a bounded number of points without hiding its peaks (see
+   CachedRecording.decimated).
+
+Entries are keyed by the recording's absolute path, size, modification
+time and the output columns (and dtypes) it is read with, so editing the file or the
+config just makes a new entry. Whenever an entry is added, the least
+recently used ones are evicted until the whole cache fits in max_bytes.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from aves.io import ReadSensorFile
+from aves.utils import mkdir_p, require_keys
+
+logger = logging.getLogger(__name__)
+
+#: Where cached recordings are stored unless told otherwise.
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "aves")
+#: Size cap of the whole cache directory.
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+#: Samples summarized by each point of a LOD level, relative to the level
+#: below it.
+LOD_FACTOR = 4
+#: No LOD level is built with fewer points than this: drawing that many
+#: points directly is already cheap.
+LOD_MIN_POINTS = 1000
+#: Samples parsed at a time when building an entry.
+_PARSE_CHUNK = 10000
+_META = "meta.json"
+
+
+class CachedRecording(object):
+    """
+    A recording loaded from the cache.
+
+    Attributes:
+        columns (list): Column names, in file order.
+        data (dict): One read-only numpy array (memory mapped) per column.
+        lod (list): lod[k - 1] maps each numeric column name to its
+            (minimum, maximum) arrays at level k.
+    """
+
+    def __init__(self, columns, data, lod):
+        self.columns = columns
+        self.data = data
+        self.lod = lod
+
+    def __len__(self):
+        return len(self.data[self.columns[0]]) if self.columns else 0
+
+    def decimated(self, max_points):
+        """
+        Returns the recording reduced to at most about ``max_points``
+        points per column, using the finest LOD level that is small
+        enough. Every bucket contributes its minimum and its maximum, so
+        plotting the result as a line draws the envelope of the signal.
+        Text columns, which have no LOD, keep the first value of each
+        bucket (twice, to stay aligned with the numeric ones).
+        """
+        if len(self) <= max_points or not self.lod:
+            return self.data
+        for level, minmax in enumerate(self.lod, start=1):
+            buckets = len(next(iter(minmax.values()))[0])
+            if 2 * buckets <= max_points:
+                break
+        step = LOD_FACTOR ** level
+        output = {}
+        for name in self.columns:
+            if name in minmax:
+                low, high = minmax[name]
+                output[name] = np.column_stack((low, high)).ravel()
+            else:
+                output[name] = np.repeat(self.data[name][:buckets * step:step], 2)
+        return output
+
+
+def _entry_key(filename, columns, dtypes=None):
+    stat = os.stat(filename)
+    identity = [os.path.abspath(filename), stat.st_size, stat.st_mtime_ns, columns]
+    if dtypes:
+        identity.append(sorted(dtypes.items()))
+    return hashlib.sha256(json.dumps(identity).encode("utf-8")).hexdigest()
+
+
+def _parse_columns(filename, output_config):
+    "Parses filename into one numpy array per column, a chunk at a time."
+    columns = output_config["columns"]
+    with ReadSensorFile(filename=filename, config=output_config) as idev:
+        dtypes = [str] + [idev.column_dtypes.get(name, np.float64) for name in columns[1:]]
+        chunks = {name: [np.array([], dtype=dtype)] for name, dtype in zip(columns, dtypes)}
+        while not idev.stop_sampling:
+            samples = idev.readsamples(num_samples=_PARSE_CHUNK)
+            for name, dtype in zip(columns, dtypes):
+                values = [sample[name] for sample in samples]
+                chunks[name].append(np.array(values, dtype=dtype))
+    return {name: np.concatenate(arrays) for name, arrays in chunks.items()}
+
+
+def _build_lod(data, columns):
+    "Builds the LOD pyramid of every numeric column, coarser level by level."
+    numeric = [name for name in columns if data[name].dtype.kind in "iuf"]
+    lod = []
+    current = {name: (data[name], data[name]) for name in numeric}
+    while numeric:
+        length = len(next(iter(current.values()))[0])
+        if length // LOD_FACTOR < LOD_MIN_POINTS:
+            break
+        usable = length - length % LOD_FACTOR
+        level = {}
+        for name, (low, high) in current.items():
+            level[name] = (
+                low[:usable].reshape(-1, LOD_FACTOR).min(axis=1),
+                high[:usable].reshape(-1, LOD_FACTOR).max(axis=1))
+        lod.append(level)
+        current = level
+    return lod
+
+
+class RecordingCache(object):
+    """
+    Loads recordings through a cache directory, parsing (and caching) them
+    only on a miss.
+
+    Args:
+        cache_dir (str): Directory where entries are stored (created if
+            missing).
+        max_bytes (int): Evict least recently used entries once the cache
+            grows beyond this size.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def load(self, filename, output_config):
+        """
+        Returns filename (a recording with output_config's columns) as a
+        CachedRecording, from the cache if it holds an up to date entry.
+        """
+        require_keys(output_config, ["columns"], "config.toml's 'output' section")
+        columns = list(output_config["columns"])
+        entry = os.path.join(
+            self.cache_dir, _entry_key(filename, columns, output_config.get("dtypes")))
+        try:
+            recording = self._read_entry(entry)
+        except (OSError, ValueError, KeyError):
+            recording = None
+        if recording is not None:
+            # Marks the entry as recently used, for eviction
+            os.utime(os.path.join(entry, _META))
+            return recording
+        logger.info("Parsing %s (not cached yet)", filename)
+        data = _parse_columns(filename, output_config)
+        self._write_entry(entry, filename, columns, data, _build_lod(data, columns))
+        self.evict(keep=entry)
+        return self._read_entry(entry)
+
+    def _read_entry(self, entry):
+        with open(os.path.join(entry, _META), "r", encoding="utf-8") as stream:
+            meta = json.load(stream)
+        columns = meta["columns"]
+        data = {name: np.load(os.path.join(entry, f"col{i}.npy"), mmap_mode="r")
+                for i, name in enumerate(columns)}
+        lod = []
+        for level in range(1, meta["lod_levels"] + 1):
+            lod.append({
+                name: (np.load(os.path.join(entry, f"lod{level}_col{i}_min.npy"), mmap_mode="r"),
+                       np.load(os.path.join(entry, f"lod{level}_col{i}_max.npy"), mmap_mode="r"))
+                for i, name in enumerate(columns) if name in meta["lod_columns"]})
+        return CachedRecording(columns, data, lod)
+
+    def _write_entry(self, entry, filename, columns, data, lod):
+        mkdir_p(self.cache_dir)
+        # Built aside and renamed into place, so a crash (or a second aves
+        # process building the same entry) never leaves a half-written one.
+        tmpdir = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp-")
+        try:
+            for i, name in enumerate(columns):
+                np.save(os.path.join(tmpdir, f"col{i}.npy"), data[name])
+            for level, minmax in enumerate(lod, start=1):
+                for i, name in enumerate(columns):
+                    if name in minmax:
+                        np.save(os.path.join(tmpdir, f"lod{level}_col{i}_min.npy"), minmax[name][0])
+                        np.save(os.path.join(tmpdir, f"lod{level}_col{i}_max.npy"), minmax[name][1])
+            stat = os.stat(filename)
+            meta = {
+                "source": os.path.abspath(filename),
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "columns": columns,
+                "num_samples": len(data[columns[0]]) if columns else 0,
+                "lod_levels": len(lod),
+                "lod_columns": sorted(lod[0]) if lod else [],
+            }
+            with open(os.path.join(tmpdir, _META), "w", encoding="utf-8") as stream:
+                json.dump(meta, stream)
+            try:
+                os.rename(tmpdir, entry)
+            except OSError:
+                # Someone else stored the same entry first: theirs is as
+                # good as ours.
+                shutil.rmtree(tmpdir, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            raise
+
+    def _entries(self):
+        "Returns (last use, size in bytes, path) for every entry in the cache."
+        entries = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return entries
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            try:
+                last_used = os.stat(os.path.join(path, _META)).st_mtime
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+            except OSError:
+                continue
+            entries.append((last_used, size, path))
+        return entries
+
+    def size(self):
+        "Total size in bytes of the cached entries."
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, keep=None):
+        """
+        Removes least recently used entries until the cache fits in
+        max_bytes. ``keep`` (an entry path) is never removed, even if it
+        alone is larger than max_bytes.
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            logger.info("Evicting %s from the recordings cache", path)
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
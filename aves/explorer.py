@@ -14,13 +14,32 @@ It does two things:
      * Reads all samples
      * Generates a plot with all the data
      * Waits until the user closes the window.
+
+Parsed recordings are kept in a cache directory (see aves.cache), so
+opening the same file again skips parsing it. --no-cache disables that.
+
+With --follow, the file is treated as a recording that is still being
+written (e.g. by a headless aves.realtime): lines appended to it keep
+being plotted until the window is closed. Like aves.realtime, only the
+latest --plot_win_size samples (or --plot_win_seconds) are then kept, so
+that following a file for hours does not use ever more memory, and a
+bounded number of lines is read per refresh, so that a long file does
+not freeze the window while it is caught up with.
 """
 
 import argparse
 
 from aves import gui
 from aves import io
+from aves.acquisition import Acquisition
+from aves.cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, RecordingCache
 from aves.utils import parse_config, require_keys
+from aves.wiring import build_buffers
+
+#: Most samples --follow reads per GUI refresh (more if the plot window is
+#: larger), so that a long file is caught up with over several refreshes
+#: instead of being parsed whole in one.
+FOLLOW_SAMPLES_PER_REFRESH = 10000
 
 
 def parse_arguments():
@@ -33,8 +52,41 @@ def parse_arguments():
                         help="file name to load")
     parser.add_argument('--config', dest='config_file', default='config.toml',
                         help="Arduino columns, GUI layout and file format")
+    parser.add_argument("--cache-dir", dest='cache_dir', default=DEFAULT_CACHE_DIR,
+                        help="directory where parsed recordings are cached "
+                             "(default: %(default)s)")
+    parser.add_argument("--cache-size-mb", dest='cache_size_mb', type=float,
+                        default=DEFAULT_MAX_BYTES / 2**20,
+                        help="evict least recently opened recordings from "
+                             "the cache beyond this size (default: %(default)g)")
+    parser.add_argument("--no-cache", dest='use_cache', action="store_false",
+                        help="always parse the file, without reading or "
+                             "writing the cache")
+    parser.add_argument("--max-points", dest='max_points', type=int, default=0,
+                        help="plot at most about this many points per line, "
+                             "drawing the min/max envelope of longer "
+                             "recordings (needs the cache; default: 0, "
+                             "plot every sample)")
+    parser.add_argument("--follow", dest='follow', action="store_true",
+                        help="keep plotting lines appended to the file (e.g. "
+                             "by an aves.realtime still recording it) until "
+                             "the window is closed")
+    parser.add_argument('--plot_win_size', dest='plot_win_size',
+                        type=int, default=None,
+                        help="with --follow, keeps in the plot the given "
+                             "number of samples (default: 200 samples, use "
+                             "0 for unlimited; no cap with --plot_win_seconds)")
+    parser.add_argument('--plot_win_seconds', dest='plot_win_seconds',
+                        type=float, default=None,
+                        help="with --follow, keeps the samples within the "
+                             "given number of units of the gui's x_column "
+                             "(usually seconds) of the newest one instead")
     # parse args
     args = parser.parse_args()
+    if args.plot_win_size is None:
+        args.plot_win_size = 200 if args.plot_win_seconds is None else 0
+    if args.plot_win_size == 0:
+        args.plot_win_size = None
     # If no filename is given, show a dialog to load one. Only needed as a
     # fallback when --filename is omitted, so this stays a local import: it's
     # the only thing in this module that needs Tk installed (SensorViewerGUI
@@ -57,16 +109,59 @@ def DataExplorer():
     config = parse_config(config_file=args.config_file)
     require_keys(config, ["gui", "output"], args.config_file)
     window = gui.SensorViewerGUI(config=config["gui"])
+    if args.follow:
+        _follow_file(window, args.filename, config, plot_win_size=args.plot_win_size,
+                     plot_win_seconds=args.plot_win_seconds, config_file=args.config_file)
+        return
+    if args.use_cache:
+        cache = RecordingCache(cache_dir=args.cache_dir,
+                               max_bytes=int(args.cache_size_mb * 2**20))
+        recording = cache.load(args.filename, config["output"])
+        if len(recording):
+            if args.max_points > 0:
+                window.render(recording.decimated(args.max_points))
+            else:
+                window.render(recording.data)
+        window.wait_until_close()
+        return
     with io.ReadSensorFile(filename=args.filename, config=config["output"]) as idev:
         samples = idev.readsamples()
     # Add samples to buffers
-    buffers = io.DataBuffers(maxlen=len(samples))
+    buffers = io.DataBuffers(maxlen=len(samples), dtypes=idev.column_dtypes)
     buffers.extend(samples)
     # Copy buffer to gui
     if buffers.data:
-        window.render(buffers.data)
+        window.render(buffers.last())
     window.wait_until_close()
 
 
+def _follow_file(window, filename, config, plot_win_size=200, plot_win_seconds=None,
+                 config_file="config.toml"):
+    """
+    Plots the latest plot_win_size samples (or plot_win_seconds, see
+    aves.wiring.build_buffers) of filename, then of whatever gets
+    appended to it on every GUI refresh, until the window is closed.
+    Each refresh reads at most FOLLOW_SAMPLES_PER_REFRESH samples, or
+    plot_win_size if larger.
+    """
+    # follow_timeout=0: only take the lines that are already there, so
+    # waiting for new ones never blocks the GUI's refresh timer.
+    idev = io.ReadSensorFile(filename=filename, config=config["output"],
+                             follow=True, follow_timeout=0)
+    buffers = build_buffers(plot_win_size, config, idev=idev,
+                            plot_win_seconds=plot_win_seconds, config_file=config_file)
+    with idev:
+        acquisition = Acquisition(
+            idev=idev, buffers=buffers,
+            samples_per_step=max(FOLLOW_SAMPLES_PER_REFRESH, plot_win_size or 0))
+
+        def tick():
+            if acquisition.step() and acquisition.buffers.data:
+                window.render(acquisition.buffers.last())
+            return True
+
+        window.run(tick)
+
+
 if __name__ == '__main__':
     DataExplorer()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Spots samples that never made it: when the host falls behind, the
+serial port drops bytes, and with them whole lines, which otherwise
+only shows as the odd "garbage" warning from aves.io.ReadSensorSerial.
+
+The Arduino's own clock tells: with ``time_column`` set in the config's
+``[input.arduino]`` section, consecutive samples are expected one
+``sample_period`` apart (in the column's converted units; measured from
+the first samples if not given), and a step between two samples larger
+than ``tolerance`` (default: 1.5) periods is a gap, of about
+``step / period - 1`` lost samples:
+
+    [input.arduino]
+    baudrate = 115200
+    timeout = 3
+    time_column = "time_arduino"
+    sample_period = 0.01      # seconds, i.e. 100 Hz
+    # tolerance = 1.5
+
+aves.acquisition.Acquisition checks each batch it reads with a
+GapDetector, all at once with numpy, then marks each gap in the
+recording with a comment line before the batch, which readers of
+recordings skip like any other:
+
+    # gap: 3 samples lost between time_arduino=12.34 and time_arduino=12.38
+
+It counts the samples lost in its metrics ("lost_samples", see
+aves.metrics), and logs a warning for every batch with gaps.
+"""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+#: Steps between samples to measure the period from, if not given.
+_PERIOD_SAMPLES = 16
+
+
+class GapDetector(object):
+    """
+    Finds gaps in the time column of batches of samples (see the module
+    docstring).
+
+    Args:
+        column (str): The device time column.
+        period (float): Expected time between samples, in the column's
+            units. None to take the median step of the first samples.
+        tolerance (float): Steps this many periods long or longer are
+            gaps.
+        scale (float): Factor to convert the column's values to its
+            units with, if they are read raw (see aves.io's dtype).
+    """
+
+    def __init__(self, column, period=None, tolerance=1.5, scale=1.0):
+        if period is not None and period <= 0:
+            raise ValueError(f"The sample period must be positive, got {period}")
+        if tolerance <= 1:
+            raise ValueError(f"The gap tolerance must be more than 1 period, got {tolerance}")
+        self.column = column
+        self.period = period
+        self.tolerance = tolerance
+        self.scale = scale
+        #: Samples seen and samples lost so far
+        self.samples = 0
+        self.lost = 0
+        self._last = None
+        self._steps = []
+
+    @classmethod
+    def from_config(cls, arduino_config, scales=None, config_file="config.toml"):
+        """
+        The GapDetector an ``[input.arduino]`` section asks for, or None if
+        it has no time_column.
+        """
+        if "time_column" not in arduino_config:
+            return None
+        where = f"{config_file}'s 'input.arduino' section"
+        column = arduino_config["time_column"]
+        names = [entry.get("name") for entry in arduino_config.get("columns", [])]
+        if column not in names:
+            raise ValueError(
+                f"{where}'s 'time_column' must be one of its columns, got {column!r}")
+        return cls(column, period=arduino_config.get("sample_period"),
+                   tolerance=arduino_config.get("tolerance", 1.5),
+                   scale=(scales or {}).get(column, 1.0))
+
+    @property
+    def loss_rate(self):
+        "The fraction of the samples that were lost so far."
+        total = self.samples + self.lost
+        return self.lost / total if total else 0.0
+
+    def check(self, samples):
+        """
+        Returns the gaps before or within samples (the next batch, in
+        order), as a list of (before, after, lost): the times of the
+        samples on either side of the gap, and how many samples are
+        missing between them.
+        """
+        if not samples:
+            return []
+        times = np.fromiter((sample[self.column] for sample in samples),
+                            dtype=np.float64, count=len(samples)) * self.scale
+        self.samples += len(times)
+        previous = times[0] if self._last is None else self._last
+        self._last = times[-1]
+        steps = np.diff(times, prepend=previous)
+        if self.period is None:
+            self._measure(steps)
+            return []
+        gap = np.flatnonzero(steps >= self.tolerance * self.period)
+        if not len(gap):
+            return []
+        lost = np.maximum(np.rint(steps[gap] / self.period).astype(int) - 1, 1)
+        self.lost += int(lost.sum())
+        befores = np.where(gap > 0, times[gap - 1], previous)
+        return [(float(before), float(after), int(count))
+                for before, after, count in zip(befores, times[gap], lost)]
+
+    def _measure(self, steps):
+        "Takes the period to be the median of the first steps."
+        self._steps.extend(steps[steps > 0].tolist())
+        if len(self._steps) >= _PERIOD_SAMPLES:
+            self.period = float(np.median(self._steps))
+            self._steps = []
+            logger.info("Measured a sample period of %g in %r", self.period, self.column)
+
+    def describe(self, gap):
+        "A gap returned by check() as the text of its comment line."
+        before, after, lost = gap
+        return "gap: {} samples lost between {}={!r} and {}={!r}".format(
+            lost, self.column, before, self.column, after)
@@ -21,6 +21,9 @@ Additionally, this class provides an interface so the main program can:
 It gives further options to:
 
  - Optionally use the same time axis on all the plots.
+ - Let the user double ("+") or halve ("-") the plotted window from the
+   keyboard, through a caller-supplied callback (on_plot_window_scale),
+   and fire a trigger ("t", on_trigger).
  - Report whether the window has been closed by the user (closed).
  - Keep the window of the program open until it is closed by the user
    (wait_until_close).
@@ -35,6 +38,7 @@ tested (e.g. with matplotlib's Agg backend) without Tk installed.
 
 
 import matplotlib.pyplot as plt
+import numpy as np
 from matplotlib import animation
 
 from aves.utils import require_keys
@@ -70,9 +74,17 @@ _STYLE_AXIS_KEYS = {"xlim", "ylim", "xlabel", "ylabel", "title"}
 class SensorViewerGUI(object):
     """
     Creates and shows a figure with plots of the sensors
+
+    Args:
+        config (dict): The config's 'gui' section.
+        on_plot_window_scale: Called with 2.0 or 0.5 when the user presses
+            "+" or "-" on the figure, to grow or shrink how much history is
+            plotted. Keys are ignored if not given.
+        on_trigger: Called when the user presses "t" on the figure, e.g.
+            to fire a triggered recording (see aves.trigger).
     """
 
-    def __init__(self, config):
+    def __init__(self, config, on_plot_window_scale=None, on_trigger=None):
         require_keys(
             config, ["zoom_all_together", "axes", "x_column"],
             "config.toml's 'gui' section")
@@ -89,6 +101,8 @@ class SensorViewerGUI(object):
         self._sharex = bool(self._config["zoom_all_together"])
         self._sharexaxis = None
         self._xlimits = None
+        self._on_plot_window_scale = on_plot_window_scale
+        self._on_trigger = on_trigger
         self._create_figure()
         self._create_axes()
         self._create_points()
@@ -122,9 +136,20 @@ class SensorViewerGUI(object):
         if fig.canvas.manager is not None:
             fig.canvas.manager.set_window_title(
                 self._config.get("window_title", "Figure 1"))
+        fig.canvas.mpl_connect("key_press_event", self._on_key_press)
         self.fig = fig
         return
 
+    def _on_key_press(self, event):
+        if event.key == "t" and self._on_trigger is not None:
+            self._on_trigger()
+        if self._on_plot_window_scale is None:
+            return
+        if event.key in ("+", "="):
+            self._on_plot_window_scale(2.0)
+        elif event.key == "-":
+            self._on_plot_window_scale(0.5)
+
     def toogle_sharex(self):
         """ Toogle whether or not the x axis is shared when zooming"""
         self.set_sharex(sharex=not self._sharex)
@@ -226,15 +251,17 @@ class SensorViewerGUI(object):
         Draws the given data and refreshes the window.
 
         Args:
-            data (dict): Iterables to copy the data from, keyed by column
-                name (as configured in ``x_column`` and each axis'
-                ``columns``).
+            data (dict): Arrays (or anything numpy can turn into one, e.g.
+                the columns of an aves.io.DataBuffers, without copying
+                them) to take the data from, keyed by column name (as
+                configured in ``x_column`` and each axis' ``columns``).
 
         """
         x_key = self._config["x_column"]
+        x_values = np.asarray(data[x_key])
         for sensor in self.points.keys():
-            self.points[sensor].set_data(data[x_key], data[sensor])
-        self._xlimits = (data[x_key][0], data[x_key][-1])
+            self.points[sensor].set_data(x_values, np.asarray(data[sensor]))
+        self._xlimits = (x_values[0], x_values[-1])
         self.set_xlim()
         self.fig.canvas.draw()
         plt.pause(0.025)
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Long, bounded-memory history for aves.io.DataBuffers.
+
+DataBuffers keeps the latest ``maxlen`` samples at full rate. A
+TieredHistory keeps what came before them at coarser and coarser
+resolutions: each tier splits the x column (usually the device time)
+into buckets of a fixed width, and keeps the last ``length`` of them.
+For example, tiers ``[(1, 3600), (60, 1440)]`` keep one bucket per
+second for the last hour and one per minute for the last day, in a few
+thousand values per column no matter how long the acquisition runs.
+
+Every bucket holds the number of samples it summarizes and, for each
+numeric column, their minimum, maximum and mean; text columns keep
+their first value. Buckets are maintained incrementally as batches are
+appended: a batch is grouped by bucket with numpy's ``reduceat``, the
+bucket still being filled is kept apart until a sample past it arrives,
+and every bucket a tier closes is fed to the next tier up in the same
+way, so appending costs about the same whatever the tiers hold.
+
+stitched() puts the pieces back together for plotting: the full-rate
+samples, preceded by the buckets of each tier that are older than what
+the finer tiers cover.
+"""
+
+import numpy as np
+
+from aves.ringbuffer import RingBuffer
+
+
+def parse_tiers(text):
+    """
+    Parses tiers written as in the command line, e.g. "1:3600,60:1440"
+    (one-second buckets for an hour, then one-minute buckets for a day),
+    into a list of (width, length) tuples, finest first.
+    """
+    tiers = []
+    for item in text.split(","):
+        try:
+            width, length = item.split(":")
+            tiers.append((float(width), int(length)))
+        except ValueError:
+            raise ValueError(
+                "History tiers must look like 'width:buckets,width:buckets' "
+                "(e.g. '1:3600,60:1440'), got {!r}".format(text)) from None
+    for (width, length), (next_width, _) in zip(tiers, tiers[1:] + [(float("inf"), 0)]):
+        if width <= 0 or length <= 0:
+            raise ValueError(
+                "History tier widths and bucket counts must be positive, got {!r}".format(text))
+        if next_width <= width:
+            raise ValueError(
+                "History tiers must go from finest to coarsest, got {!r}".format(text))
+    return tiers
+
+
+def _numeric(values):
+    return values.dtype.kind in "biuf"
+
+
+class _Tier(object):
+    "The buckets of one width."
+
+    def __init__(self, width, length):
+        self.width = width
+        self.length = length
+        self.count = RingBuffer(maxlen=length, dtype=np.float64)
+        self.low = {}
+        self.high = {}
+        self.total = {}
+        self.first = {}
+        # The bucket being filled, as a batch of one row (see add)
+        self._open = None
+
+    def __len__(self):
+        return len(self.count)
+
+    def _store(self, batch):
+        counts, totals, lows, highs, firsts = batch
+        self.count.extend(counts)
+        for name in lows:
+            if name not in self.low:
+                self.low[name] = RingBuffer(maxlen=self.length, dtype=np.float64)
+                self.high[name] = RingBuffer(maxlen=self.length, dtype=np.float64)
+                self.total[name] = RingBuffer(maxlen=self.length, dtype=np.float64)
+            self.low[name].extend(lows[name])
+            self.high[name].extend(highs[name])
+            self.total[name].extend(totals[name])
+        for name in firsts:
+            if name not in self.first:
+                self.first[name] = RingBuffer(maxlen=self.length, dtype=object)
+            self.first[name].extend(firsts[name])
+
+    def add(self, x_column, batch):
+        """
+        Adds a batch of rows, each summarizing one or more samples:
+        (counts, totals, lows, highs, firsts), where the last four map
+        column names to arrays. Returns the buckets this closes, as a
+        batch of the same kind (or None).
+        """
+        if self._open is not None:
+            batch = tuple(
+                np.concatenate((self._open[0], batch[0])) if i == 0 else
+                {name: np.concatenate((self._open[i][name], values))
+                 for name, values in batch[i].items()}
+                for i in range(5))
+        counts, totals, lows, highs, firsts = batch
+        keys = np.floor(lows[x_column] / self.width)
+        starts = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+        grouped = (
+            np.add.reduceat(counts, starts),
+            {name: np.add.reduceat(values, starts) for name, values in totals.items()},
+            {name: np.minimum.reduceat(values, starts) for name, values in lows.items()},
+            {name: np.maximum.reduceat(values, starts) for name, values in highs.items()},
+            {name: values[starts] for name, values in firsts.items()},
+        )
+        # The last bucket stays open until a row past it arrives
+        self._open = tuple(
+            part[-1:] if i == 0 else {name: values[-1:] for name, values in part.items()}
+            for i, part in enumerate(grouped))
+        if len(starts) == 1:
+            return None
+        closed = tuple(
+            part[:-1] if i == 0 else {name: values[:-1] for name, values in part.items()}
+            for i, part in enumerate(grouped))
+        self._store(closed)
+        return closed
+
+
+class TieredHistory(object):
+    """
+    Keeps summaries of samples at several resolutions (see the module
+    docstring).
+
+    Args:
+        x_column (str): Numeric column that buckets are made along,
+            increasing with time (usually the gui's x_column).
+        tiers (list): (width, length) tuples, finest first: buckets
+            ``width`` units of x_column wide, keeping the last ``length``
+            of them. See parse_tiers().
+        scale (float): Factor x_column is converted to its units with, if
+            it is stored raw (see aves.io's dtype): widths (and stitched()'s
+            span) are in the converted units all the same.
+    """
+
+    def __init__(self, x_column, tiers, scale=1.0):
+        self.x_column = x_column
+        self.scale = scale
+        self.tiers = [_Tier(width / scale, length) for width, length in tiers]
+
+    def extend(self, columns):
+        """
+        Adds a batch of samples, given as one sequence of values per
+        column, oldest first.
+        """
+        arrays = {name: np.asarray(values) for name, values in columns.items()}
+        if self.x_column not in arrays:
+            raise ValueError(
+                "The history is bucketed by {!r}, which the samples do not have".format(
+                    self.x_column))
+        if not _numeric(arrays[self.x_column]):
+            raise ValueError(
+                "The history can only be bucketed by a numeric column, "
+                "and {!r} is not".format(self.x_column))
+        numeric = {name: values.astype(np.float64)
+                   for name, values in arrays.items() if _numeric(values)}
+        batch = (
+            np.ones(len(arrays[self.x_column])),
+            numeric, numeric, numeric,
+            {name: values.astype(object)
+             for name, values in arrays.items() if not _numeric(values)},
+        )
+        for tier in self.tiers:
+            batch = tier.add(self.x_column, batch)
+            if batch is None:
+                break
+
+    @staticmethod
+    def _bucket_points(tier, mask, names, envelope):
+        "Two points (minimum, maximum) or one (mean) per selected bucket."
+        points = {}
+        for name in names:
+            if name in tier.low:
+                if envelope:
+                    low = tier.low[name].view()[mask]
+                    high = tier.high[name].view()[mask]
+                    points[name] = np.column_stack((low, high)).ravel()
+                else:
+                    points[name] = tier.total[name].view()[mask] / tier.count.view()[mask]
+            else:
+                first = tier.first[name].view()[mask]
+                points[name] = np.repeat(first, 2) if envelope else first
+        return points
+
+    def stitched(self, recent, span=None, envelope=True):
+        """
+        Returns ``recent`` (one array per column, as in
+        DataBuffers.last()) preceded by the buckets of every tier that
+        start before the finer data does, one array per column. Where a
+        coarser bucket overlaps finer data, the coarser bucket is kept
+        whole and the finer data it covers is left out, so that x_column
+        keeps increasing.
+
+        Args:
+            recent (dict): The full-rate samples.
+            span (float): Only keep the last ``span`` (converted) units of
+                x_column.
+            envelope (bool): Give each bucket as two points, its minimum
+                and its maximum, so that a line plot draws the envelope of
+                the signal without hiding its peaks; if False, as one
+                point, its mean.
+        """
+        x = self.x_column
+        names = list(recent)
+        tiers = [tier for tier in self.tiers if x in tier.low and len(tier)]
+        if not names and tiers:
+            names = list(tiers[0].low) + list(tiers[0].first)
+        if not names:
+            return {}
+        # From the finest data back: the buckets older than what is
+        # already covered...
+        boundary = recent[x][0] if x in recent and len(recent[x]) else np.inf
+        masks = []
+        for tier in tiers:
+            mask = tier.low[x].view() < boundary
+            if mask.any():
+                boundary = tier.low[x].view()[mask][0]
+            masks.append(mask)
+        # ...then from the coarsest forward, leaving out what an earlier
+        # (coarser) bucket already covers.
+        covered = -np.inf
+        pieces = []
+        for tier, mask in reversed(list(zip(tiers, masks))):
+            mask &= tier.low[x].view() > covered
+            if mask.any():
+                pieces.append(self._bucket_points(tier, mask, names, envelope))
+                covered = tier.high[x].view()[mask][-1]
+        if x in recent and np.isfinite(covered):
+            keep = recent[x] > covered
+            recent = {name: values[keep] for name, values in recent.items()}
+        pieces.append(recent)
+        output = {name: np.concatenate([piece[name] for piece in pieces if name in piece])
+                  for name in names}
+        if span is not None and len(output[x]):
+            keep = output[x] >= output[x][-1] - span / self.scale
+            output = {name: values[keep] for name, values in output.items()}
+        return output
@@ -29,17 +29,49 @@ implemented" is that if in the future we want a ReadSensorWifi we only
 need to implement the open/read/close methods and it will work directly.
 
 ReadSensorSerial implements those methods to read from a serial port.
-ReadSensorFile implements them to read from a conventional file.
+ReadSensorFile implements them to read from a conventional file. With
+``follow=True`` it behaves like ``tail -F``: instead of stopping at the end
+of the file it keeps polling for lines appended by whoever is still writing
+it (e.g. another aves process recording from the serial port), so several
+viewers can share a single acquisition.
 
 Long experiments and memory usage
 ----------------------------------
 
 To prevent the system from crashing on very long experiments, we will
 store the samples on disk on the fly and we will only keep the last N points
-in memory for plotting. To do that, we will use DataBuffers.
+in memory for plotting. To do that, we will use DataBuffers, which keeps
+each column in a numpy ring buffer (see aves.ringbuffer).
 
 This class is also used to control the number of points we want to plot in
 the online analysis (plots with too many points also consume more memory).
+To still see the hours before those N points, DataBuffers can also keep
+a tiered summary of them (see aves.history).
+
+N is a number of samples, so the time the plots span depends on the
+sample rate: 200 samples are 20 s at 10 Hz but 0.1 s at 2 kHz. A
+DataBuffers can instead keep a time window, e.g. the last 30 units of
+the gui's x_column (``--plot_win_seconds 30``): older samples are
+dropped as newer ones arrive, and the columns' storage is sized from the
+sample rate measured once the window first fills up. N then only caps
+how many samples the window may hold, and falling short of the window
+because of it, or having to grow the storage because the rate went up,
+is logged rather than silent.
+
+Compact columns
+---------------
+
+A column may declare the numpy ``dtype`` it is stored with, e.g. uint16
+for the readings of a 10-bit ADC, which take a quarter of the memory of
+float64 values. Arduino columns that declare one (in
+``input.arduino.columns``) are kept as the raw numbers the Arduino
+prints: their ``conversion_factor`` is not applied when reading, but
+recorded in the input's ``column_scales``, and only applied where values
+leave the buffers for the user (DataBuffers.snapshot(), read_since(),
+stitched()) or a recording (WriteSensorFile). Recordings are therefore
+unchanged, in the same units as always; ``output.dtypes`` maps recorded
+columns to the dtype they are written and read back with, so integer
+columns are written without decimals and replayed compactly.
 
 """
 
@@ -47,20 +79,55 @@ the online analysis (plots with too many points also consume more memory).
 
 import os
 import errno
+import contextlib
 import logging
+import time
 from collections import deque
 import datetime
-from collections import defaultdict
-from functools import partial
+import numpy as np
 import serial
 
+from aves.ringbuffer import RingBuffer
+from aves.summary import ChunkSummaryWriter
 from aves.utils import mkdir_p, require_keys
 
 logger = logging.getLogger(__name__)
 
+# Room DataBuffers with a time window leave for the rate to vary, on top
+# of what the window held when it was sized
+_RATE_HEADROOM = 1.25
+
 TIME_COMPUTER = "time_computer"
 
 
+def parse_dtype(value, where):
+    """
+    The numpy dtype a column declares (e.g. "uint16" or "float32"), which
+    must be numeric. where names the config entry, for error messages.
+    """
+    try:
+        dtype = np.dtype(value)
+    except TypeError:
+        dtype = None
+    if dtype is None or dtype.kind not in "iuf":
+        raise ValueError(
+            f"{where}: dtype must be a numeric numpy type such as 'uint16', "
+            f"'int32' or 'float32', got {value!r}")
+    return dtype
+
+
+def fits_dtype(value, dtype):
+    """
+    Whether value (a float) can be stored as the numpy dtype as is: an
+    integer within its range for integer dtypes, or within the range of
+    a float dtype.
+    """
+    if dtype.kind == "f":
+        return not np.isfinite(value) or abs(value) <= np.finfo(dtype).max
+    info = np.iinfo(dtype)
+    return value.is_integer() and info.min <= value <= info.max
+
+
 class ReadSensorAbstract(object):
     """ Abstract class to read a sensor sample.
 
@@ -70,6 +137,12 @@ class ReadSensorAbstract(object):
 
     def __init__(self):
         self._stop_sampling = False
+        #: numpy dtypes that columns declare to be stored with
+        self.column_dtypes = {}
+        #: Factors still to be applied to columns read as raw numbers
+        self.column_scales = {}
+        #: Bytes read from the input so far (see aves.metrics)
+        self.bytes_read = 0
 
     def __enter__(self, *args, **kwargs):
         self.open(*args, **kwargs)
@@ -120,31 +193,131 @@ class ReadSensorFile(ReadSensorAbstract):
 
     Args:
         filename (str): File where the experiment has been saved
+        follow (bool): Keep waiting for lines appended to the file instead
+            of stopping at its end (default: False). stop_sampling then
+            never becomes True on its own.
+        follow_timeout (float): In follow mode, how many seconds readsample
+            waits for a new complete line before returning None.
+        poll_interval (float): In follow mode, seconds between checks for
+            new data while waiting.
     """
 
-    def __init__(self, filename, config):
+    #: Seconds readsample() waits for a new line in follow mode. Kept short
+    #: so a GUI driving the reads from its refresh timer stays responsive.
+    DEFAULT_FOLLOW_TIMEOUT = 0.1
+    #: Seconds between polls for appended data in follow mode.
+    DEFAULT_POLL_INTERVAL = 0.01
+
+    def __init__(self, filename, config, follow=False,
+                 follow_timeout=DEFAULT_FOLLOW_TIMEOUT,
+                 poll_interval=DEFAULT_POLL_INTERVAL):
         super(ReadSensorFile, self).__init__()
         require_keys(config, ["columns"], "config.toml's 'output' section")
         self._filename = filename
         self._file = None
         self._file_columns = config["columns"]
+        self.column_dtypes = {
+            name: parse_dtype(dtype, f"config.toml's 'output.dtypes.{name}' entry")
+            for name, dtype in config.get("dtypes", {}).items()}
+        self._follow = follow
+        self._follow_timeout = follow_timeout
+        self._poll_interval = poll_interval
+        # In follow mode, the beginning of a line whose end the writer
+        # has not flushed yet, and complete lines drained from a rotated
+        # file that have not been returned yet:
+        self._partial = ''
+        self._pending = deque()
         return
 
     def open(self):
         if self._filename is not None:
             self._file = open(self._filename, 'r')
+            self._partial = ''
+            self._pending.clear()
 
     def close(self):
         self._file.close()
 
+    def seek(self, offset):
+        """
+        Continues reading from the given byte offset of the file, which
+        must be the start of a line (e.g. taken from an index of the file,
+        see aves.recordings.RecordingIndex).
+        """
+        self._file.seek(offset)
+        self._partial = ''
+        self._pending.clear()
+        self._stop_sampling = False
+
+    def _reopen_if_rotated(self):
+        """
+        Called in follow mode once the open file has no more data. Starts
+        over from the beginning if the file was truncated, or switches to
+        the new file if it was renamed away (rotated) and created again.
+        Returns True if there may be new data to read.
+        """
+        try:
+            on_disk = os.stat(self._filename)
+        except FileNotFoundError:
+            # Rotated away and not created again (yet)
+            return False
+        opened = os.fstat(self._file.fileno())
+        if (on_disk.st_ino, on_disk.st_dev) != (opened.st_ino, opened.st_dev):
+            logger.info("%s was rotated, reopening it", self._filename)
+            # Anything appended to the old file between our last read and
+            # the rename is still there, so it has to be drained first.
+            lines = (self._partial + self._file.read()).splitlines(keepends=True)
+            if lines and not lines[-1].endswith('\n'):
+                logger.warning("Discarding incomplete last line of rotated "
+                               "file: %r", lines.pop())
+            self._pending.extend(lines)
+            self._partial = ''
+            self._file.close()
+            self._file = open(self._filename, 'r')
+            return True
+        if on_disk.st_size < self._file.tell():
+            logger.info("%s was truncated, reading it from the start",
+                        self._filename)
+            self._file.seek(0)
+            self._partial = ''
+            return True
+        return False
+
+    def _readline(self):
+        """
+        Returns the next line, '' at the end of the file, or (in follow
+        mode only) None if no complete line arrived within follow_timeout.
+        """
+        if not self._follow:
+            return self._file.readline()
+        deadline = time.monotonic() + self._follow_timeout
+        while True:
+            if self._pending:
+                return self._pending.popleft()
+            chunk = self._file.readline()
+            if chunk:
+                self._partial += chunk
+                if self._partial.endswith('\n'):
+                    line, self._partial = self._partial, ''
+                    return line
+                # The writer is half way through this line: wait for the rest
+            elif self._reopen_if_rotated():
+                continue
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self._poll_interval)
+
     def readsample(self):
         sample = dict()
         line = ''
         while True:
-            line = self._file.readline()
+            line = self._readline()
+            if line is None:
+                return None
             if len(line) == 0:
                 self._stop_sampling = True
                 return None
+            self.bytes_read += len(line)
             if line.startswith('#') or line.strip() == '':
                 continue
             break
@@ -209,21 +382,42 @@ class ReadSensorSerial(ReadSensorAbstract):
         require_keys(
             arduino_config, ["columns", "baudrate", "timeout"],
             "config.toml's 'input.arduino' section")
-        # Fields:
+        # Fields, and the positions of those with a dtype:
         self._fields = []
+        self._typed_fields = []
         for i, column in enumerate(arduino_config["columns"]):
             require_keys(
                 column, ["name"],
                 f"config.toml's 'input.arduino.columns[{i}]' entry")
-            self._fields.append(
-                (column["name"], column.get("conversion_factor", 1.0)))
+            factor = column.get("conversion_factor", 1.0)
+            if "dtype" in column:
+                # Kept raw; the factor is applied later (see column_scales)
+                self.column_dtypes[column["name"]] = parse_dtype(
+                    column["dtype"], f"config.toml's 'input.arduino.columns[{i}]' entry")
+                if factor != 1.0:
+                    self.column_scales[column["name"]] = factor
+                factor = 1.0
+                self._typed_fields.append((i, column["name"]))
+            self._fields.append((column["name"], factor))
         self.port = port
         self._baudrate = arduino_config["baudrate"]
         self._timeout = arduino_config["timeout"]
         self._max_consecutive_garbage_lines = max_consecutive_garbage_lines
+        self._garbage_lines = 0
+        # Bytes of a line readsamples_nowait() has only received part of
+        self._partial = b""
         self._inputdata = None
         return
 
+    @property
+    def timeout(self):
+        "Seconds without data after which the Arduino is taken to be gone."
+        return self._timeout
+
+    def fileno(self):
+        "The serial port's file descriptor, e.g. for loop.add_reader()."
+        return self._inputdata.fileno()
+
     def open(self):
         self._inputdata = serial.Serial(self.port, baudrate=self._baudrate,
                                         timeout=self._timeout)
@@ -236,47 +430,94 @@ class ReadSensorSerial(ReadSensorAbstract):
         self._inputdata.close()
         self._stop_sampling = True
 
-    def readsample(self):
-        # This block prevents the program to abort when initial garbage is read
-        # in the serial port in Windows @soller
-        sample = dict()
-        try_again = True
-        garbage_lines = 0
-        while try_again:
-            try:
-                line = self._inputdata.readline()
-                try_again = False
-                if len(line) == 0:
-                    self._stop_sampling = True
-                    break
-                data_acq = [float(val) for val in line.split()]
-                if len(data_acq) != len(self._fields):
-                    logger.warning(
-                        "Received %d fields, expecting %d: %r",
-                        len(data_acq), len(self._fields), line)
-                    try_again = True
-            except (UnicodeDecodeError, ValueError):
-                logger.warning("Discarding garbage in serial port: %r", line)
-                try_again = True
-
-            if try_again:
-                garbage_lines += 1
-                if garbage_lines >= self._max_consecutive_garbage_lines:
-                    logger.error(
-                        "Giving up after %d consecutive unusable lines from "
-                        "the serial port; check the baud rate and wiring.",
-                        garbage_lines)
-                    self._stop_sampling = True
-                    break
-
-        if self._stop_sampling:
+    def _parse_line(self, line):
+        """
+        The sample in a line the Arduino printed, or None if the line is
+        unusable (garbage, the wrong number of fields, or a reading that
+        does not fit its column's dtype). Gives up, setting stop_sampling,
+        after too many unusable lines in a row.
+        """
+        # Discarding garbage prevents the program to abort when initial
+        # garbage is read in the serial port in Windows @soller
+        try:
+            data_acq = [float(val) for val in line.split()]
+        except (UnicodeDecodeError, ValueError):
+            logger.warning("Discarding garbage in serial port: %r", line)
+            data_acq = None
+        else:
+            if len(data_acq) != len(self._fields):
+                logger.warning(
+                    "Received %d fields, expecting %d: %r",
+                    len(data_acq), len(self._fields), line)
+                data_acq = None
+            else:
+                for i, field_name in self._typed_fields:
+                    dtype = self.column_dtypes[field_name]
+                    if not fits_dtype(data_acq[i], dtype):
+                        logger.warning(
+                            "Discarding a line whose %r (%r) does not fit "
+                            "its dtype %s: %r", field_name, data_acq[i], dtype, line)
+                        data_acq = None
+                        break
+        if data_acq is None:
+            self._garbage_lines += 1
+            if self._garbage_lines >= self._max_consecutive_garbage_lines:
+                logger.error(
+                    "Giving up after %d consecutive unusable lines from "
+                    "the serial port; check the baud rate and wiring.",
+                    self._garbage_lines)
+                self._stop_sampling = True
             return None
+        self._garbage_lines = 0
         # Convert units of acquired values and store in sample:
+        sample = dict()
         for i, (field_name, factor) in enumerate(self._fields):
             sample[field_name] = data_acq[i]*factor
         sample[TIME_COMPUTER] = datetime.datetime.now().isoformat()
         return sample
 
+    def readsample(self):
+        while True:
+            line = self._inputdata.readline()
+            if len(line) == 0:
+                # Timed out
+                self._stop_sampling = True
+                return None
+            self.bytes_read += len(line)
+            sample = self._parse_line(line)
+            if sample is not None or self._stop_sampling:
+                return sample
+
+    def readsamples_nowait(self):
+        """
+        The samples in whatever the serial port has received so far,
+        without waiting for more: every complete line is parsed, and a
+        partial last line is kept for the next call. Meant for callers
+        that wait for the port to be readable themselves (see
+        aves.acquisition.AsyncAcquisition); don't mix it with readsample().
+        """
+        waiting = self._inputdata.in_waiting
+        if waiting:
+            received = self._inputdata.read(waiting)
+            self.bytes_read += len(received)
+            self._partial += received
+        *lines, self._partial = self._partial.split(b"\n")
+        output = []
+        for line in lines:
+            sample = self._parse_line(line)
+            if sample is not None:
+                output.append(sample)
+            elif self._stop_sampling:
+                break
+        return output
+
+    def timed_out(self):
+        """
+        Tells the reader nothing arrived within its timeout: like
+        readsample() on a timeout, it stops sampling.
+        """
+        self._stop_sampling = True
+
     def readsamples(self, num_samples=10):
         output = []
         for _ in range(num_samples):
@@ -290,16 +531,38 @@ class ReadSensorSerial(ReadSensorAbstract):
 class WriteSensorFile(object):
     """
     Writes samples to a file
+
+    If the config has a ``summary_chunk_size``, per-chunk statistics of
+    every numeric column are also kept in a sidecar file while recording
+    (see aves.summary).
+
+    Columns listed in the config's ``dtypes`` are written as that dtype:
+    integer ones without decimals, float32 ones with no more digits than
+    float32 has.
     """
 
-    def __init__(self, filename, config):
+    def __init__(self, filename, config, scales=None):
         """
             filename (str): File name to dump the data to.
+            scales (dict): Factors to multiply columns by before writing
+                them, for columns read raw (see the input's column_scales).
         """
         require_keys(config, ["columns"], "config.toml's 'output' section")
         self.filename = filename
         self._file_columns = config["columns"]
+        self._scales = scales or {}
+        self._formats = {}
+        for name, dtype in config.get("dtypes", {}).items():
+            dtype = parse_dtype(dtype, f"config.toml's 'output.dtypes.{name}' entry")
+            if dtype.kind in "iu":
+                self._formats[name] = lambda value: str(int(round(value)))
+            elif dtype.itemsize < 8:
+                self._formats[name] = lambda value, dtype=dtype.type: str(dtype(value))
         self._filepointer = None
+        self._summary = None
+        if filename and config.get("summary_chunk_size"):
+            self._summary = ChunkSummaryWriter(
+                filename, self._file_columns, config["summary_chunk_size"])
         return
 
     def __enter__(self):
@@ -310,12 +573,15 @@ class WriteSensorFile(object):
             self._filepointer.write("# %s\n" % datetime.datetime.now())
             self._filepointer.write("#" + "\t".join(self._file_columns) + "\n")
             self._filepointer.flush()
+            if self._summary is not None:
+                self._summary.open()
         return self
 
     def _write_sample(self, sample):
         """ Writes a sample to a file (columns given by file_columns)
         """
-        line = "\t".join([str(sample[item]) for item in self._file_columns])
+        line = "\t".join([
+            self._formats.get(item, str)(sample[item]) for item in self._file_columns])
         self._filepointer.write(line + "\n")
         self._filepointer.flush()
 
@@ -323,58 +589,399 @@ class WriteSensorFile(object):
         if self._filepointer is not None:
             self._filepointer.flush()
             self._filepointer.close()
+        if self._summary is not None:
+            self._summary.close()
         if typ is None:
             return True
         else:
             return False
 
+    def _scaled(self, sample):
+        sample = dict(sample)
+        for name, factor in self._scales.items():
+            if name in sample:
+                sample[name] = sample[name] * factor
+        return sample
+
+    def comment(self, text):
+        "Writes a comment line (``# text``), which readers skip."
+        if self._filepointer is not None:
+            self._filepointer.write("# " + text + "\n")
+            self._filepointer.flush()
+
     def write(self, samples):
         if self.filename is not None:
+            if self._scales:
+                samples = [self._scaled(sample) for sample in samples]
             for sample in samples:
                 self._write_sample(sample)
+            if self._summary is not None:
+                self._summary.add(samples)
         return
 
 
+class _Columns(dict):
+    "A dict creating missing columns with new_column(name)."
+
+    def __init__(self, new_column):
+        super().__init__()
+        self._new_column = new_column
+
+    def __missing__(self, name):
+        column = self[name] = self._new_column(name)
+        return column
+
+
 class DataBuffers(object):
     """
     Stores the acquired data of all the sensors. It can be used to store
     only the last ``maxlen`` points, so memory is limited in long experiments.
 
+    ``data`` maps each column name to a aves.ringbuffer.RingBuffer: a
+    preallocated numpy array that a batch of samples is appended to in one
+    go, and whose view() hands out the column in order without copying it.
+    Samples are kept in chronological order (oldest first), as append()
+    and extend() add them.
+
+    Every sample appended advances ``seq`` by one, so a consumer that
+    remembers the ``seq`` it last saw can ask for what is new since() then
+    instead of taking the whole window again with last(); read_since()
+    also tells it when it fell too far behind for that and has to start
+    over from the whole window.
+
+    The window can be resized at any time with set_maxlen(): shrinking it,
+    or growing it back up to the columns' capacity, takes constant time
+    and copies nothing (see aves.ringbuffer).
+
+    Given an aves.history.TieredHistory, every sample appended is also
+    summarized into it, and stitched() returns the full-rate window
+    preceded by that coarser, longer history: hours or days of data at a
+    fixed memory cost.
+
+    Concurrency: one thread (the writer, e.g. the acquisition thread) may
+    append to and resize the buffers while any number of other threads
+    read them. Writers never wait for readers. Each write is bracketed by
+    two increments of ``version``, which is therefore odd while a write is
+    in progress -- a seqlock. snapshot() and read_since() copy what they
+    return and start over if ``version`` changed while they copied, so
+    they always see the buffers between two writes, from any thread.
+    last(), since() and stitched() skip the copies and the checks, so
+    they are only safe to use from the writer's own thread (or with no
+    writer running).
+
+    Columns can be stored with a compact dtype (e.g. uint16 raw ADC
+    counts) and a scale (their conversion_factor) that is only applied on
+    the way out: snapshot(), read_since() and stitched() return scaled
+    float values, while last() and since() return the stored values as
+    they are (see "Compact columns" above).
+
+    With a ``time_window``, the buffers keep the samples whose
+    ``time_column`` is within time_window of the newest one, and maxlen
+    only caps their number (see "Long experiments and memory usage"
+    above). time_column must increase from one sample to the next.
+
     Args:
         maxlen (int): Keep only the latest maxlen points (default: None)
+        capacity (int): Points to make room for in each column, if more
+            than maxlen, so the window can later grow up to it for free.
+        history (aves.history.TieredHistory): Where to also keep a
+            summary of older samples (default: None)
+        dtypes (dict): numpy dtype to store each column with, if not
+            float64 (or object, for text).
+        scales (dict): Factor to multiply each column by when it is read.
+        time_window (float): Keep only the samples within this many
+            (scaled) units of time_column of the newest one.
+        time_column (str): The column time_window is measured along,
+            usually the gui's x_column.
     """
 
-    def __init__(self, maxlen=None):
-        self.data = defaultdict(partial(deque, maxlen=maxlen))
+    def __init__(self, maxlen=None, capacity=None, history=None, dtypes=None, scales=None,
+                 time_window=None, time_column=None):
+        if time_window is not None and time_column is None:
+            raise ValueError("A time_window needs the time_column it is measured along")
         self.maxlen = maxlen
+        self.capacity = capacity
+        self.history = history
+        self.dtypes = dict(dtypes or {})
+        self.scales = dict(scales or {})
+        self.time_window = time_window
+        self.time_column = time_column
+        # Storage capacity chosen from the measured rate (None: not yet),
+        # and the largest batch appended, which it must leave room for
+        self._sized_capacity = None
+        self._largest_batch = 0
+        self._warned_short = False
+        self.data = _Columns(self._new_column)
+        #: How many samples have been appended (with append or extend) so far
+        self.seq = 0
+        #: Bumped before and after every write: odd while one is under way
+        self.version = 0
+
+    @contextlib.contextmanager
+    def _writing(self):
+        self.version += 1
+        try:
+            yield
+        finally:
+            self.version += 1
+
+    def _read_consistent(self, read):
+        """
+        Returns read(), retrying until it ran entirely between two writes.
+        read() must copy what it returns out of the buffers.
+        """
+        while True:
+            version = self.version
+            if version % 2 == 0:
+                try:
+                    result = read()
+                except Exception:
+                    # A write may have left the columns half updated for a
+                    # moment (e.g. in the middle of reallocating one)
+                    if self.version == version:
+                        raise
+                else:
+                    if self.version == version:
+                        return result
+            # Let the writer finish
+            time.sleep(0)
+
+    def _new_column(self, name):
+        if self.time_window is not None:
+            # Sized by _evict() instead, from the measured rate
+            return RingBuffer(capacity=self._sized_capacity, dtype=self.dtypes.get(name))
+        return RingBuffer(maxlen=self.maxlen, capacity=self.capacity,
+                          dtype=self.dtypes.get(name))
+
+    @property
+    def rate(self):
+        """
+        Samples per (scaled) unit of time_column, measured over the
+        buffered samples, or None if they don't span any time yet.
+        """
+        if self.time_column not in self.data or len(self.data[self.time_column]) < 2:
+            return None
+        x = self.data[self.time_column].view()
+        span = float(x[-1] - x[0]) * self.scales.get(self.time_column, 1.0)
+        return (len(x) - 1) / span if span > 0 else None
+
+    def _evict(self, batch_size):
+        """
+        With a time_window, drops the samples that fell out of it (or
+        beyond maxlen), and sizes the columns' storage from the measured
+        rate the first time the window is full. Runs within _writing().
+        """
+        if self.time_window is None or self.time_column not in self.data:
+            return
+        self._largest_batch = max(self._largest_batch, batch_size)
+        x = self.data[self.time_column].view()
+        if not len(x):
+            return
+        window = self.time_window / self.scales.get(self.time_column, 1.0)
+        drop = int(np.searchsorted(x, x[-1] - window, side="left"))
+        if self.maxlen is not None and len(x) - drop > self.maxlen:
+            drop = len(x) - self.maxlen
+            if not self._warned_short:
+                self._warned_short = True
+                logger.warning(
+                    "At %.4g samples per unit of %s, the last %d samples only cover "
+                    "%.4g of the %.4g plot window: raise the sample limit to see "
+                    "all of it", self.rate or float("nan"), self.time_column,
+                    self.maxlen, self.maxlen / (self.rate or float("inf")),
+                    self.time_window)
+        if not drop:
+            return
+        for values in self.data.values():
+            values.drop(drop)
+        capacity = self.data[self.time_column].capacity
+        if self._sized_capacity is None:
+            # The window just filled up: room for what it holds at this
+            # rate, with some slack, and the largest batch on top
+            for values in self.data.values():
+                values.set_capacity(int(len(self) * _RATE_HEADROOM) + self._largest_batch)
+            # (storage that was given to the columns keeps its size)
+            self._sized_capacity = self.data[self.time_column].capacity
+        elif capacity > self._sized_capacity:
+            self._sized_capacity = capacity
+            logger.warning(
+                "The sample rate went up to %.4g per unit of %s: the plot window "
+                "now has room for %d samples per column", self.rate or float("nan"),
+                self.time_column, capacity)
+
+    def set_time_window(self, time_window):
+        """
+        Sets a new time window (see the class docstring), keeping the
+        most recent samples. Its storage is sized again from the rate
+        once the new window fills up.
+        """
+        if self.time_window is None:
+            raise ValueError("These buffers keep a number of samples, not a time window")
+        with self._writing():
+            self.time_window = time_window
+            self._sized_capacity = None
+            self._warned_short = False
+            self._evict(0)
+
+    def scaled(self, data):
+        """
+        data (one array per column, as from last()) with each column
+        multiplied by its scale, if it has one.
+        """
+        if not self.scales:
+            return data
+        return {name: values * self.scales[name] if name in self.scales else values
+                for name, values in data.items()}
+
+    def close(self):
+        "Releases what the buffers hold outside this process (if anything)."
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, value, traceback):
+        self.close()
+        return False
 
     def set_maxlen(self, maxlen=None):
         """
-        Sets a new buffer size. Requires copying the buffers.
+        Sets a new buffer size, keeping the most recent samples. Only
+        growing beyond the capacity reallocates (and copies) the columns.
         """
-        data = defaultdict(partial(deque, maxlen=maxlen))
-        for (name, values) in self.data.items():
-            if maxlen is None:
-                data[name] = deque(values)
-            else:
-                values = list(values)[-maxlen:]
-                data[name] = deque(values, maxlen=maxlen)
-        self.data = data
-        self.maxlen = maxlen
+        with self._writing():
+            self.maxlen = maxlen
+            if self.time_window is not None:
+                # maxlen only caps the time window
+                self._warned_short = False
+                self._evict(0)
+                return
+            for values in self.data.values():
+                values.set_maxlen(maxlen)
         return
 
+    def compact(self):
+        """
+        Releases the storage the columns have beyond what the current
+        window needs (e.g. room reserved to grow it later), to free memory.
+        """
+        with self._writing():
+            for values in self.data.values():
+                values.set_capacity(self.maxlen if self.time_window is None and self.maxlen
+                                    else len(values))
+            if self.time_window is not None:
+                self._sized_capacity = None
+
+    def __len__(self):
+        "How many samples are buffered"
+        return max((len(values) for values in self.data.values()), default=0)
+
+    def last(self, num_samples=None):
+        """
+        The latest num_samples buffered samples (all of them if None), as
+        one read-only numpy view per column, oldest first. Views share
+        memory with the buffers: copy them if they have to outlive the
+        next append.
+        """
+        if num_samples is None:
+            return {name: values.view() for name, values in self.data.items()}
+        start = max(len(self) - num_samples, 0)
+        return {name: values.view()[start:] for name, values in self.data.items()}
+
+    def since(self, seq):
+        """
+        The samples appended after the one numbered ``seq`` (as in a
+        previous value of self.seq), as in last(). Samples already dropped
+        from the buffers (beyond maxlen) are not included.
+        """
+        return self.last(max(self.seq - seq, 0))
+
+    def snapshot(self, num_samples=None):
+        """
+        Like last(), but copies of the columns rather than views, taken
+        consistently: safe to call from any thread while another one
+        appends.
+        """
+        return self._read_consistent(
+            lambda: self.scaled(
+                {name: values.copy() for name, values in self.last(num_samples).items()}))
+
+    def read_since(self, seq):
+        """
+        What a consumer that last saw ``seq`` (a previous value of
+        self.seq, or None if it has seen nothing yet) has missed. Safe to
+        call from any thread, like snapshot().
+
+        Returns:
+            tuple: (data, seq, resync). data is as in snapshot(): the
+            samples appended after ``seq`` or, if resync is True, the
+            whole window, which then replaces whatever the consumer had.
+            That happens when ``seq`` is None or the consumer fell so far
+            behind that some of what it missed was already dropped from
+            the buffers. seq is the value to pass next time.
+        """
+        def read():
+            missed = None if seq is None else self.seq - seq
+            resync = missed is None or missed < 0 or missed > len(self)
+            data = self.last() if resync else self.last(missed)
+            data = self.scaled({name: values.copy() for name, values in data.items()})
+            return data, self.seq, resync
+        return self._read_consistent(read)
+
+    def stitched(self, span=None):
+        """
+        Like last(), but scaled and preceded by the history's coarser
+        buckets of the samples already dropped from the window, if there
+        is a history (see aves.history.TieredHistory.stitched). ``span``
+        keeps only the latest span units of the history's x column.
+        """
+        if self.history is None:
+            return self.scaled(self.last())
+        return self.scaled(self.history.stitched(self.last(), span=span))
+
     def appendleft(self, sample):
-        for sensor, value in sample.items():
-            self.data[sensor].appendleft(value)
+        with self._writing():
+            for sensor, value in sample.items():
+                self.data[sensor].appendleft(value)
 
     def append(self, sample):
-        for sensor, value in sample.items():
-            self.data[sensor].append(value)
+        with self._writing():
+            for sensor, value in sample.items():
+                self.data[sensor].append(value)
+            if self.history is not None:
+                self.history.extend({sensor: [value] for sensor, value in sample.items()})
+            self.seq += 1
+            self._evict(1)
+
+    @staticmethod
+    def _columns(samples):
+        "Transposes a batch of samples into one list of values per column."
+        return {name: [sample[name] for sample in samples] for name in samples[0]}
 
     def extend(self, samples):
-        for sample in samples:
-            self.append(sample)
+        if not samples:
+            return
+        self.extend_columns(self._columns(samples))
+
+    def extend_columns(self, columns):
+        """
+        Like extend(), for a batch given as one sequence of values per
+        column (numpy arrays being the cheapest), all of the same length.
+        """
+        length = len(next(iter(columns.values()), ()))
+        if not length:
+            return
+        with self._writing():
+            for sensor, values in columns.items():
+                self.data[sensor].extend(values)
+            if self.history is not None:
+                self.history.extend(columns)
+            self.seq += length
+            self._evict(length)
 
     def extendleft(self, samples):
-        for sample in samples:
-            self.appendleft(sample)
+        if not samples:
+            return
+        columns = self._columns(samples)
+        with self._writing():
+            for sensor, values in columns.items():
+                self.data[sensor].extendleft(values)
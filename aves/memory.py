@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Where an aves process' memory goes, and a budget to keep it within.
+
+report() lists the bytes held by each column of a DataBuffers (and its
+tiered history, see aves.history) and by the queue of every browser
+connected to aves.web (see aves.web.broadcaster), the places that grow
+with the sample rate, the plot window and slow clients. Recordings are
+written synchronously (see aves.io.WriteSensorFile), so there is no
+writer queue to account for. The report is what ``--memory-report``
+prints when aves.realtime exits and what aves.web serves at
+GET /api/memory.
+
+Sizes are estimates: numeric columns are exactly their numpy storage,
+but text columns and queued messages are Python objects, sized from a
+sample of their items (see approximate_size()).
+
+A MemoryBudget (``--memory-budget 256M``) checks the total against a
+limit as acquisition goes and, once it is exceeded, frees memory
+following its policy, a list of actions tried in turn until the total
+is within the limit again:
+
+ - "clients": disconnects the browser with the largest queue, i.e. the
+   one furthest behind (it can reconnect, and then starts from a fresh
+   snapshot). Browsers with nothing queued are left alone.
+ - "buffers": halves the plot window (in samples, or seconds with
+   ``--plot_win_seconds``) and releases the storage it no longer needs.
+
+Every action taken is logged.
+"""
+
+import logging
+import sys
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+#: Actions a MemoryBudget policy may list, see the module docstring.
+POLICY_ACTIONS = ("clients", "buffers")
+_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_size(text):
+    """
+    Parses a size in bytes, with an optional K, M or G suffix (powers of
+    1024), e.g. "512M".
+    """
+    text = text.strip().upper().removesuffix("B")
+    unit = text[-1:] if text[-1:] in _UNITS else ""
+    try:
+        size = float(text[:len(text) - len(unit)]) * _UNITS[unit]
+    except ValueError:
+        raise ValueError(
+            "Memory sizes must look like 1024, 64K, 512M or 2G, got {!r}".format(text)) from None
+    if size <= 0:
+        raise ValueError("Memory sizes must be positive, got {!r}".format(text))
+    return int(size)
+
+
+def parse_policy(text):
+    "Parses a comma-separated policy, e.g. 'clients,buffers'."
+    policy = [action.strip() for action in text.split(",") if action.strip()]
+    for action in policy:
+        if action not in POLICY_ACTIONS:
+            raise ValueError(
+                "Unknown memory policy action {!r}: choose among {}".format(
+                    action, ", ".join(POLICY_ACTIONS)))
+    return policy
+
+
+def approximate_size(obj):
+    """
+    Bytes held by obj and what it references. numpy arrays count their
+    data; lists and tuples are assumed to hold items like their first
+    one, so a long list of numbers is sized without visiting every item.
+    """
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == object and len(obj):
+            return obj.nbytes + len(obj) * approximate_size(obj.flat[0])
+        return obj.nbytes
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(
+            approximate_size(key) + approximate_size(value) for key, value in obj.items())
+    if isinstance(obj, (list, tuple)):
+        size = sys.getsizeof(obj)
+        if obj:
+            size += len(obj) * approximate_size(obj[0])
+        return size
+    return sys.getsizeof(obj)
+
+
+def _ring_size(ring):
+    "Bytes of an aves.ringbuffer.RingBuffer's storage, and of the objects in it."
+    size = ring.nbytes
+    if ring.dtype == object and len(ring):
+        size += len(ring) * approximate_size(ring[-1])
+    return size
+
+
+def buffers_usage(buffers):
+    """
+    Bytes held by each column of a DataBuffers and by its history:
+    {"columns": {name: bytes}, "history": bytes, "total": bytes}.
+    """
+    columns = {name: _ring_size(ring) for name, ring in list(buffers.data.items())}
+    history = 0
+    if buffers.history is not None:
+        for tier in buffers.history.tiers:
+            rings = [tier.count]
+            for part in (tier.low, tier.high, tier.total, tier.first):
+                rings.extend(part.values())
+            history += sum(_ring_size(ring) for ring in rings)
+    return {"columns": columns, "history": history,
+            "total": sum(columns.values()) + history}
+
+
+def report(buffers=None, broadcaster=None):
+    """
+    Everything report-worthy about memory, as a JSON-able dict:
+
+        {"buffers": {"columns": {...}, "history": ..., "total": ...},
+         "clients": [{"client": id, "messages": n, "bytes": n}, ...],
+         "total": bytes}
+    """
+    usage = buffers_usage(buffers) if buffers is not None else {
+        "columns": {}, "history": 0, "total": 0}
+    clients = broadcaster.memory_usage() if broadcaster is not None else []
+    return {
+        "buffers": usage,
+        "clients": clients,
+        "total": usage["total"] + sum(client["bytes"] for client in clients),
+    }
+
+
+def format_report(memory):
+    "report()'s result as text, one line per column and client."
+    lines = ["Memory used: {:.1f} MiB".format(memory["total"] / 1024 ** 2)]
+    for name, size in memory["buffers"]["columns"].items():
+        lines.append("  column {!r}: {:.1f} KiB".format(name, size / 1024))
+    if memory["buffers"]["history"]:
+        lines.append("  history: {:.1f} KiB".format(memory["buffers"]["history"] / 1024))
+    for client in memory["clients"]:
+        lines.append("  client {}: {} queued messages, {:.1f} KiB".format(
+            client["client"], client["messages"], client["bytes"] / 1024))
+    return "\n".join(lines)
+
+
+class MemoryBudget(object):
+    """
+    Keeps the memory report() counts within ``limit`` bytes (see the
+    module docstring). check() is meant to be called from the thread
+    that appends to the buffers, e.g. after every acquisition step.
+
+    Args:
+        limit (int): Bytes the total may reach.
+        policy (list): Actions to free memory with, in order (see
+            POLICY_ACTIONS).
+        broadcaster: The aves.web.broadcaster.Broadcaster whose clients
+            count too, if any.
+        interval (float): Seconds between checks, as working out the
+            total is not free.
+        on_shrink (callable): Called with the buffers' new maxlen
+            whenever the "buffers" action shrinks the plot window, e.g. to
+            report the window it now keeps.
+    """
+
+    def __init__(self, limit, policy=POLICY_ACTIONS, broadcaster=None, interval=1.0,
+                 on_shrink=None):
+        self.limit = limit
+        self.policy = list(policy)
+        self.broadcaster = broadcaster
+        self.interval = interval
+        self.on_shrink = on_shrink
+        self._last_check = None
+        self._warned = False
+
+    def check(self, buffers):
+        """
+        Frees memory if the total is over the limit. Returns the total as
+        it was before freeing anything (None if it was not checked this
+        time, being too soon after the last check).
+        """
+        now = time.monotonic()
+        if self._last_check is not None and now - self._last_check < self.interval:
+            return None
+        self._last_check = now
+        total = report(buffers, self.broadcaster)["total"]
+        current = total
+        for action in self.policy:
+            while current > self.limit and getattr(self, "_free_" + action)(buffers):
+                current = report(buffers, self.broadcaster)["total"]
+        if current > self.limit and not self._warned:
+            logger.warning(
+                "Memory use is %d bytes, over the %d byte budget, and the memory "
+                "policy has nothing left to free", current, self.limit)
+        self._warned = current > self.limit
+        return total
+
+    def _free_clients(self, buffers):
+        """
+        Drops the client furthest behind. Returns whether there was one
+        with anything queued: dropping an idle one frees nothing.
+        """
+        if self.broadcaster is None:
+            return False
+        clients = [client for client in self.broadcaster.memory_usage() if client["bytes"]]
+        if not clients:
+            return False
+        largest = max(clients, key=lambda client: client["bytes"])
+        logger.warning(
+            "Over the memory budget: disconnecting client %s, %d messages (%d bytes) behind",
+            largest["client"], largest["messages"], largest["bytes"])
+        self.broadcaster.drop(largest["client"])
+        return True
+
+    def _free_buffers(self, buffers):
+        "Halves the plot window. Returns whether it could be halved."
+        if buffers.time_window is not None:
+            logger.warning(
+                "Over the memory budget: shrinking the plot window to %.4g",
+                buffers.time_window / 2)
+            buffers.set_time_window(buffers.time_window / 2)
+        else:
+            current = buffers.maxlen if buffers.maxlen is not None else len(buffers)
+            if current <= 1:
+                return False
+            logger.warning(
+                "Over the memory budget: shrinking the plot window to %d samples",
+                current // 2)
+            buffers.set_maxlen(current // 2)
+        if self.on_shrink is not None:
+            self.on_shrink(buffers.maxlen)
+        before = buffers_usage(buffers)["total"]
+        buffers.compact()
+        return buffers_usage(buffers)["total"] < before
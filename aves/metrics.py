@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Where the time of the acquisition loop goes, cheaply enough to always
+keep track of it.
+
+Every aves.acquisition.Acquisition has a Metrics (``acquisition.metrics``)
+that it records the duration of each part of a step into:
+
+ - "read": waiting for and parsing a batch from the input device.
+ - "transform": the config's transforms (see aves.transforms), and
+   "transform:<type>" each of their stages.
+ - "alarms": checking the config's alarms (see aves.alarms), whose
+   firings it also counts.
+ - "write": recording the batch to disk.
+ - "buffer": appending it to the plotted buffers.
+
+and that the front ends add their own parts to: "render" (drawing the
+plots, aves.realtime) and "publish" (sending new samples to browsers,
+aves.web). It also counts the "samples" read and the "bytes" the input
+device read them from, and so their rates.
+
+A duration goes into a Histogram of power-of-two buckets of
+nanoseconds: recording one is an int.bit_length() and a few additions,
+well under a microsecond, while the buckets still tell the typical time
+from the occasional slow one (quantile()).
+
+    start = time.perf_counter_ns()
+    ...
+    metrics.record("read", time.perf_counter_ns() - start)
+
+snapshot() returns everything recorded so far as a JSON-able dict (what
+aves.web serves at GET /api/metrics), and format() as text (what
+aves.realtime prints on exit with ``--metrics``).
+
+Each name should only be recorded from one thread: the buckets are not
+locked.
+"""
+
+import contextlib
+import time
+
+#: Buckets of a Histogram: bucket i counts values of bit length i, i.e.
+#: within [2**(i - 1), 2**i), so 64 of them cover any duration.
+BUCKETS = 64
+
+
+class Histogram(object):
+    "Counts of values (nanoseconds) in power-of-two buckets, see above."
+
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        self.buckets = [0] * (BUCKETS + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value):
+        self.buckets[min(value.bit_length(), BUCKETS)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, fraction):
+        """
+        A value at least as large as that fraction of the values (e.g.
+        0.99): the upper end of the bucket it falls in, at most max.
+        """
+        if not self.count:
+            return 0
+        rank = fraction * self.count
+        seen = 0
+        for length, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min(2 ** length - 1, self.max)
+        return self.max
+
+
+class Metrics(object):
+    "Durations and counters of an acquisition, see the module docstring."
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self._start = time.perf_counter_ns()
+
+    def record(self, name, nanoseconds):
+        "Adds a duration, in nanoseconds, to the histogram of name."
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.record(nanoseconds)
+
+    def add(self, name, amount=1):
+        "Adds amount to the counter of name."
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        "Records how long the with block takes. Handy, if not the cheapest."
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter_ns() - start)
+
+    def snapshot(self):
+        """
+        Everything recorded so far, as a JSON-able dict:
+
+            {"seconds": since the metrics were created,
+             "stages": {name: {"count", "seconds", "mean_us", "p50_us",
+                               "p99_us", "max_us"}},
+             "counters": {name: {"total", "per_second"}}}
+        """
+        seconds = (time.perf_counter_ns() - self._start) / 1e9
+        stages = {}
+        for name, histogram in list(self.histograms.items()):
+            count = histogram.count
+            stages[name] = {
+                "count": count,
+                "seconds": histogram.total / 1e9,
+                "mean_us": histogram.total / count / 1e3 if count else 0.0,
+                "p50_us": histogram.quantile(0.5) / 1e3,
+                "p99_us": histogram.quantile(0.99) / 1e3,
+                "max_us": histogram.max / 1e3,
+            }
+        counters = {name: {"total": total, "per_second": total / seconds if seconds else 0.0}
+                    for name, total in list(self.counters.items())}
+        return {"seconds": seconds, "stages": stages, "counters": counters}
+
+    def format(self):
+        "snapshot() as text, one line per stage and counter."
+        snapshot = self.snapshot()
+        lines = ["Acquisition metrics over {:.1f} s:".format(snapshot["seconds"])]
+        for name, stage in snapshot["stages"].items():
+            lines.append(
+                "  {}: {} times, {:.3f} s in total, mean {:.1f} us, p50 < {:.1f} us, "
+                "p99 < {:.1f} us, max {:.1f} us".format(
+                    name, stage["count"], stage["seconds"], stage["mean_us"],
+                    stage["p50_us"], stage["p99_us"], stage["max_us"]))
+        for name, counter in snapshot["counters"].items():
+            lines.append("  {}: {} ({:.1f}/s)".format(
+                name, counter["total"], counter["per_second"]))
+        return "\n".join(lines)
@@ -16,18 +16,25 @@ It does two things:
        file, buffers them, and (if there is a GUI) renders them, until
        the experiment duration is reached, the input runs out, or the
        user closes the window.
+
+With --gui-process, the GUI runs in a process of its own instead (see
+aves.viewer), so that acquisition never waits for it.
 """
 
 import os
 import datetime
 import argparse
 import contextlib
+import time
 
 from aves import gui
-from aves import io
-from aves.acquisition import Acquisition
+from aves.acquisition import Acquisition, AdaptiveBatching
+from aves.memory import MemoryBudget, format_report, parse_policy, parse_size, report
 from aves.utils import parse_config
-from aves.wiring import build_input_device, build_output_device
+from aves.viewer import ViewerProcess
+from aves.wiring import (
+    build_alarms, build_buffers, build_gap_detector, build_input_device,
+    build_output_device, build_transforms)
 
 
 def _parse_arguments():
@@ -43,6 +50,11 @@ def _parse_arguments():
                              "Windows, /dev/ttyUSB0 or /dev/ttyACM0 on "
                              "Linux, /dev/cu.usbmodemXXXX on macOS), or a "
                              "path to a previously recorded file to replay")
+    parser.add_argument('--follow', dest='follow', action="store_true",
+                        help="when --port is a recorded file, keep reading "
+                             "lines appended to it (e.g. by another aves "
+                             "process still recording it) instead of "
+                             "stopping at its end")
     parser.add_argument('--no-save', dest='save', action="store_false",
                         help="skip saving acquired data to a file")
     parser.add_argument('--time', dest='tmeas', default=float('inf'),
@@ -54,10 +66,72 @@ def _parse_arguments():
     parser.add_argument('--plot_every_n_samples', dest='plot_every_n_samples',
                         type=int, default=10,
                         help="samples to collect before plotting (default:10)")
+    parser.add_argument('--target-latency', dest='target_latency', default=None,
+                        type=float,
+                        help="instead of a fixed --plot_every_n_samples, "
+                             "size batches to the measured sample rate so "
+                             "that a batch is plotted about every this many "
+                             "seconds (e.g. 0.1)")
+    parser.add_argument('--min-batch', dest='min_batch', default=1, type=int,
+                        help="with --target-latency, the fewest samples a "
+                             "batch waits for (default: 1)")
+    parser.add_argument('--max-batch', dest='max_batch', default=1000, type=int,
+                        help="with --target-latency, the most samples a "
+                             "batch may have (default: 1000)")
+    parser.add_argument('--batch-deadline', dest='batch_deadline', default=None,
+                        type=float,
+                        help="with --target-latency, the longest a batch "
+                             "waits for --min-batch samples, in seconds "
+                             "(default: four times the target latency)")
     parser.add_argument('--plot_win_size', dest='plot_win_size',
-                        type=int, default=200,
+                        type=int, default=None,
                         help="keeps in the plot the given number of samples " +
-                             "(default:200 samples, use 0 for unlimited)""")
+                             "(default:200 samples, use 0 for unlimited; " +
+                             "no cap with --plot_win_seconds); " +
+                             "press + or - on the plot to double or halve it")
+    parser.add_argument('--plot_win_seconds', dest='plot_win_seconds',
+                        type=float, default=None,
+                        help="keeps the samples within the given number of "
+                             "units of the gui's x_column (usually seconds) "
+                             "of the newest one instead, whatever the sample "
+                             "rate; --plot_win_size then caps how many "
+                             "samples that may be (default: no cap)")
+    parser.add_argument('--history_tiers', dest='history_tiers', default=None,
+                        help="besides the last --plot_win_size samples, plot "
+                             "a coarser history of the older ones, as "
+                             "width:buckets pairs of the gui's x_column, "
+                             "finest first (e.g. 1:3600,60:1440 keeps one "
+                             "point per second for an hour and one per "
+                             "minute for a day; default: no history)")
+    parser.add_argument('--shm-name', dest='shm_name', default=None,
+                        help="also share the buffered samples with other "
+                             "processes through shared memory under this "
+                             "name (see aves.sharedbuffers; needs a "
+                             "--plot_win_size other than 0)")
+    parser.add_argument('--gui-process', dest='gui_process', action="store_true",
+                        help="plot from a separate process, reading the "
+                             "samples through shared memory, so that "
+                             "redrawing, resizing or dragging the window "
+                             "never holds up acquisition (needs a "
+                             "--plot_win_size other than 0)")
+    parser.add_argument('--memory-budget', dest='memory_budget', default=None,
+                        type=parse_size,
+                        help="keep the memory used by the plotted samples "
+                             "under this size (e.g. 256M), freeing some as "
+                             "--memory-policy says once it is exceeded "
+                             "(default: no limit)")
+    parser.add_argument('--memory-policy', dest='memory_policy',
+                        default='buffers', type=parse_policy,
+                        help="how to free memory beyond --memory-budget: "
+                             "'buffers' halves the plot window (default)")
+    parser.add_argument('--memory-report', dest='memory_report', action="store_true",
+                        help="print how much memory each buffered column "
+                             "used when acquisition ends")
+    parser.add_argument('--metrics', dest='metrics', action="store_true",
+                        help="print how long reading, transforming, "
+                             "writing, buffering and plotting took, and "
+                             "the samples and bytes read per second, when "
+                             "acquisition ends")
     parser.add_argument('--config', dest='config_file', default='config.toml',
                         help="Arduino output columns, GUI layout and file format")
 
@@ -65,8 +139,13 @@ def _parse_arguments():
     args = parser.parse_args()
     if not args.save:
         args.outfile = None
+    if args.plot_win_size is None:
+        args.plot_win_size = 200 if args.plot_win_seconds is None else 0
     if args.plot_win_size == 0:
         args.plot_win_size = None
+    if args.gui_process and args.plot_win_size is None:
+        parser.error("--gui-process needs a bounded window: give a "
+                     "--plot_win_size other than 0")
     # Uncomment to debug the output of argparse:
     # raise ValueError(args)
     return args
@@ -78,23 +157,71 @@ class RealTimeAnalysis(object):
         self.args = _parse_arguments()
         # Parse config (plot layout and description of arduino output)
         config = parse_config(config_file=self.args.config_file)
-        # Buffers with the data to be plotted on each instant are saved here:
-        buffers = io.DataBuffers(maxlen=self.args.plot_win_size)
+        batching = None
+        if self.args.target_latency is not None:
+            batching = AdaptiveBatching(
+                self.args.target_latency, self.args.min_batch, self.args.max_batch,
+                deadline=self.args.batch_deadline)
         # Use the Serial port or mock the serial port with a file:
         idev = build_input_device(
-            self.args.port, config, config_file=self.args.config_file)
-        outfile = build_output_device(self.args.outfile, config)
-        # Create the figure, axis and the GUI:
-        self.window = gui.SensorViewerGUI(config=config["gui"]) if "gui" in config else None
-
+            self.args.port, config, config_file=self.args.config_file,
+            follow=self.args.follow)
+        transforms = build_transforms(config, idev, config_file=self.args.config_file)
+        outfile = build_output_device(self.args.outfile, config, scales=idev.column_scales,
+                                      config_file=self.args.config_file)
+        gap_detector = build_gap_detector(config, idev, config_file=self.args.config_file)
+        alarms = build_alarms(config, idev, config_file=self.args.config_file)
+        viewer = self.args.gui_process and "gui" in config
+        shm_name = self.args.shm_name
+        if viewer and shm_name is None:
+            shm_name = f"aves-{os.getpid()}"
+        # Buffers with the data to be plotted on each instant are saved here:
+        buffers = build_buffers(
+            self.args.plot_win_size, config,
+            history_tiers=self.args.history_tiers, shm_name=shm_name,
+            idev=idev, plot_win_seconds=self.args.plot_win_seconds,
+            config_file=self.args.config_file)
         outfile_ctx = outfile if outfile is not None else contextlib.nullcontext()
-        # With clause makes sure the serial port and output file are always properly closed
-        with idev, outfile_ctx:
+        # With clause makes sure the serial port and output file are always properly closed,
+        # and the (possibly shared) buffers released, whatever fails first. The viewer's
+        # window stays open after the rest is closed, so it is closed by the outer stack,
+        # but only started once the buffers it plots are in the with clause.
+        with contextlib.ExitStack() as viewer_stack, buffers, idev, outfile_ctx:
+            # Create the figure, axis and the GUI (here or in a process of its own):
+            self.window = None
+            if viewer:
+                self.window = viewer_stack.enter_context(ViewerProcess(
+                    config["gui"], buffers.name,
+                    on_plot_window_scale=self._scale_plot_window,
+                    on_trigger=getattr(outfile, "fire", None)))
+            elif "gui" in config:
+                self.window = gui.SensorViewerGUI(
+                    config=config["gui"],
+                    on_plot_window_scale=self._scale_plot_window,
+                    on_trigger=getattr(outfile, "fire", None))
+            memory_budget = None
+            if self.args.memory_budget is not None:
+                memory_budget = MemoryBudget(self.args.memory_budget, self.args.memory_policy)
             self.acquisition = Acquisition(
                 idev=idev, buffers=buffers, outfile=outfile,
                 tmeas=self.args.tmeas,
-                samples_per_step=self.args.plot_every_n_samples)
+                samples_per_step=self.args.plot_every_n_samples,
+                memory_budget=memory_budget, transforms=transforms,
+                batching=batching, gap_detector=gap_detector, alarms=alarms)
             self._run()
+            if self.args.metrics:
+                print(self.acquisition.metrics.format())
+            if self.args.memory_report:
+                print(format_report(report(buffers)))
+
+    def _scale_plot_window(self, factor):
+        "Grows or shrinks how many samples (or seconds) are plotted, by factor."
+        buffers = self.acquisition.buffers
+        if buffers.time_window is not None:
+            buffers.set_time_window(buffers.time_window * factor)
+            return
+        current = buffers.maxlen if buffers.maxlen is not None else len(buffers)
+        buffers.set_maxlen(max(1, int(current * factor)))
 
     def _tick(self):
         """
@@ -102,13 +229,18 @@ class RealTimeAnalysis(object):
         a GUI), and returns whether acquisition should keep going.
         """
         self.acquisition.step()
-        if self.window is not None and self.acquisition.buffers.data:
-            self.window.render(self.acquisition.buffers.data)
+        if isinstance(self.window, ViewerProcess):
+            # Keys pressed on the viewer's plot
+            self.window.poll()
+        elif self.window is not None and self.acquisition.buffers.data:
+            start = time.perf_counter_ns()
+            self.window.render(self.acquisition.buffers.stitched())
+            self.acquisition.metrics.record("render", time.perf_counter_ns() - start)
         window_closed = self.window is not None and self.window.closed
         return not (self.acquisition.should_stop() or window_closed)
 
     def _run(self):
-        if self.window is None:
+        if self.window is None or isinstance(self.window, ViewerProcess):
             while self._tick():
                 pass
         else:
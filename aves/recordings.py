@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Tools to cut and combine recordings without loading them whole in memory.
+It can be run as a program:
+
+    python3 -m aves.recordings slice data/run.txt --start 60 --stop 120 --outfile cut.txt
+    python3 -m aves.recordings merge data/a.txt data/b.txt --outfile merged.txt
+
+Both work on a column that increases along each recording (by default the
+gui's x_column, usually the device time):
+
+ - slice copies the samples whose value in that column is in [start,
+   stop). Rather than parsing the recording from its start, it looks up
+   where to start reading in a RecordingIndex: the byte offset of every
+   ``stride``-th sample together with its value in that column. The index
+   is built once, by a pass that only splits lines, and kept next to the
+   recording in ``<recording>.index`` until the recording changes.
+ - merge interleaves several recordings (e.g. rotated segments of one
+   run, or simultaneous runs of several devices) in order of that column,
+   with a streaming heap merge that only holds one chunk of each input at
+   a time.
+
+Results are written with WriteSensorFile, so they are recordings like
+any other.
+"""
+
+import argparse
+import bisect
+import heapq
+import json
+import os
+
+from aves.io import ReadSensorFile, WriteSensorFile
+from aves.utils import parse_config, require_keys
+
+#: Appended to a recording's file name to name its index sidecar.
+INDEX_SUFFIX = ".index"
+#: Samples between consecutive index entries.
+DEFAULT_INDEX_STRIDE = 1000
+#: Samples read (and written) at a time.
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def _column_position(output_config, column):
+    require_keys(output_config, ["columns"], "config.toml's 'output' section")
+    if column not in output_config["columns"]:
+        raise ValueError(
+            "Unknown column {!r}; the recordings have: {}".format(
+                column, ", ".join(output_config["columns"])))
+    return output_config["columns"].index(column)
+
+
+def _key_parser(position):
+    "Values of the first column are kept as text, like ReadSensorFile does."
+    return str if position == 0 else float
+
+
+class RecordingIndex(object):
+    """
+    Byte offsets of every ``stride``-th sample of a recording, with their
+    value in the indexed column.
+    """
+
+    def __init__(self, column, stride, keys, offsets):
+        self.column = column
+        self.stride = stride
+        self.keys = keys
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, filename, output_config, column, stride=DEFAULT_INDEX_STRIDE):
+        position = _column_position(output_config, column)
+        parse = _key_parser(position)
+        keys = []
+        offsets = []
+        samples = 0
+        offset = 0
+        with open(filename, 'rb') as stream:
+            for line in stream:
+                if not (line.startswith(b'#') or line.strip() == b''):
+                    if samples % stride == 0:
+                        keys.append(parse(line.split()[position].decode()))
+                        offsets.append(offset)
+                    samples += 1
+                offset += len(line)
+        return cls(column, stride, keys, offsets)
+
+    @classmethod
+    def load_or_build(cls, filename, output_config, column, stride=DEFAULT_INDEX_STRIDE):
+        """
+        Returns the index kept next to filename if it is still up to date
+        (same file size and modification time, column and stride);
+        otherwise builds it and saves it there for next time.
+        """
+        stat = os.stat(filename)
+        identity = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                    "column": column, "stride": stride}
+        index_file = filename + INDEX_SUFFIX
+        try:
+            with open(index_file, 'r') as stream:
+                saved = json.load(stream)
+            if all(saved.get(key) == value for key, value in identity.items()):
+                return cls(column, stride, saved["keys"], saved["offsets"])
+        except (OSError, ValueError):
+            pass
+        index = cls.build(filename, output_config, column, stride)
+        try:
+            with open(index_file, 'w') as stream:
+                json.dump(dict(identity, keys=index.keys, offsets=index.offsets), stream)
+        except OSError:
+            pass  # e.g. a read-only directory: just use it this once
+        return index
+
+    def offset_for(self, start):
+        """
+        Byte offset to start reading from to find the first sample whose
+        indexed value is >= start.
+        """
+        i = bisect.bisect_left(self.keys, start) - 1
+        return self.offsets[i] if i >= 0 else 0
+
+
+def _iter_samples(reader, chunk_size):
+    while not reader.stop_sampling:
+        yield from reader.readsamples(num_samples=chunk_size)
+
+
+def slice_samples(filename, output_config, column, start=None, stop=None,
+                  index=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yields the samples of filename whose value in column is in [start,
+    stop) (None: unbounded), reading from the offset the index points at.
+    """
+    position = _column_position(output_config, column)
+    parse = _key_parser(position)
+    start = None if start is None else parse(start)
+    stop = None if stop is None else parse(stop)
+    with ReadSensorFile(filename=filename, config=output_config) as reader:
+        if start is not None:
+            if index is None:
+                index = RecordingIndex.load_or_build(filename, output_config, column)
+            reader.seek(index.offset_for(start))
+        for sample in _iter_samples(reader, chunk_size):
+            if stop is not None and sample[column] >= stop:
+                break
+            if start is None or sample[column] >= start:
+                yield sample
+
+
+def _sorted_samples(filename, output_config, chunk_size):
+    with ReadSensorFile(filename=filename, config=output_config) as reader:
+        yield from _iter_samples(reader, chunk_size)
+
+
+def merge_samples(filenames, output_config, column, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yields the samples of all filenames, each already ordered by column,
+    merged in order of column. Ties keep the order of filenames.
+    """
+    _column_position(output_config, column)
+    return heapq.merge(
+        *(_sorted_samples(filename, output_config, chunk_size) for filename in filenames),
+        key=lambda sample: sample[column])
+
+
+def write_samples(samples, outfile, output_config, chunk_size=DEFAULT_CHUNK_SIZE):
+    "Writes an iterable of samples with WriteSensorFile, a chunk at a time."
+    count = 0
+    batch = []
+    with WriteSensorFile(filename=outfile, config=output_config) as writer:
+        for sample in samples:
+            batch.append(sample)
+            if len(batch) == chunk_size:
+                writer.write(batch)
+                count += len(batch)
+                batch = []
+        writer.write(batch)
+    return count + len(batch)
+
+
+def parse_arguments(argv=None):
+    """
+    Parses command line arguments
+    """
+    parser = argparse.ArgumentParser(description="Cut or merge aves recordings")
+    parser.add_argument('--config', dest='config_file', default='config.toml',
+                        help="config whose 'output' section describes the "
+                             "recordings' columns")
+    parser.add_argument('--column', dest='column', default=None,
+                        help="column that increases along the recordings, to "
+                             "cut or merge by (default: the gui's x_column)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    slicer = subparsers.add_parser("slice", help="copy a range of a recording")
+    slicer.add_argument("filename", help="recording to cut")
+    slicer.add_argument('--start', dest='start', default=None,
+                        help="first value of --column to keep (default: from the start)")
+    slicer.add_argument('--stop', dest='stop', default=None,
+                        help="keep values of --column below this one "
+                             "(default: until the end)")
+    slicer.add_argument('--outfile', dest='outfile', required=True,
+                        help="file to write the cut recording to")
+    merger = subparsers.add_parser("merge", help="interleave recordings in order")
+    merger.add_argument("filenames", nargs="+", help="recordings to merge")
+    merger.add_argument('--outfile', dest='outfile', required=True,
+                        help="file to write the merged recording to")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    config = parse_config(config_file=args.config_file)
+    require_keys(config, ["output"], args.config_file)
+    column = args.column or config.get("gui", {}).get("x_column")
+    if column is None:
+        raise ValueError(
+            f"--column is needed: {args.config_file} has no gui.x_column to default to")
+    if args.command == "slice":
+        samples = slice_samples(args.filename, config["output"], column,
+                                start=args.start, stop=args.stop)
+    else:
+        samples = merge_samples(args.filenames, config["output"], column)
+    count = write_samples(samples, args.outfile, config["output"])
+    print("Wrote {} samples to {}".format(count, args.outfile))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+The storage behind each column of aves.io.DataBuffers: a first-in
+first-out buffer of values in a preallocated numpy array.
+
+The array is laid out "mirrored": it has room for twice the capacity, and
+every value is written both at its slot i and at i + capacity. However
+the ring has wrapped around, its values in chronological order are then
+always one contiguous slice of the array, so view() hands them out
+without copying, and appending a batch is a couple of slice assignments
+no matter how large the buffer is.
+
+The array can also be handed in (``storage``), e.g. one living in shared
+memory so other processes can read it (see aves.sharedbuffers); its
+capacity is then fixed.
+
+How many values are kept (maxlen) is separate from how many fit in the
+array (its capacity). Shrinking maxlen only moves the logical start of
+the window, and growing it back up to the capacity only moves it back:
+neither touches the stored values. Only growing beyond the capacity
+needs a larger array, which is why a ``capacity`` can be reserved up
+front for windows that are expected to change size at runtime.
+
+Values can also be dropped from the oldest end explicitly (drop()), for
+windows whose extent is not a number of values, e.g. the last 30 seconds
+(see aves.io.DataBuffers).
+"""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+#: Capacity an unlimited (maxlen=None) buffer starts with; it doubles
+#: whenever it fills up.
+_INITIAL_CAPACITY = 16
+
+
+def _storage_dtype(values):
+    """
+    Numbers are stored as float64, anything else (e.g. the time_computer
+    timestamps, which are text) as Python objects.
+    """
+    kind = np.asarray(values).dtype.kind
+    return np.float64 if kind in "biuf" else object
+
+
+def _to_integers(values, dtype):
+    """
+    values as the integer dtype, rounding fractions and clipping values
+    out of its range with a warning, rather than truncating them or
+    letting them wrap around (-1 becoming 65535 in a uint16).
+    """
+    info = np.iinfo(dtype)
+    rounded = np.clip(np.rint(values), info.min, info.max)
+    if not np.array_equal(rounded, values, equal_nan=True):
+        logger.warning("Rounding or clipping values that do not fit %s", dtype)
+    return rounded.astype(dtype)
+
+
+class RingBuffer(object):
+    """
+    Keeps the latest ``maxlen`` values appended to it (all of them if
+    maxlen is None), like a ``collections.deque(maxlen=maxlen)``.
+
+    Args:
+        maxlen (int): Keep only the latest maxlen values (default: None)
+        dtype: numpy dtype of the values. Inferred from the first values
+            appended if not given.
+        capacity (int): Room to allocate, if more than maxlen (e.g. to
+            let set_maxlen() grow the window later without reallocating).
+        storage (numpy.ndarray): Array to keep the values in, of length
+            twice the capacity, instead of allocating one. Values of a
+            different dtype are converted to its dtype, and it is never
+            reallocated: at most ``len(storage) // 2`` values are kept.
+    """
+
+    def __init__(self, maxlen=None, dtype=None, capacity=None, storage=None):
+        self.maxlen = maxlen
+        self._reserve = capacity or 0
+        self._dtype = dtype
+        self._storage = storage
+        self._capacity = 0 if storage is None else len(storage) // 2
+        self._fixed = storage is not None
+        # Slot after the newest value, and how many values there are:
+        self._end = 0
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return iter(self.view())
+
+    def __getitem__(self, index):
+        return self.view()[index]
+
+    def __array__(self, dtype=None, copy=None):
+        view = self.view()
+        if dtype is not None and view.dtype != dtype:
+            return view.astype(dtype)
+        return view.copy() if copy else view
+
+    def __repr__(self):
+        return "RingBuffer({!r}, maxlen={})".format(self.tolist(), self.maxlen)
+
+    @property
+    def dtype(self):
+        return self._storage.dtype if self._storage is not None else self._dtype
+
+    def view(self):
+        """
+        The values, oldest first, as a read-only numpy array sharing memory
+        with the buffer: it changes as new values are appended, so copy it
+        if it has to outlive the next append.
+        """
+        if self._storage is None:
+            return np.empty(0, dtype=self._dtype or np.float64)
+        start = (self._end - self._len) % self._capacity
+        view = self._storage[start:start + self._len]
+        view.flags.writeable = False
+        return view
+
+    def tolist(self):
+        "The values, oldest first, as a list of plain Python objects."
+        return self.view().tolist()
+
+    def _allocate(self, capacity, dtype):
+        "Moves the values to new storage with room for capacity values."
+        if self._fixed:
+            raise ValueError(
+                "This buffer's storage was given to it, so it cannot grow beyond "
+                "{} values".format(self._capacity))
+        old = self.view() if self._storage is not None else None
+        self._storage = np.empty(2 * capacity, dtype=dtype)
+        self._capacity = capacity
+        self._end = 0
+        if old is not None and len(old):
+            self._len = 0
+            self._write(0, old[len(old) - min(len(old), capacity):])
+            self._len = min(len(old), capacity)
+            self._end = self._len % capacity
+
+    def _prepare(self, values, room):
+        """
+        Makes sure storage exists, can hold ``values`` and has room for
+        ``room`` values in total (growing it if unlimited).
+        """
+        if self._storage is None:
+            dtype = self._dtype or _storage_dtype(values)
+            if self.maxlen is None:
+                capacity = max(_INITIAL_CAPACITY, room, self._reserve)
+            else:
+                capacity = max(self.maxlen, self._reserve)
+            self._allocate(capacity, dtype)
+        elif (self._storage.dtype != object and not self._fixed
+              and _storage_dtype(values) is object):
+            self._allocate(self._capacity, object)
+        if self.maxlen is None and room > self._capacity and not self._fixed:
+            self._allocate(max(room, 2 * self._capacity), self._storage.dtype)
+
+    def _write(self, pos, values):
+        "Writes values starting at slot pos, in both halves of the mirror."
+        capacity = self._capacity
+        first = min(len(values), capacity - pos)
+        rest = len(values) - first
+        for offset in (0, capacity):
+            self._storage[offset + pos:offset + pos + first] = values[:first]
+            if rest:
+                self._storage[offset:offset + rest] = values[first:]
+
+    def _cast(self, values):
+        "values as a numpy array of the storage's dtype."
+        dtype = self._storage.dtype
+        values = np.asarray(values)
+        if (dtype.kind in "iu" and values.dtype.kind in "iuf"
+                and not np.can_cast(values.dtype, dtype)):
+            return _to_integers(values, dtype)
+        return values.astype(dtype, copy=False)
+
+    def append(self, value):
+        self.extend([value])
+
+    def extend(self, values):
+        """
+        Appends values (any sequence, a numpy array being the cheapest) at
+        the newest end, dropping the oldest ones beyond maxlen.
+        """
+        if len(values) == 0 or self.maxlen == 0:
+            return
+        self._prepare(values, self._len + len(values))
+        values = self._cast(values)
+        if len(values) > self._capacity:
+            values = values[-self._capacity:]
+        self._write(self._end, values)
+        self._end = (self._end + len(values)) % self._capacity
+        self._len = min(self._len + len(values), self._limit)
+
+    def appendleft(self, value):
+        self.extendleft([value])
+
+    def extendleft(self, values):
+        """
+        Prepends each of values in turn at the oldest end (so they end up
+        reversed, like deque.extendleft), dropping the newest values
+        beyond maxlen.
+        """
+        if len(values) == 0 or self.maxlen == 0:
+            return
+        self._prepare(values, self._len + len(values))
+        values = self._cast(values)[::-1]
+        values = values[:self._limit]
+        overflow = self._len + len(values) - self._limit
+        if overflow > 0:
+            # Drop the newest values to make room
+            self._len -= overflow
+            self._end = (self._end - overflow) % self._capacity
+        start = (self._end - self._len - len(values)) % self._capacity
+        self._write(start, values)
+        self._len += len(values)
+
+    @property
+    def _limit(self):
+        "How many values fit in the window right now."
+        if self.maxlen is None:
+            return self._capacity
+        return min(self.maxlen, self._capacity)
+
+    @property
+    def capacity(self):
+        "How many values fit in the allocated storage."
+        return self._capacity
+
+    @property
+    def nbytes(self):
+        "Bytes of storage allocated (twice the capacity, see above)."
+        return self._storage.nbytes if self._storage is not None else 0
+
+    @property
+    def end(self):
+        """
+        Slot of the storage after the newest value: the values are
+        ``storage[end - len:end]``, modulo the capacity.
+        """
+        return self._end
+
+    def set_capacity(self, capacity):
+        """
+        Moves the values to storage with room for capacity values (or for
+        as many values as are kept, if more), e.g. to trim what doubling
+        an unlimited buffer over-allocated once its size is known. Does
+        nothing for a buffer whose storage was given to it.
+        """
+        if self._storage is None:
+            self._reserve = capacity
+        elif not self._fixed and capacity != self._capacity:
+            self._allocate(max(capacity, self._len, 1), self._storage.dtype)
+
+    def drop(self, count):
+        "Drops the oldest count values, in constant time."
+        self._len -= min(max(count, 0), self._len)
+
+    def set_maxlen(self, maxlen=None):
+        """
+        Changes how many values are kept, dropping the oldest ones if the
+        buffer is shrunk. Shrinking, and growing up to the capacity, take
+        constant time and copy nothing; growing beyond the capacity moves
+        the kept values to a larger array once.
+        """
+        self.maxlen = maxlen
+        if self._storage is None:
+            return
+        if maxlen is not None and maxlen > self._capacity and not self._fixed:
+            self._allocate(maxlen, self._storage.dtype)
+        self._len = min(self._len, self._limit)
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+DataBuffers that other processes can read live, through
+``multiprocessing.shared_memory`` rather than copies sent over a socket:
+a Jupyter notebook, a second viewer, a custom alarm script...
+
+The acquiring process creates a SharedDataBuffers under a name (e.g.
+``--shm-name aves`` in aves.realtime or aves.web) and uses it like any
+other DataBuffers. Any process on the same machine can then attach to it
+by that name:
+
+    from aves.sharedbuffers import SharedBuffersReader
+
+    with SharedBuffersReader("aves") as reader:
+        data, seq, resync = reader.read_since(None)
+        ...
+        data, seq, resync = reader.read_since(seq)  # only what is new
+
+The shared memory block holds a small header followed by the numeric
+columns, each laid out as the mirrored ring of aves.ringbuffer, so the
+latest samples are always one contiguous slice:
+
+ - header: eight int64 values: a magic number, the layout version, the
+   seqlock ``version`` (odd while the writer is writing, as in
+   DataBuffers), ``seq`` (samples appended so far), the ring's ``end``
+   slot and length, its capacity, and the size of the metadata.
+ - the metadata, as JSON padded to a multiple of 8 bytes: the columns'
+   names and dtypes (float64 unless the config declares one, see
+   aves.io), and the scales still to be applied to them.
+ - one array of twice the capacity per column, each starting at a
+   multiple of 8 bytes.
+
+Only numeric columns are shared; text ones (e.g. time_computer) are
+buffered in the writing process only. Readers map the block read-only
+and use the header's seqlock for consistent, scaled copies, like
+DataBuffers.snapshot(). The block has a fixed size, so its window can
+shrink and grow again at runtime, but never beyond the capacity it was
+created with.
+"""
+
+import contextlib
+import json
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from aves.io import DataBuffers
+from aves.ringbuffer import RingBuffer
+
+#: First header value of every aves shared buffer.
+MAGIC = 0x41564553  # "AVES"
+#: Bumped whenever the layout below changes.
+LAYOUT_VERSION = 2
+_HEADER_FIELDS = ("magic", "layout", "version", "seq", "end", "length", "capacity", "meta")
+_HEADER_BYTES = 8 * len(_HEADER_FIELDS)
+_MAGIC, _LAYOUT, _VERSION, _SEQ, _END, _LENGTH, _CAPACITY, _META = range(len(_HEADER_FIELDS))
+# Blocks created by this process, which its resource tracker must keep
+# track of even if this process also attaches to them
+_created = set()
+
+
+def _padded(size):
+    return (size + 7) // 8 * 8
+
+
+def _column_arrays(buffer, meta_size, dtypes, capacity):
+    "The arrays of each column (dtypes: name -> dtype) within buffer."
+    offset = _HEADER_BYTES + _padded(meta_size)
+    arrays = {}
+    for name, dtype in dtypes.items():
+        arrays[name] = np.ndarray((2 * capacity,), dtype=dtype, buffer=buffer, offset=offset)
+        offset += _padded(arrays[name].nbytes)
+    return arrays
+
+
+class SharedDataBuffers(DataBuffers):
+    """
+    DataBuffers whose numeric columns live in a named shared memory block
+    (see the module docstring).
+
+    Args:
+        name (str): Name other processes attach to it by.
+        columns (list): The numeric columns to share. Any other column
+            appended is kept in this process only.
+        capacity (int): Most samples the shared window can ever hold.
+        maxlen (int): Keep only the latest maxlen samples (default: all
+            that fit in capacity).
+        history, dtypes, scales, time_window, time_column: As in
+            DataBuffers. A time window can only hold as many samples as
+            fit in capacity.
+    """
+
+    def __init__(self, name, columns, capacity, maxlen=None, history=None,
+                 dtypes=None, scales=None, time_window=None, time_column=None):
+        super().__init__(maxlen=maxlen, capacity=capacity, history=history,
+                         dtypes=dtypes, scales=scales,
+                         time_window=time_window, time_column=time_column)
+        column_dtypes = {column: np.dtype(self.dtypes.get(column, np.float64))
+                         for column in columns}
+        meta = json.dumps({
+            "columns": [[column, dtype.str] for column, dtype in column_dtypes.items()],
+            "scales": {column: factor for column, factor in self.scales.items()
+                       if column in column_dtypes},
+        }).encode("utf-8")
+        size = _HEADER_BYTES + _padded(len(meta)) + sum(
+            _padded(2 * capacity * dtype.itemsize) for dtype in column_dtypes.values())
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.name = self._shm.name
+        _created.add(self._shm._name)
+        self._header = np.ndarray((len(_HEADER_FIELDS),), dtype=np.int64, buffer=self._shm.buf)
+        self._header[:] = 0
+        self._header[_MAGIC] = MAGIC
+        self._header[_LAYOUT] = LAYOUT_VERSION
+        self._header[_CAPACITY] = capacity
+        self._header[_META] = len(meta)
+        self._shm.buf[_HEADER_BYTES:_HEADER_BYTES + len(meta)] = meta
+        storage = _column_arrays(self._shm.buf, len(meta), column_dtypes, capacity)
+        self._shared = []
+        for column, array in storage.items():
+            ring_maxlen = maxlen if self.time_window is None else None
+            self.data[column] = RingBuffer(maxlen=ring_maxlen, storage=array)
+            self._shared.append(self.data[column])
+
+    @contextlib.contextmanager
+    def _writing(self):
+        # As DataBuffers._writing(), mirroring version in the header, and
+        # copying the ring's state there before the write ends
+        self.version += 1
+        if self._header is not None:
+            self._header[_VERSION] = self.version
+        try:
+            yield
+        finally:
+            if self._header is not None:
+                self._header[_SEQ] = self.seq
+                if self._shared:
+                    self._header[_END] = self._shared[0].end
+                    self._header[_LENGTH] = len(self._shared[0])
+            self.version += 1
+            if self._header is not None:
+                self._header[_VERSION] = self.version
+
+    def close(self):
+        """
+        Removes the shared memory block. Readers already attached keep
+        their mapping until they close it; this process keeps buffering
+        the shared columns, in private memory from now on.
+        """
+        if self._shm is None:
+            return
+        with self._writing():
+            for column, ring in self.data.items():
+                if any(ring is shared for shared in self._shared):
+                    private = self._new_column(column)
+                    private.extend(ring.view().copy())
+                    self.data[column] = private
+            self._shared = []
+            self._header = None
+        self._shm.unlink()
+        _created.discard(self._shm._name)
+        try:
+            self._shm.close()
+        except BufferError:
+            # Views into the block are still held somewhere (e.g. from
+            # last()): the mapping goes away with them instead
+            pass
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, value, traceback):
+        self.close()
+        return False
+
+
+class SharedBuffersReader(object):
+    """
+    Attaches read-only to the SharedDataBuffers another process created
+    under ``name``.
+
+    ``creator_tracker`` tells that this process shares the resource
+    tracker of the one that created the block, as the processes it
+    starts with multiprocessing do (e.g. aves.viewer's): the block is
+    then left registered with it, for the creator to remove.
+    """
+
+    def __init__(self, name, creator_tracker=False):
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13 registers attached blocks with the resource
+            # tracker too, which would remove the writer's block when this
+            # process exits
+            self._shm = shared_memory.SharedMemory(name=name)
+            if self._shm._name not in _created and not creator_tracker:
+                resource_tracker.unregister(self._shm._name, "shared_memory")
+        buffer = self._shm.buf.toreadonly()
+        header = np.ndarray((len(_HEADER_FIELDS),), dtype=np.int64, buffer=buffer)
+        if header[_MAGIC] != MAGIC or header[_LAYOUT] != LAYOUT_VERSION:
+            del header, buffer
+            self._shm.close()
+            raise ValueError(
+                "{!r} is not an aves shared buffer of layout version {}".format(
+                    name, LAYOUT_VERSION))
+        self._header = header
+        meta_size = int(self._header[_META])
+        meta = json.loads(bytes(buffer[_HEADER_BYTES:_HEADER_BYTES + meta_size]).decode("utf-8"))
+        dtypes = {column: np.dtype(dtype) for column, dtype in meta["columns"]}
+        self.columns = list(dtypes)
+        #: Factors snapshot() and read_since() multiply columns by
+        self.scales = meta["scales"]
+        self.capacity = int(self._header[_CAPACITY])
+        self._arrays = _column_arrays(buffer, meta_size, dtypes, self.capacity)
+
+    @property
+    def seq(self):
+        return int(self._header[_SEQ])
+
+    def last(self, num_samples=None):
+        """
+        The latest num_samples samples (all of them if None), as one
+        read-only view per column into the shared memory: no copies, but
+        no consistency either -- the writer may be changing them -- and
+        no scales applied.
+        """
+        end = int(self._header[_END])
+        length = int(self._header[_LENGTH])
+        if num_samples is not None:
+            length = min(length, num_samples)
+        start = (end - length) % self.capacity if self.capacity else 0
+        return {name: array[start:start + length] for name, array in self._arrays.items()}
+
+    def _read_consistent(self, read):
+        "As DataBuffers._read_consistent, on the header's version."
+        while True:
+            version = int(self._header[_VERSION])
+            if version % 2 == 0:
+                result = read()
+                if int(self._header[_VERSION]) == version:
+                    return result
+            time.sleep(0)
+
+    def snapshot(self, num_samples=None):
+        "Like last(), but consistent, scaled copies (see DataBuffers.snapshot)."
+        return self._read_consistent(
+            lambda: self._scaled(self.last(num_samples)))
+
+    def _scaled(self, data):
+        "Copies of the columns in data, scaled."
+        return {name: values * self.scales[name] if name in self.scales else values.copy()
+                for name, values in data.items()}
+
+    def read_since(self, seq):
+        "As DataBuffers.read_since()."
+        def read():
+            current = int(self._header[_SEQ])
+            length = int(self._header[_LENGTH])
+            missed = None if seq is None else current - seq
+            resync = missed is None or missed < 0 or missed > length
+            data = self.last() if resync else self.last(missed)
+            return self._scaled(data), current, resync
+        return self._read_consistent(read)
+
+    def close(self):
+        self._arrays = {}
+        self._header = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass  # see SharedDataBuffers.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, value, traceback):
+        self.close()
+        return False
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+This module can be run as a program to compute statistics over one or many
+recordings, without loading them whole in memory:
+
+    python3 -m aves.stats data/*.txt --bins 20 --bucket 60
+
+For every numeric column it reports count, minimum, maximum, mean and
+standard deviation, and optionally a histogram and aggregates over fixed
+time buckets (of the gui's x_column, or --bucket-column).
+
+Recordings are read with ReadSensorFile, ``--chunk-size`` samples at a
+time, and folded into aves.summary.RunningStats, so memory use depends on
+the chunk size and the number of worker processes, not on how long the
+recordings are. Files are processed in parallel, one per worker
+(``--jobs``, default: one per core). Histograms need the overall range
+first, so when asked for they take a second pass over the files.
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from aves.io import ReadSensorFile
+from aves.summary import RunningStats
+from aves.utils import parse_config, require_keys
+
+#: Samples read at a time from each recording.
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def _chunks(filename, output_config, columns, chunk_size):
+    "Yields one dict of float arrays (one per column) per chunk of samples."
+    with ReadSensorFile(filename=filename, config=output_config) as idev:
+        while not idev.stop_sampling:
+            samples = idev.readsamples(num_samples=chunk_size)
+            if samples:
+                yield {name: np.array([sample[name] for sample in samples], dtype=np.float64)
+                       for name in columns}
+
+
+def file_statistics(filename, output_config, columns, chunk_size=DEFAULT_CHUNK_SIZE,
+                    bucket_column=None, bucket_width=None):
+    """
+    Streams filename once, returning a dict with:
+
+     - "stats": column -> RunningStats over the whole file.
+     - "buckets": column -> {bucket start: RunningStats}, bucketing by
+       ``bucket_width`` units of ``bucket_column`` (empty if not given).
+    """
+    stats = {name: RunningStats() for name in columns}
+    buckets = {name: {} for name in columns} if bucket_width else {}
+    read_columns = list(columns)
+    if bucket_width and bucket_column not in read_columns:
+        read_columns.append(bucket_column)
+    for chunk in _chunks(filename, output_config, read_columns, chunk_size):
+        for name in columns:
+            stats[name].update_array(chunk[name])
+        if not bucket_width:
+            continue
+        keys = np.floor(chunk[bucket_column] / bucket_width) * bucket_width
+        for key in np.unique(keys):
+            in_bucket = keys == key
+            for name in columns:
+                buckets[name].setdefault(float(key), RunningStats()).update_array(
+                    chunk[name][in_bucket])
+    return {"stats": stats, "buckets": buckets}
+
+
+def file_histograms(filename, output_config, columns, edges, chunk_size=DEFAULT_CHUNK_SIZE):
+    "Streams filename once, returning column -> histogram counts over edges[column]."
+    counts = {name: np.zeros(len(edges[name]) - 1, dtype=np.int64) for name in columns}
+    for chunk in _chunks(filename, output_config, columns, chunk_size):
+        for name in columns:
+            counts[name] += np.histogram(chunk[name], bins=edges[name])[0]
+    return counts
+
+
+def _merge_statistics(results):
+    merged = None
+    for result in results:
+        if merged is None:
+            merged = result
+            continue
+        for name, stats in result["stats"].items():
+            merged["stats"][name].merge(stats)
+        for name, buckets in result["buckets"].items():
+            for key, stats in buckets.items():
+                merged["buckets"][name].setdefault(key, RunningStats()).merge(stats)
+    return merged
+
+
+def _histogram_edges(stats, bins):
+    edges = {}
+    for name, column_stats in stats.items():
+        low, high = column_stats.minimum, column_stats.maximum
+        if not column_stats.count:
+            low, high = 0.0, 1.0
+        elif low == high:
+            low, high = low - 0.5, high + 0.5
+        edges[name] = np.linspace(low, high, bins + 1)
+    return edges
+
+
+def compute(filenames, output_config, columns, chunk_size=DEFAULT_CHUNK_SIZE, bins=0,
+            bucket_column=None, bucket_width=None, jobs=None):
+    """
+    Statistics over all of filenames together (see file_statistics), plus
+    "histograms" (column -> (edges, counts)) if bins > 0. Runs up to
+    ``jobs`` files at a time in separate processes (jobs=1: all in this
+    process).
+    """
+    jobs = jobs or os.cpu_count() or 1
+    jobs = min(jobs, len(filenames))
+    n = len(filenames)
+    stats_args = ([output_config] * n, [columns] * n, [chunk_size] * n,
+                  [bucket_column] * n, [bucket_width] * n)
+    if jobs <= 1:
+        result = _merge_statistics(map(file_statistics, filenames, *stats_args))
+        if bins > 0:
+            edges = _histogram_edges(result["stats"], bins)
+            partials = list(map(file_histograms, filenames, *stats_args[:2],
+                                [edges] * n, [chunk_size] * n))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            result = _merge_statistics(executor.map(file_statistics, filenames, *stats_args))
+            if bins > 0:
+                edges = _histogram_edges(result["stats"], bins)
+                partials = list(executor.map(file_histograms, filenames, *stats_args[:2],
+                                             [edges] * n, [chunk_size] * n))
+    result["histograms"] = {}
+    if bins > 0:
+        for name in columns:
+            result["histograms"][name] = (edges[name], sum(part[name] for part in partials))
+    return result
+
+
+def _stats_dict(stats):
+    return {"count": stats.count, "min": stats.minimum, "max": stats.maximum,
+            "mean": stats.mean, "std": stats.std}
+
+
+def _to_json(result):
+    return {
+        "stats": {name: _stats_dict(stats) for name, stats in result["stats"].items()},
+        "histograms": {name: {"edges": edges.tolist(), "counts": counts.tolist()}
+                       for name, (edges, counts) in result["histograms"].items()},
+        "buckets": {name: [dict(start=key, **_stats_dict(stats))
+                           for key, stats in sorted(buckets.items())]
+                    for name, buckets in result["buckets"].items()},
+    }
+
+
+def _print_report(result, bucket_column, stream=sys.stdout):
+    width = max([len("column")] + [len(name) for name in result["stats"]])
+    print(f"{'column':<{width}}  {'count':>10}  {'min':>12}  {'max':>12}  "
+          f"{'mean':>12}  {'std':>12}", file=stream)
+    for name, stats in result["stats"].items():
+        print(f"{name:<{width}}  {stats.count:>10}  {stats.minimum:>12.6g}  "
+              f"{stats.maximum:>12.6g}  {stats.mean:>12.6g}  {stats.std:>12.6g}",
+              file=stream)
+    for name, (edges, counts) in result["histograms"].items():
+        print(f"\nHistogram of {name}:", file=stream)
+        for low, high, count in zip(edges[:-1], edges[1:], counts):
+            print(f"  [{low:12.6g}, {high:12.6g})  {count}", file=stream)
+    for name, buckets in result["buckets"].items():
+        print(f"\n{name} by {bucket_column}:", file=stream)
+        for key, stats in sorted(buckets.items()):
+            print(f"  {key:>12.6g}  n={stats.count:<8} min={stats.minimum:<12.6g} "
+                  f"max={stats.maximum:<12.6g} mean={stats.mean:.6g}", file=stream)
+
+
+def parse_arguments(argv=None):
+    """
+    Parses command line arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Statistics over one or many aves recordings")
+    parser.add_argument("filenames", nargs="+", help="recordings to summarize")
+    parser.add_argument('--config', dest='config_file', default='config.toml',
+                        help="config whose 'output' section describes the "
+                             "recordings' columns")
+    parser.add_argument('--columns', dest='columns', nargs="+", default=None,
+                        help="columns to summarize (default: every output "
+                             "column but the first, which is text)")
+    parser.add_argument('--bins', dest='bins', type=int, default=0,
+                        help="also compute a histogram of each column with "
+                             "this many bins (default: 0, no histograms)")
+    parser.add_argument('--bucket', dest='bucket_width', type=float, default=None,
+                        help="also aggregate each column over buckets this "
+                             "wide, in units of --bucket-column (e.g. 60)")
+    parser.add_argument('--bucket-column', dest='bucket_column', default=None,
+                        help="column the buckets refer to (default: the "
+                             "gui's x_column)")
+    parser.add_argument('--chunk-size', dest='chunk_size', type=int,
+                        default=DEFAULT_CHUNK_SIZE,
+                        help="samples read at a time per file, which bounds "
+                             "memory use (default: %(default)s)")
+    parser.add_argument('--jobs', dest='jobs', type=int, default=None,
+                        help="files processed in parallel (default: one per core)")
+    parser.add_argument('--json', dest='json', action="store_true",
+                        help="print the results as JSON")
+    args = parser.parse_args(argv)
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1, got {}".format(args.chunk_size))
+    return args
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    config = parse_config(config_file=args.config_file)
+    require_keys(config, ["output"], args.config_file)
+    output_config = require_keys(
+        config["output"], ["columns"], "config.toml's 'output' section")
+    columns = args.columns or output_config["columns"][1:]
+    unknown = [name for name in columns if name not in output_config["columns"]]
+    if unknown:
+        raise ValueError(
+            "Unknown column(s) {}; the recordings have: {}".format(
+                ", ".join(unknown), ", ".join(output_config["columns"])))
+    bucket_column = args.bucket_column
+    if args.bucket_width is not None:
+        if bucket_column is None:
+            bucket_column = config.get("gui", {}).get("x_column")
+        if bucket_column not in output_config["columns"][1:]:
+            raise ValueError(
+                f"--bucket needs a numeric column of the recordings to bucket "
+                f"by (--bucket-column), got {bucket_column!r}")
+        if not args.bucket_width > 0 or math.isinf(args.bucket_width):
+            raise ValueError(f"--bucket must be a positive width, got {args.bucket_width}")
+    result = compute(args.filenames, output_config, columns, chunk_size=args.chunk_size,
+                     bins=args.bins, bucket_column=bucket_column,
+                     bucket_width=args.bucket_width, jobs=args.jobs)
+    if args.json:
+        print(json.dumps(_to_json(result), indent=2))
+    else:
+        _print_report(result, bucket_column)
+
+
+if __name__ == '__main__':
+    main()
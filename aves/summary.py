@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Per-chunk summary statistics of a recording, kept in a small sidecar file
+next to it, so questions like "what were the min/max/mean of Sensor 2
+each minute" can be answered without reading the recording itself.
+
+While recording, WriteSensorFile (with ``output.summary_chunk_size`` set
+in the config) feeds every written sample to a ChunkSummaryWriter, which
+keeps count, minimum, maximum, sum and sum of squares of each numeric
+column and appends one line to ``<recording>.summary`` every
+``summary_chunk_size`` samples. That file is JSON lines:
+
+ - The first line describes the recording: its columns and chunk size.
+ - Every other line is one chunk: the index of its first sample, how many
+   samples it has, and the statistics of each numeric column as
+   [count, min, max, sum, sum of squares].
+
+RecordingSummary reads it back and merges chunks into statistics over a
+range of samples, or of any numeric column (e.g. the device time). The
+answers are exact at chunk boundaries: a chunk that is only partly inside
+the requested range counts as a whole.
+"""
+
+import json
+import math
+
+import numpy as np
+
+#: Appended to a recording's file name to name its summary sidecar.
+SUMMARY_SUFFIX = ".summary"
+
+
+class RunningStats(object):
+    """
+    Count, minimum, maximum, sum and sum of squares of a stream of
+    values, from which mean and standard deviation follow. Two of them
+    (e.g. for consecutive chunks) can be merged into one.
+    """
+
+    __slots__ = ("count", "minimum", "maximum", "total", "total_sq")
+
+    def __init__(self, count=0, minimum=math.inf, maximum=-math.inf,
+                 total=0.0, total_sq=0.0):
+        self.count = count
+        self.minimum = minimum
+        self.maximum = maximum
+        self.total = total
+        self.total_sq = total_sq
+
+    def update(self, value):
+        "Adds a single value."
+        self.count += 1
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+        self.total += value
+        self.total_sq += value * value
+
+    def update_array(self, values):
+        "Adds a numpy array of values."
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+        self.total += float(values.sum())
+        self.total_sq += float(np.dot(values, values))
+
+    def merge(self, other):
+        "Adds every value other has seen."
+        self.count += other.count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self.total += other.total
+        self.total_sq += other.total_sq
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else math.nan
+
+    @property
+    def std(self):
+        "Population standard deviation."
+        if not self.count:
+            return math.nan
+        mean = self.mean
+        return math.sqrt(max(self.total_sq / self.count - mean * mean, 0.0))
+
+    def to_list(self):
+        return [self.count, self.minimum, self.maximum, self.total, self.total_sq]
+
+    @classmethod
+    def from_list(cls, values):
+        return cls(*values)
+
+    def __repr__(self):
+        return "RunningStats(count={}, min={}, max={}, mean={})".format(
+            self.count, self.minimum, self.maximum, self.mean)
+
+
+class ChunkSummaryWriter(object):
+    """
+    Writes the summary sidecar of a recording as it is being written.
+
+    Args:
+        filename (str): The recording's file name (the sidecar gets
+            SUMMARY_SUFFIX appended).
+        columns (list): The recording's columns.
+        chunk_size (int): Samples per chunk.
+    """
+
+    def __init__(self, filename, columns, chunk_size):
+        if chunk_size < 1:
+            raise ValueError(
+                f"config.toml's 'output.summary_chunk_size' must be a "
+                f"positive number of samples, got {chunk_size!r}")
+        self.filename = filename + SUMMARY_SUFFIX
+        self._columns = columns
+        self._chunk_size = chunk_size
+        self._filepointer = None
+        self._first = 0
+        self._new_chunk()
+
+    def _new_chunk(self):
+        self._count = 0
+        self._stats = {name: RunningStats() for name in self._columns}
+
+    def open(self):
+        self._filepointer = open(self.filename, 'w')
+        header = {"columns": self._columns, "chunk_size": self._chunk_size}
+        self._filepointer.write(json.dumps(header) + "\n")
+        self._filepointer.flush()
+
+    def add(self, samples):
+        "Accounts for samples, which were just written to the recording."
+        for sample in samples:
+            for name, stats in self._stats.items():
+                value = sample[name]
+                if not isinstance(value, str):
+                    stats.update(value)
+            self._count += 1
+            if self._count == self._chunk_size:
+                self._write_chunk()
+
+    def _write_chunk(self):
+        chunk = {
+            "first": self._first,
+            "count": self._count,
+            "stats": {name: stats.to_list() for name, stats in self._stats.items()
+                      if stats.count},
+        }
+        self._filepointer.write(json.dumps(chunk) + "\n")
+        self._filepointer.flush()
+        self._first += self._count
+        self._new_chunk()
+
+    def close(self):
+        "Writes the last (incomplete) chunk, if any, and closes the sidecar."
+        if self._filepointer is None:
+            return
+        if self._count:
+            self._write_chunk()
+        self._filepointer.close()
+        self._filepointer = None
+
+
+class RecordingSummary(object):
+    """
+    The summary sidecar of a recording, loaded in memory (it is small: one
+    line per chunk).
+
+    Args:
+        filename (str): The recording, or its sidecar file.
+    """
+
+    def __init__(self, filename):
+        if not filename.endswith(SUMMARY_SUFFIX):
+            filename += SUMMARY_SUFFIX
+        with open(filename, 'r') as stream:
+            header = json.loads(stream.readline())
+            self.columns = header["columns"]
+            self.chunk_size = header["chunk_size"]
+            self.chunks = []
+            for line in stream:
+                if line.strip():
+                    chunk = json.loads(line)
+                    chunk["stats"] = {name: RunningStats.from_list(values)
+                                      for name, values in chunk["stats"].items()}
+                    self.chunks.append(chunk)
+
+    @property
+    def num_samples(self):
+        return sum(chunk["count"] for chunk in self.chunks)
+
+    def _select(self, start, stop, by):
+        "Chunks overlapping [start, stop): sample indices, or values of by."
+        for chunk in self.chunks:
+            if by is None:
+                low, high = chunk["first"], chunk["first"] + chunk["count"] - 1
+            elif by in chunk["stats"]:
+                low, high = chunk["stats"][by].minimum, chunk["stats"][by].maximum
+            else:
+                raise ValueError(
+                    f"{by!r} is not a numeric column of this recording's summary "
+                    f"(columns: {', '.join(self.columns)})")
+            if (start is None or high >= start) and (stop is None or low < stop):
+                yield chunk
+
+    def range_stats(self, column, start=None, stop=None, by=None):
+        """
+        Statistics of column over the chunks overlapping [start, stop).
+
+        Args:
+            column (str): The column to summarize.
+            start, stop: Range limits (None: unbounded), in sample indices
+                or, if ``by`` is given, in values of that column (which
+                should increase along the recording, e.g. a time column).
+            by (str): Column the range refers to (default: sample index).
+
+        Returns:
+            RunningStats
+        """
+        result = RunningStats()
+        for chunk in self._select(start, stop, by):
+            if column in chunk["stats"]:
+                result.merge(chunk["stats"][column])
+        return result
+
+    def bucketed_stats(self, column, by, width):
+        """
+        Statistics of column in buckets of ``width`` units of ``by`` (e.g.
+        60 for "each minute" of a time column in seconds). Each chunk goes
+        to the bucket its first ``by`` value falls in, so buckets are only
+        as precise as the chunks are small.
+
+        Returns:
+            list: (bucket start, RunningStats) pairs, in ``by`` order.
+        """
+        buckets = {}
+        for chunk in self._select(None, None, by):
+            if column not in chunk["stats"]:
+                continue
+            key = math.floor(chunk["stats"][by].minimum / width) * width
+            buckets.setdefault(key, RunningStats()).merge(chunk["stats"][column])
+        return sorted(buckets.items())
@@ -0,0 +1,566 @@
+# -*- coding: utf-8 -*-
+"""
+Per-batch processing between reading samples and writing/buffering them.
+
+The config's ``[[transforms]]`` tables declare a chain of stages, run in
+order on every batch aves.acquisition.Acquisition reads, before it is
+recorded and plotted:
+
+    [[transforms]]
+    type = "calibrate"          # value * gain + offset
+    columns = ["Sensor 1", "Sensor 2"]
+    gain = 1.02
+    offset = -0.05
+
+    [[transforms]]
+    type = "clip"               # keep values within [min, max]
+    columns = ["Sensor 1"]
+    min = 0.0
+
+    [[transforms]]
+    type = "decimate"           # keep one sample out of every `factor`
+    factor = 4
+
+    [[transforms]]
+    type = "expression"         # a new column, computed from others
+    column = "Power"
+    expression = "`Sensor 1` * `Sensor 2` / 47.0"
+
+A stage works on the whole batch at once, as one numpy array per column
+(see to_columns()), so its cost is a few vectorized operations per batch
+rather than Python code per sample. Columns declared with a ``dtype``
+(see aves.io) stay raw counts all the way to the buffers and the
+recording, which convert them, so stages may not change them: a
+calibrate or clip stage on one is rejected when the config is read.
+Expressions and filters read such columns converted to their units, like
+everything downstream of the buffers does, and add a column in those
+units.
+
+Stages are classes registered under their ``type`` with @stage; each
+one is built from its config table and called with the batch's columns,
+returning the columns to pass on (possibly with fewer samples, or new
+columns). Stages that add a column name it in their ``column`` entry,
+so the rest of aves can tell which columns there will be (see
+added_columns()). TransformPipeline runs them in turn, recording the
+time each one takes in the acquisition's metrics (see aves.metrics).
+
+Expressions (see CompiledExpression) are limited to arithmetic on
+columns, numbers and a few numpy functions, checked when the config is
+read and compiled once; each batch then evaluates them once, on whole
+columns.
+
+The filters (see Filter) smooth a noisy ``input`` column into a new
+``column``, carrying their state from one batch to the next, so the
+result is the same however the samples were split into batches:
+
+    [[transforms]]
+    type = "lowpass"            # also moving_average, ema, median
+    input = "Sensor 1"
+    column = "Sensor 1 (filtered)"
+    cutoff = 5.0                # Hz
+    sample_rate = 100.0         # Hz
+
+Recursive filters (ema, lowpass) are written as first order recursions
+``y[n] = x[n] + pole * y[n - 1]`` (a biquad being two of them with
+complex poles), whose closed form numpy computes with a cumulative sum
+(see _first_order()).
+"""
+
+import ast
+import math
+import re
+import time
+
+import numpy as np
+
+from aves.utils import require_keys
+
+#: Stage classes by their config ``type``, see stage().
+STAGES = {}
+
+
+def stage(name):
+    "Class decorator registering a stage under the config type ``name``."
+    def register(cls):
+        cls.type = name
+        STAGES[name] = cls
+        return cls
+    return register
+
+
+def to_columns(samples):
+    "A batch of samples (dicts) as one numpy array per column."
+    if not samples:
+        return {}
+    return {name: np.asarray([sample[name] for sample in samples]) for name in samples[0]}
+
+
+def to_rows(columns):
+    "The inverse of to_columns(): a list of samples (dicts)."
+    names = list(columns)
+    values = [columns[name].tolist() for name in names]
+    return [dict(zip(names, row)) for row in zip(*values)]
+
+
+def batch_length(columns):
+    "How many samples a batch given as columns has."
+    return len(next(iter(columns.values()))) if columns else 0
+
+
+def added_columns(transforms):
+    "Names of the columns the config's ``transforms`` tables add."
+    return [table["column"] for table in transforms
+            if isinstance(table, dict) and isinstance(table.get("column"), str)]
+
+
+def _positive_int(config, key, where):
+    value = require_keys(config, [key], where)[key]
+    if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+        raise ValueError(f"{where}'s '{key}' must be a positive integer")
+    return value
+
+
+#: Functions expressions may call, by name.
+FUNCTIONS = {
+    "abs": np.abs, "sqrt": np.sqrt, "exp": np.exp, "log": np.log, "log10": np.log10,
+    "sin": np.sin, "cos": np.cos, "tan": np.tan, "arctan2": np.arctan2,
+    "hypot": np.hypot, "minimum": np.minimum, "maximum": np.maximum, "clip": np.clip,
+}
+_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+              ast.UAdd, ast.USub)
+_BACKTICKED = re.compile(r"`([^`]+)`")
+
+
+class CompiledExpression(object):
+    """
+    An arithmetic expression over columns, e.g. ``(a - b) / 2`` or
+    ```Sensor 1` * `Sensor 2` / 47.0``: numbers, the operators + - * / //
+    % **, calls to FUNCTIONS, and column names, written as they are or,
+    if they are not valid Python names (e.g. they have spaces), between
+    backticks. Anything else (attributes, subscripts, other names...) is
+    rejected when it is compiled.
+
+    Called with a batch's columns, it returns the expression's value for
+    every sample, as a float64 array.
+    """
+
+    def __init__(self, text, where="config.toml's 'transforms' entry"):
+        self.text = text
+        backticked = []
+
+        def placeholder(match):
+            backticked.append(match.group(1))
+            return f"_backticked_{len(backticked) - 1}"
+
+        try:
+            tree = ast.parse(_BACKTICKED.sub(placeholder, text).strip(), mode="eval")
+        except SyntaxError as error:
+            raise ValueError(f"{where}'s expression {text!r} is not valid: {error.msg}") from None
+        #: The columns the expression reads, in order of first use
+        self.columns = []
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Call):
+                if (not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS
+                        or node.keywords):
+                    raise ValueError(
+                        f"{where}'s expression {text!r} may only call "
+                        + ", ".join(sorted(FUNCTIONS)) + ", without keyword arguments")
+                node.func.id = "_function_" + node.func.id
+                node.func.checked = True
+            elif isinstance(node, ast.Name):
+                if getattr(node, "checked", False):
+                    continue
+                name = node.id
+                match = re.fullmatch(r"_backticked_(\d+)", name)
+                if match and int(match.group(1)) < len(backticked):
+                    name = backticked[int(match.group(1))]
+                if name not in self.columns:
+                    self.columns.append(name)
+                node.id = f"_column{self.columns.index(name)}"
+            elif isinstance(node, ast.Constant):
+                if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                    raise ValueError(
+                        f"{where}'s expression {text!r} may only use numbers, "
+                        f"not {node.value!r}")
+            elif not isinstance(node, (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Load)
+                                + _OPERATORS):
+                raise ValueError(
+                    f"{where}'s expression {text!r} may only use numbers, columns, "
+                    f"arithmetic and function calls")
+        self._code = compile(tree, where, "eval")
+        self._namespace = {"__builtins__": {}}
+        self._namespace.update(
+            {"_function_" + name: function for name, function in FUNCTIONS.items()})
+
+    def __call__(self, columns):
+        namespace = dict(self._namespace)
+        for i, name in enumerate(self.columns):
+            namespace[f"_column{i}"] = np.asarray(columns[name], dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            values = eval(self._code, namespace)
+        return np.broadcast_to(
+            np.asarray(values, dtype=np.float64), (batch_length(columns),)).copy()
+
+
+class Stage(object):
+    """
+    Base class of the stages. ``where`` names the stage's config table in
+    error messages.
+    """
+
+    def __init__(self, config, where):
+        self.where = where
+        #: Factors of the columns read raw, see bind()
+        self.scales = {}
+
+    @staticmethod
+    def _columns(config, where):
+        "The stage's ``columns`` entry, checked."
+        columns = require_keys(config, ["columns"], where)["columns"]
+        if isinstance(columns, str) or not all(isinstance(c, str) for c in columns):
+            raise ValueError(f"{where}'s 'columns' must be a list of column names")
+        return list(columns)
+
+    def _numeric(self, columns, name):
+        if name not in columns:
+            raise ValueError(f"{self.where} refers to the unknown column {name!r}")
+        values = columns[name]
+        if values.dtype.kind not in "biuf":
+            raise ValueError(f"{self.where} can only transform numeric columns, "
+                             f"and {name!r} is not")
+        return values
+
+    def _values(self, columns, name):
+        """
+        Like _numeric(), but converted to the column's units if it is read
+        raw (see bind()).
+        """
+        values = self._numeric(columns, name)
+        if name in self.scales:
+            return values * self.scales[name]
+        return values
+
+    def changed_columns(self):
+        "Names of the existing columns the stage changes the values of."
+        return []
+
+    def bind(self, scales):
+        """
+        Called by TransformPipeline with the factors of the columns read
+        raw (see aves.io's dtype). Those are stored and recorded raw, and
+        converted on the way out, so a stage must not change them.
+        """
+        for name in self.changed_columns():
+            if name in scales:
+                raise ValueError(
+                    f"{self.where} cannot change {name!r}, which is kept in its raw "
+                    f"dtype: add a column computed from it with an expression stage "
+                    f"instead, or drop its dtype")
+        self.scales = scales
+
+    def __call__(self, columns):
+        raise NotImplementedError
+
+
+@stage("calibrate")
+class Calibrate(Stage):
+    """
+    ``value * gain + offset`` (both optional), e.g. to correct a sensor's
+    offset and gain, or to convert units.
+    """
+
+    def __init__(self, config, where):
+        super().__init__(config, where)
+        self.columns = self._columns(config, where)
+        self.gain = float(config.get("gain", 1.0))
+        self.offset = float(config.get("offset", 0.0))
+
+    def changed_columns(self):
+        return self.columns
+
+    def __call__(self, columns):
+        for name in self.columns:
+            columns[name] = self._numeric(columns, name) * self.gain + self.offset
+        return columns
+
+
+@stage("clip")
+class Clip(Stage):
+    "Limits values to ``min`` and/or ``max``."
+
+    def __init__(self, config, where):
+        super().__init__(config, where)
+        self.columns = self._columns(config, where)
+        if "min" not in config and "max" not in config:
+            raise ValueError(f"{where} needs a 'min', a 'max' or both")
+        self.low = config.get("min")
+        self.high = config.get("max")
+
+    def changed_columns(self):
+        return self.columns
+
+    def __call__(self, columns):
+        for name in self.columns:
+            columns[name] = np.clip(self._numeric(columns, name), self.low, self.high)
+        return columns
+
+
+@stage("decimate")
+class Decimate(Stage):
+    """
+    Keeps one sample out of every ``factor``, counting across batches, to
+    lower the rate of a sensor that samples faster than needed.
+    """
+
+    def __init__(self, config, where):
+        super().__init__(config, where)
+        self.factor = _positive_int(config, "factor", where)
+        # Samples to skip before the next one kept
+        self._skip = 0
+
+    def __call__(self, columns):
+        length = batch_length(columns)
+        keep = slice(self._skip, None, self.factor)
+        self._skip = (self._skip - length) % self.factor
+        return {name: values[keep] for name, values in columns.items()}
+
+
+@stage("expression")
+class Expression(Stage):
+    """
+    Adds the column ``column``, computed from other columns by an
+    ``expression`` (see CompiledExpression), e.g. a power out of a
+    voltage and a current.
+    """
+
+    def __init__(self, config, where):
+        super().__init__(config, where)
+        require_keys(config, ["column", "expression"], where)
+        self.column = config["column"]
+        if not isinstance(self.column, str):
+            raise ValueError(f"{where}'s 'column' must be the new column's name")
+        self.expression = CompiledExpression(str(config["expression"]), where)
+
+    def changed_columns(self):
+        return [self.column]
+
+    def __call__(self, columns):
+        inputs = {name: self._values(columns, name) for name in self.expression.columns}
+        columns[self.column] = self.expression({**columns, **inputs})
+        return columns
+
+
+#: How much larger than the batch's values the cumulative sum in
+#: _first_order() may grow before the batch is split into blocks.
+_MAX_GROWTH = 1e100
+
+
+def _first_order(values, pole, state):
+    """
+    ``y[n] = values[n] + pole * y[n - 1]``, starting from y[-1] = state,
+    for |pole| < 1. Returns y and its last value, the next state.
+
+    Unrolled, ``y[n] = pole**n * (pole * state + sum(values[k] / pole**k
+    for k <= n))``: one cumulative sum, in blocks short enough that
+    pole**-k stays far from overflowing.
+    """
+    if pole == 0:
+        return values.copy(), values[-1] if len(values) else state
+    block = max(1, int(math.log(_MAX_GROWTH) / -math.log(abs(pole))))
+    out = np.empty(len(values), dtype=np.result_type(values, pole))
+    for start in range(0, len(values), block):
+        chunk = values[start:start + block]
+        powers = pole ** np.arange(len(chunk))
+        out[start:start + len(chunk)] = powers * (
+            pole * state + np.cumsum(chunk / powers))
+        state = out[start + len(chunk) - 1]
+    return out, state
+
+
+class Filter(Stage):
+    """
+    Base class of the streaming filters: each adds ``column``, the
+    ``input`` column filtered (as float64, in its converted units). Subclasses implement
+    start(), called with the very first value to set their state as if
+    the input had always been that value, and filter(), called with each
+    batch's values.
+    """
+
+    def __init__(self, config, where):
+        super().__init__(config, where)
+        require_keys(config, ["input", "column"], where)
+        self.input = config["input"]
+        self.column = config["column"]
+        if not isinstance(self.column, str):
+            raise ValueError(f"{where}'s 'column' must be the new column's name")
+        self._started = False
+
+    def changed_columns(self):
+        return [self.column]
+
+    def __call__(self, columns):
+        values = self._values(columns, self.input).astype(np.float64)
+        if not self._started:
+            self.start(values[0])
+            self._started = True
+        columns[self.column] = self.filter(values)
+        return columns
+
+    def start(self, value):
+        raise NotImplementedError
+
+    def filter(self, values):
+        raise NotImplementedError
+
+
+class _WindowFilter(Filter):
+    "A filter over the latest ``window`` values, this batch's and earlier ones."
+
+    def __init__(self, config, where):
+        super().__init__(config, where)
+        self.window = _positive_int(config, "window", where)
+
+    def start(self, value):
+        # The window - 1 values before the next batch's
+        self._tail = np.full(self.window - 1, value)
+
+    def filter(self, values):
+        extended = np.concatenate([self._tail, values])
+        self._tail = extended[len(extended) - (self.window - 1):]
+        return self.over_windows(extended)
+
+
+@stage("moving_average")
+class MovingAverage(_WindowFilter):
+    "The mean of the latest ``window`` values (a boxcar filter)."
+
+    def over_windows(self, extended):
+        sums = np.concatenate([[0.0], np.cumsum(extended)])
+        return (sums[self.window:] - sums[:-self.window]) / self.window
+
+
+@stage("median")
+class Median(_WindowFilter):
+    "The median of the latest ``window`` values, which ignores lone spikes."
+
+    def over_windows(self, extended):
+        windows = np.lib.stride_tricks.sliding_window_view(extended, self.window)
+        return np.median(windows, axis=1)
+
+
+@stage("ema")
+class ExponentialMovingAverage(Filter):
+    """
+    ``y[n] = alpha * x[n] + (1 - alpha) * y[n - 1]``, with 0 < ``alpha``
+    <= 1: the smaller, the smoother.
+    """
+
+    def __init__(self, config, where):
+        super().__init__(config, where)
+        self.alpha = float(require_keys(config, ["alpha"], where)["alpha"])
+        if not 0 < self.alpha <= 1:
+            raise ValueError(f"{where}'s 'alpha' must be within (0, 1]")
+
+    def start(self, value):
+        self._state = value
+
+    def filter(self, values):
+        out, self._state = _first_order(self.alpha * values, 1 - self.alpha, self._state)
+        return out
+
+
+@stage("lowpass")
+class LowPass(Filter):
+    """
+    A second order (biquad) Butterworth low-pass filter, or of quality
+    factor ``q`` if given, letting through what changes slower than
+    ``cutoff`` Hz, for samples taken at ``sample_rate`` Hz.
+    """
+
+    def __init__(self, config, where):
+        super().__init__(config, where)
+        require_keys(config, ["cutoff", "sample_rate"], where)
+        cutoff = float(config["cutoff"])
+        sample_rate = float(config["sample_rate"])
+        q = float(config.get("q", 1 / math.sqrt(2)))
+        if not 0 < cutoff < sample_rate / 2 or q <= 0:
+            raise ValueError(
+                f"{where}'s 'cutoff' must be positive and below half the 'sample_rate', "
+                f"and its 'q' positive")
+        # The low-pass biquad of the "Audio EQ Cookbook"
+        w0 = 2 * math.pi * cutoff / sample_rate
+        alpha = math.sin(w0) / (2 * q)
+        a0 = 1 + alpha
+        b = np.array([1 - math.cos(w0), 2 * (1 - math.cos(w0)), 1 - math.cos(w0)]) / (2 * a0)
+        self._b = b
+        # 1 / (1 + a1 z^-1 + a2 z^-2) as two first order sections
+        self._poles = np.roots([1, -2 * math.cos(w0) / a0, (1 - alpha) / a0]).astype(complex)
+
+    def start(self, value):
+        self._previous = np.full(2, value)
+        gain = self._b.sum() * value
+        self._states = []
+        for pole in self._poles:
+            gain = gain / (1 - pole)
+            self._states.append(gain)
+
+    def filter(self, values):
+        extended = np.concatenate([self._previous, values])
+        self._previous = extended[-2:]
+        out = (self._b[0] * extended[2:] + self._b[1] * extended[1:-1]
+               + self._b[2] * extended[:-2]).astype(complex)
+        for i, pole in enumerate(self._poles):
+            out, self._states[i] = _first_order(out, pole, self._states[i])
+        return out.real
+
+
+class TransformPipeline(object):
+    """
+    Runs a batch through stages in order (see the module docstring).
+
+    Args:
+        stages (list): Callables taking and returning a batch's columns.
+        scales (dict): Factors to convert the columns read raw to their
+            units with (see aves.io's dtype), handed to each Stage.
+    """
+
+    def __init__(self, stages, scales=None):
+        self.stages = list(stages)
+        for run in self.stages:
+            if isinstance(run, Stage):
+                run.bind(scales or {})
+        #: What each stage's time is recorded as, see __call__()
+        self.names = []
+        for run in self.stages:
+            name = "transform:" + getattr(run, "type", type(run).__name__)
+            repeats = sum(1 for other in self.names if other.split("#")[0] == name)
+            self.names.append(f"{name}#{repeats + 1}" if repeats else name)
+
+    @classmethod
+    def from_config(cls, transforms, scales=None, config_file="config.toml"):
+        "Builds the stages declared in the config's ``transforms`` list."
+        stages = []
+        for i, table in enumerate(transforms):
+            where = f"{config_file}'s 'transforms[{i}]' entry"
+            kind = require_keys(table, ["type"], where)["type"]
+            if kind not in STAGES:
+                raise ValueError(
+                    f"{where} has the unknown type {kind!r}: choose among "
+                    + ", ".join(sorted(STAGES)))
+            stages.append(STAGES[kind](table, where))
+        return cls(stages, scales=scales)
+
+    def __call__(self, columns, metrics=None):
+        """
+        Runs columns through the stages. Given an aves.metrics.Metrics,
+        records the time each stage takes in it, as "transform:<type>"
+        ("transform:<type>#2" for the second stage of a type, and so on).
+        """
+        for name, run in zip(self.names, self.stages):
+            if not batch_length(columns):
+                break
+            start = time.perf_counter_ns()
+            columns = run(columns)
+            if metrics is not None:
+                metrics.record(name, time.perf_counter_ns() - start)
+        return columns
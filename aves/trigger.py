@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Triggered recording: instead of writing every sample, keep the latest
+ones in memory and write only the samples around events, each event to
+a file of its own, so that disk use grows with the number of events
+rather than with how long acquisition runs.
+
+The config's ``[trigger]`` section turns recording into triggered
+recording (see aves.wiring.build_output_device):
+
+    [trigger]
+    column = "Sensor 1"
+    above = 2.5           # fire when the column rises to 2.5 or more
+    pre_samples = 500     # samples before the event to keep
+    post_samples = 2000   # samples from the event on to keep
+
+Instead of ``above``, ``below`` fires when the column falls to a value
+or less, and ``rising`` (``falling``) when it rises (falls) by at least
+that much from one sample to the next. Levels are in the column's
+converted units. Whatever the condition, the trigger can also be fired
+from outside (TriggeredWriter.fire()), e.g. with the "t" key on the
+aves.realtime plot, or POST /api/trigger on aves.web.
+
+The segment around the n-th event goes to ``<outfile>-<n>.txt`` (e.g.
+``data/run-001.txt`` for ``--outfile data/run.txt``), a recording like
+any other. While a segment is being written, the trigger is not
+re-armed: a segment is at most pre_samples + post_samples long.
+"""
+
+import collections
+import logging
+import os
+
+import numpy as np
+
+from aves.io import WriteSensorFile
+from aves.utils import require_keys
+
+logger = logging.getLogger(__name__)
+
+#: Conditions a [trigger] section may give, see the module docstring.
+CONDITIONS = ("above", "below", "rising", "falling")
+
+
+class Trigger(object):
+    """
+    Finds where the condition of a ``[trigger]`` section (see the module
+    docstring) is first met in a batch of the column's values. Only the
+    crossing fires it: a column that stays above the level does not fire
+    again.
+    """
+
+    def __init__(self, config, where="config.toml's 'trigger' section"):
+        require_keys(config, ["column"], where)
+        self.column = config["column"]
+        given = [condition for condition in CONDITIONS if condition in config]
+        if len(given) != 1:
+            raise ValueError(
+                f"{where} needs exactly one of " + ", ".join(repr(c) for c in CONDITIONS))
+        self.condition = given[0]
+        self.level = float(config[self.condition])
+        # The value before the batch being looked at
+        self._previous = None
+
+    def _met(self, values, previous):
+        "Whether the condition holds at each value, previous being the one before."
+        if self.condition == "above":
+            return values >= self.level
+        if self.condition == "below":
+            return values <= self.level
+        steps = np.diff(values, prepend=previous)
+        return steps >= self.level if self.condition == "rising" else steps <= -self.level
+
+    def first(self, values):
+        """
+        Index of the first of values (the next ones of the column, as a
+        numpy array) that fires the trigger, or None.
+        """
+        if not len(values):
+            return None
+        previous = values[0] if self._previous is None else self._previous
+        met = self._met(values, previous)
+        if self.condition in ("above", "below"):
+            # Only where it starts to hold
+            before = np.concatenate([self._met(np.asarray([previous]), previous), met[:-1]])
+            met &= ~before
+        self._previous = values[-1]
+        fired = np.flatnonzero(met)
+        return int(fired[0]) if len(fired) else None
+
+    def skip(self, values):
+        """
+        Goes past values without firing, e.g. while a segment is being
+        written, so that a column already above the level then does not
+        fire once it is over.
+        """
+        if len(values):
+            self._previous = values[-1]
+
+
+def segment_filename(outfile, number):
+    "Where the number-th segment of a triggered recording to outfile goes."
+    root, extension = os.path.splitext(outfile)
+    return f"{root}-{number:03d}{extension or '.txt'}"
+
+
+class TriggeredWriter(object):
+    """
+    Stands in for an aves.io.WriteSensorFile (same write() and context
+    manager), writing only the samples around trigger events, each
+    segment with a WriteSensorFile of its own (see the module docstring).
+
+    Args:
+        filename (str): The recording's name, from which the segments'
+            are made (see segment_filename()). None to write nothing.
+        config (dict): The config's ``output`` section.
+        trigger_config (dict): The config's ``trigger`` section.
+        scales (dict): As for WriteSensorFile; also applied to the
+            trigger column before comparing it to the level.
+    """
+
+    def __init__(self, filename, config, trigger_config, scales=None):
+        require_keys(config, ["columns"], "config.toml's 'output' section")
+        where = "config.toml's 'trigger' section"
+        require_keys(trigger_config, ["pre_samples", "post_samples"], where)
+        self.pre_samples = trigger_config["pre_samples"]
+        self.post_samples = trigger_config["post_samples"]
+        for name in ("pre_samples", "post_samples"):
+            value = trigger_config[name]
+            if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+                raise ValueError(f"{where}'s '{name}' must be a whole number of samples")
+        if self.post_samples < 1:
+            raise ValueError(f"{where}'s 'post_samples' must be at least 1")
+        self.filename = filename
+        self.trigger = Trigger(trigger_config, where)
+        self._config = config
+        self._scales = scales or {}
+        #: Filenames of the segments written so far
+        self.segments = []
+        # Samples before a possible event
+        self._pre = collections.deque(maxlen=self.pre_samples)
+        # The segment being written, and how many samples it still takes
+        self._segment = None
+        self._remaining = 0
+        self._fired = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, value, traceback):
+        self.close()
+        return False
+
+    def fire(self):
+        """
+        Fires the trigger at the next sample written, whatever the
+        column's value. Safe to call from any thread.
+        """
+        self._fired = True
+
+    def write(self, samples):
+        samples = list(samples)
+        # aves.wiring.build_output_device checks the column against the config
+        assert not samples or self.trigger.column in samples[0], self.trigger.column
+        values = np.asarray([sample[self.trigger.column] for sample in samples], dtype=float)
+        values = values * self._scales.get(self.trigger.column, 1.0)
+        start = 0
+        while start < len(samples):
+            if self._segment is not None:
+                taken = samples[start:start + self._remaining]
+                self._segment.write(taken)
+                self._remaining -= len(taken)
+                if not self._remaining:
+                    self._close_segment()
+                self.trigger.skip(values[start:start + len(taken)])
+                start += len(taken)
+                continue
+            if self._fired:
+                self._fired = False
+                fired = 0
+            else:
+                fired = self.trigger.first(values[start:])
+            if fired is None:
+                self._pre.extend(samples[start:])
+                break
+            self._pre.extend(samples[start:start + fired])
+            self._open_segment()
+            start += fired
+
+    def comment(self, text):
+        "Writes a comment line into the segment being written, if any."
+        if self._segment is not None:
+            self._segment.comment(text)
+
+    def _open_segment(self):
+        self.segments.append(
+            segment_filename(self.filename, len(self.segments) + 1) if self.filename else None)
+        logger.info("Trigger fired: recording %s", self.segments[-1])
+        self._segment = WriteSensorFile(self.segments[-1], self._config, scales=self._scales)
+        self._segment.__enter__()
+        self._segment.write(list(self._pre))
+        self._pre.clear()
+        self._remaining = self.post_samples
+
+    def _close_segment(self):
+        self._segment.__exit__(None, None, None)
+        self._segment = None
+
+    def close(self):
+        "Closes the segment being written, if any, short as it may be."
+        if self._segment is not None:
+            self._close_segment()
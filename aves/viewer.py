@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+The plots of aves.realtime in a process of their own
+(``python -m aves.realtime --gui-process ...``).
+
+Normally the acquisition loop runs from the GUI's refresh timer, so
+anything that holds the GUI up (resizing or dragging the window, a slow
+redraw) holds up reading the serial port too. With ViewerProcess, the
+acquiring process instead shares its buffers through shared memory (see
+aves.sharedbuffers) and reads as fast as the device sends, without a
+GUI, while a second process attaches to the buffers and draws whatever
+is newest at the GUI's own refresh rate (``refresh_time_ms`` in the
+config's gui section). Nothing the viewer does can make acquisition
+wait.
+
+The keys of the plot still work: "+", "-" and "t" (see aves.gui) are
+sent back over a queue, and the acquiring process runs their callbacks
+whenever it calls ViewerProcess.poll(), between batches.
+
+Once acquisition is over, the last samples stay on screen until the
+window is closed, unless acquisition ended with an error, which closes
+the window right away.
+
+The viewer only plots the shared, numeric columns of the window, not
+the coarser history of --history_tiers.
+"""
+
+import multiprocessing
+import queue
+
+#: Seconds to wait for the viewer to show its window.
+STARTUP_TIMEOUT = 60
+
+
+def _view(config, shm_name, events, done):
+    "What the viewer process runs, until its window is closed."
+    # Imported here: the acquiring process need not set matplotlib up
+    from aves.gui import SensorViewerGUI
+    from aves.sharedbuffers import SharedBuffersReader
+
+    with SharedBuffersReader(shm_name, creator_tracker=True) as reader:
+        window = SensorViewerGUI(
+            config,
+            on_plot_window_scale=lambda factor: events.put(("scale", factor)),
+            on_trigger=lambda: events.put(("trigger", None)))
+        events.put(("ready", None))
+        seq = None
+
+        def tick():
+            nonlocal seq
+            finished = done.is_set()
+            if reader.seq != seq:
+                seq = reader.seq
+                data = reader.snapshot()
+                if len(data[config["x_column"]]):
+                    window.render(data)
+            # The last samples stay on screen until the window is closed
+            return not finished
+        window.run(tick)
+
+
+class ViewerProcess(object):
+    """
+    Runs an aves.gui.SensorViewerGUI in a process of its own, plotting
+    the aves.sharedbuffers.SharedDataBuffers named shm_name (see the
+    module docstring). Starting it waits until the window is shown.
+
+    Args:
+        config (dict): The config's 'gui' section.
+        shm_name (str): Name of the shared buffers to plot.
+        on_plot_window_scale, on_trigger: As in SensorViewerGUI, but
+            called from poll(), in this process.
+    """
+
+    def __init__(self, config, shm_name, on_plot_window_scale=None, on_trigger=None):
+        self._on_plot_window_scale = on_plot_window_scale
+        self._on_trigger = on_trigger
+        # A fresh interpreter, rather than a fork of one that may already
+        # have set matplotlib or the serial port up
+        context = multiprocessing.get_context("spawn")
+        self._events = context.Queue()
+        self._done = context.Event()
+        self._process = context.Process(
+            target=_view, args=(config, shm_name, self._events, self._done),
+            name="aves-viewer")
+        self._process.start()
+        self._wait_until_ready()
+
+    def _wait_until_ready(self):
+        waited = 0.0
+        while True:
+            try:
+                event, _ = self._events.get(timeout=0.1)
+            except queue.Empty:
+                waited += 0.1
+                if not self._process.is_alive() or waited > STARTUP_TIMEOUT:
+                    self._process.terminate()
+                    raise RuntimeError("The viewer process did not start")
+                continue
+            if event == "ready":
+                return
+
+    def poll(self):
+        "Runs the callbacks of the keys pressed on the plot since the last poll."
+        while True:
+            try:
+                event, value = self._events.get_nowait()
+            except queue.Empty:
+                return
+            if event == "scale" and self._on_plot_window_scale is not None:
+                self._on_plot_window_scale(value)
+            elif event == "trigger" and self._on_trigger is not None:
+                self._on_trigger()
+
+    @property
+    def closed(self):
+        "Whether the window has been closed by the user"
+        return not self._process.is_alive()
+
+    def close(self, wait=True):
+        """
+        Tells the viewer acquisition is over, and waits until the user
+        closes its window, or closes it right away if not wait.
+        """
+        self._done.set()
+        if not wait:
+            self._process.terminate()
+        self._process.join()
+        self._events.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, value, traceback):
+        # After an error, the last samples are not worth waiting for
+        self.close(wait=typ is None)
+        return False
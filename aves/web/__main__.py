@@ -2,8 +2,11 @@
 """
 Runs a small local web server that acquires data exactly like
 aves.realtime, but streams it to a browser (aves/web/server.py) instead
-of a matplotlib window. Acquisition runs in a background thread; the
-web server owns the main thread. Neither one is aware of the other
+of a matplotlib window. The web server owns the main thread. Acquisition
+from a serial port runs as a task on the server's event loop (see
+aves.acquisition.AsyncAcquisition); anything else, e.g. replaying a
+recording or a serial port on Windows (see can_wait_on there), runs in a
+background thread. Neither one is aware of the other
 beyond the Broadcaster: acquisition calls broadcaster.publish(data)
 after each batch, same "here is the data, render it however" boundary
 aves.gui.SensorViewerGUI.render() already uses.
@@ -18,18 +21,22 @@ does and doesn't protect against.
 """
 
 import argparse
+import asyncio
 import contextlib
 import datetime
 import os
 import secrets
 import threading
+import time
 
 import uvicorn
 
-from aves import io
-from aves.acquisition import Acquisition
+from aves.acquisition import Acquisition, AdaptiveBatching, AsyncAcquisition, can_wait_on
+from aves.memory import MemoryBudget, parse_policy, parse_size
 from aves.utils import parse_config, require_keys
-from aves.wiring import build_input_device, build_output_device
+from aves.wiring import (
+    build_alarms, build_buffers, build_gap_detector, build_input_device,
+    build_output_device, build_transforms)
 from aves.web.server import create_app
 
 #: How long to wait for the acquisition thread to notice a stop request
@@ -49,6 +56,11 @@ def _parse_arguments():
                              "Windows, /dev/ttyUSB0 or /dev/ttyACM0 on "
                              "Linux, /dev/cu.usbmodemXXXX on macOS), or a "
                              "path to a previously recorded file to replay")
+    parser.add_argument('--follow', dest='follow', action="store_true",
+                        help="when --port is a recorded file, keep reading "
+                             "lines appended to it (e.g. by another aves "
+                             "process still recording it) instead of "
+                             "stopping at its end")
     parser.add_argument('--no-save', dest='save', action="store_false",
                         help="skip saving acquired data to a file")
     parser.add_argument('--time', dest='tmeas', default=float('inf'),
@@ -61,10 +73,61 @@ def _parse_arguments():
                         type=int, default=10,
                         help="samples to collect before publishing an "
                              "update to connected browsers (default:10)")
+    parser.add_argument('--target-latency', dest='target_latency', default=None,
+                        type=float,
+                        help="instead of a fixed --plot_every_n_samples, "
+                             "size batches to the measured sample rate so "
+                             "that a batch is published about every this many "
+                             "seconds (e.g. 0.1)")
+    parser.add_argument('--min-batch', dest='min_batch', default=1, type=int,
+                        help="with --target-latency, the fewest samples a "
+                             "batch waits for (default: 1)")
+    parser.add_argument('--max-batch', dest='max_batch', default=1000, type=int,
+                        help="with --target-latency, the most samples a "
+                             "batch may have (default: 1000)")
+    parser.add_argument('--batch-deadline', dest='batch_deadline', default=None,
+                        type=float,
+                        help="with --target-latency, the longest a batch "
+                             "waits for --min-batch samples, in seconds "
+                             "(default: four times the target latency)")
     parser.add_argument('--plot_win_size', dest='plot_win_size',
-                        type=int, default=200,
+                        type=int, default=None,
                         help="keeps in memory the given number of samples " +
-                             "(default:200 samples, use 0 for unlimited)")
+                             "(default:200 samples, use 0 for unlimited; " +
+                             "no cap with --plot_win_seconds); " +
+                             "can be changed later from the settings page")
+    parser.add_argument('--plot_win_seconds', dest='plot_win_seconds',
+                        type=float, default=None,
+                        help="keeps the samples within the given number of "
+                             "units of the gui's x_column (usually seconds) "
+                             "of the newest one instead, whatever the sample "
+                             "rate; --plot_win_size then caps how many "
+                             "samples that may be (default: no cap)")
+    parser.add_argument('--history_tiers', dest='history_tiers', default=None,
+                        help="besides the last --plot_win_size samples, plot "
+                             "a coarser history of the older ones, as "
+                             "width:buckets pairs of the gui's x_column, "
+                             "finest first (e.g. 1:3600,60:1440 keeps one "
+                             "point per second for an hour and one per "
+                             "minute for a day; default: no history)")
+    parser.add_argument('--shm-name', dest='shm_name', default=None,
+                        help="also share the buffered samples with other "
+                             "processes through shared memory under this "
+                             "name (see aves.sharedbuffers; needs a "
+                             "--plot_win_size other than 0)")
+    parser.add_argument('--memory-budget', dest='memory_budget', default=None,
+                        type=parse_size,
+                        help="keep the memory used by the plotted samples "
+                             "and by the messages queued for browsers under "
+                             "this size (e.g. 256M), freeing some as "
+                             "--memory-policy says once it is exceeded "
+                             "(default: no limit)")
+    parser.add_argument('--memory-policy', dest='memory_policy',
+                        default='clients,buffers', type=parse_policy,
+                        help="how to free memory beyond --memory-budget, as "
+                             "actions tried in order: 'clients' disconnects "
+                             "the browser furthest behind, 'buffers' halves "
+                             "the plot window (default: clients,buffers)")
     parser.add_argument('--config', dest='config_file', default='config.toml',
                         help="Arduino output columns, GUI layout and file format")
     parser.add_argument('--host', dest='host', default='127.0.0.1',
@@ -83,30 +146,162 @@ def _parse_arguments():
     args = parser.parse_args()
     if not args.save:
         args.outfile = None
+    if args.plot_win_size is None:
+        args.plot_win_size = 200 if args.plot_win_seconds is None else 0
     if args.plot_win_size == 0:
         args.plot_win_size = None
     return args
 
 
+def _data_message(buffers, seq, resync=False):
+    """
+    The message telling browsers about the buffers' samples after seq (see
+    DataBuffers.read_since), and the seq to pass next time:
+
+        {"__aves_delta__": true, "reset": ..., "seq": ..., "maxlen": ...,
+         "length": ..., "data": {column: [values...]}}
+
+    If "reset" is true, "data" is the whole window and replaces what the
+    browser had; otherwise it is appended to it, keeping the last
+    "length" samples: as many as the buffers hold now, however their
+    window is bounded (maxlen samples, or seconds of the x column with
+    --plot_win_seconds). A tiered history (see
+    aves.history) is reshaped by every append, so with one the whole
+    stitched view is sent every time.
+    """
+    if buffers.history is not None:
+        data, seq, reset = buffers.stitched(), buffers.seq, True
+    else:
+        data, seq, reset = buffers.read_since(None if resync else seq)
+    return {
+        "__aves_delta__": True,
+        "reset": reset,
+        "seq": seq,
+        "maxlen": buffers.maxlen,
+        "length": len(buffers),
+        "data": {name: values.tolist() for name, values in data.items()},
+    }, seq
+
+
+def _publish_new_samples(buffers, broadcaster, seq):
+    """
+    Publishes the samples appended after seq, or everything when a new
+    browser connected (see _data_message), if there is anything to send.
+    Returns the seq to pass next time.
+    """
+    resync = broadcaster.resync_requested.is_set()
+    if resync:
+        broadcaster.resync_requested.clear()
+    if buffers.data and (resync or buffers.seq != seq):
+        message, seq = _data_message(buffers, seq, resync=resync)
+        broadcaster.publish(message)
+    return seq
+
+
 def _acquisition_loop(acquisition, broadcaster, stop_event):
     """
     Runs in a background thread. Waits for the server's event loop to
     exist (broadcaster.publish() needs it) before doing anything else.
+    Publishes only the samples each step added, or everything when a new
+    browser connects (see _data_message).
     """
     broadcaster.ready.wait()
+    buffers = acquisition.buffers
+    seq = None
     while not stop_event.is_set():
         acquisition.step()
-        if acquisition.buffers.data:
-            broadcaster.publish(
-                {name: list(values) for name, values in acquisition.buffers.data.items()})
+        start = time.perf_counter_ns()
+        seq = _publish_new_samples(buffers, broadcaster, seq)
+        acquisition.metrics.record("publish", time.perf_counter_ns() - start)
+        if acquisition.should_stop():
+            break
+
+
+async def _acquisition_task(acquisition, broadcaster):
+    """
+    _acquisition_loop for an AsyncAcquisition, as a task on the server's
+    event loop: steps never block the loop, messages are published from
+    the loop's own thread, and cancelling the task stops it.
+    """
+    buffers = acquisition.buffers
+    seq = None
+    while True:
+        await acquisition.step_async()
+        start = time.perf_counter_ns()
+        seq = _publish_new_samples(buffers, broadcaster, seq)
+        acquisition.metrics.record("publish", time.perf_counter_ns() - start)
         if acquisition.should_stop():
             break
 
 
+class _AcquisitionThread:
+    "Runs _acquisition_loop in a daemon thread."
+
+    def __init__(self, acquisition, broadcaster):
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(
+            target=_acquisition_loop, args=(acquisition, broadcaster, self._stop_event),
+            daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, timeout):
+        "Returns whether it stopped within timeout seconds."
+        self._stop_event.set()
+        self._thread.join(timeout=timeout)
+        return not self._thread.is_alive()
+
+
+class _AcquisitionTask:
+    """
+    Runs _acquisition_task on the broadcaster's event loop, as soon as
+    there is one, with the same start()/stop() as _AcquisitionThread.
+    stop() must not be called from the loop's thread, as it waits for the
+    task to end.
+    """
+
+    def __init__(self, acquisition, broadcaster):
+        self._acquisition = acquisition
+        self._broadcaster = broadcaster
+        self._lock = threading.Lock()
+        self._task = None
+        self._stopped = False
+        self._finished = threading.Event()
+
+    def start(self):
+        self._broadcaster.call_when_ready(self._create_task)
+
+    def _create_task(self):
+        with self._lock:
+            if not self._stopped:
+                self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        try:
+            await _acquisition_task(self._acquisition, self._broadcaster)
+        finally:
+            self._finished.set()
+
+    def stop(self, timeout):
+        "Returns whether it stopped within timeout seconds."
+        with self._lock:
+            self._stopped = True
+            task = self._task
+        if task is None or self._finished.is_set():
+            return True
+        try:
+            self._broadcaster.loop.call_soon_threadsafe(task.cancel)
+        except RuntimeError:
+            # The loop is closed: the task will never run again
+            return True
+        return self._finished.wait(timeout)
+
+
 class AcquisitionManager:
     """
     Owns the lifecycle of the *current* acquisition (the input device, the
-    output file, and the background thread running _acquisition_loop), so
+    output file, and the task or background thread running it), so
     it can be stopped and restarted -- e.g. after the config file was
     edited and saved through the web settings page -- without tearing down
     the web server (and its already-connected browsers) itself.
@@ -124,61 +319,131 @@ class AcquisitionManager:
         self._args = args
         self._lock = threading.Lock()
         self._stack = None
-        self._thread = None
-        self._stop_event = None
+        self._runner = None
+        self._acquisition = None
 
     @property
     def is_running(self):
-        return self._thread is not None
+        return self._runner is not None
 
     def start(self, config):
         with self._lock:
-            if self._thread is not None:
+            if self._runner is not None:
                 raise RuntimeError(
                     "an acquisition is already running; stop it first")
             require_keys(
                 config, ["gui"], f"{self._args.config_file} (needed to run aves.web)")
+            batching = None
+            if self._args.target_latency is not None:
+                batching = AdaptiveBatching(
+                    self._args.target_latency, self._args.min_batch, self._args.max_batch,
+                    deadline=self._args.batch_deadline)
             stack = contextlib.ExitStack()
             try:
                 idev = build_input_device(
-                    self._args.port, config, config_file=self._args.config_file)
+                    self._args.port, config, config_file=self._args.config_file,
+                    follow=self._args.follow)
                 stack.enter_context(idev)
-                outfile = build_output_device(self._args.outfile, config)
+                transforms = build_transforms(
+                    config, idev, config_file=self._args.config_file)
+                outfile = build_output_device(
+                    self._args.outfile, config, scales=idev.column_scales,
+                    config_file=self._args.config_file)
                 if outfile is not None:
                     stack.enter_context(outfile)
+                gap_detector = build_gap_detector(
+                    config, idev, config_file=self._args.config_file)
+                alarms = build_alarms(config, idev, config_file=self._args.config_file)
+                buffers = stack.enter_context(build_buffers(
+                    self._args.plot_win_size, config,
+                    history_tiers=self._args.history_tiers,
+                    shm_name=self._args.shm_name,
+                    idev=idev,
+                    plot_win_seconds=self._args.plot_win_seconds,
+                    config_file=self._args.config_file))
             except Exception:
                 stack.close()
                 raise
-            buffers = io.DataBuffers(maxlen=self._args.plot_win_size)
-            acquisition = Acquisition(
+            memory_budget = None
+            if self._args.memory_budget is not None:
+                memory_budget = MemoryBudget(
+                    self._args.memory_budget, self._args.memory_policy,
+                    broadcaster=self._app.state.broadcaster,
+                    on_shrink=self._plot_window_shrunk)
+            # A serial port can be waited on by the server's own event
+            # loop (but not on Windows); anything else is read by a
+            # thread of its own
+            nonblocking = can_wait_on(idev)
+            acquisition = (AsyncAcquisition if nonblocking else Acquisition)(
                 idev=idev, buffers=buffers, outfile=outfile,
-                tmeas=self._args.tmeas, samples_per_step=self._args.plot_every_n_samples)
-            stop_event = threading.Event()
-            thread = threading.Thread(
-                target=_acquisition_loop,
-                args=(acquisition, self._app.state.broadcaster, stop_event),
-                daemon=True)
+                tmeas=self._args.tmeas, samples_per_step=self._args.plot_every_n_samples,
+                memory_budget=memory_budget, transforms=transforms,
+                batching=batching, gap_detector=gap_detector,
+                alarms=alarms, on_alarm=self._publish_alarm)
+            runner = (_AcquisitionTask if nonblocking else _AcquisitionThread)(
+                acquisition, self._app.state.broadcaster)
             self._stack = stack
-            self._stop_event = stop_event
-            self._thread = thread
+            self._runner = runner
+            self._acquisition = acquisition
             self._app.state.gui_config = config["gui"]
-            thread.start()
+            self._app.state.plot_window = self._args.plot_win_size
+            self._app.state.buffers = buffers
+            self._app.state.metrics = acquisition.metrics
+            self._app.state.alarms = alarms
+            runner.start()
 
     def stop(self):
         with self._lock:
-            if self._thread is None:
+            if self._runner is None:
                 return
-            self._stop_event.set()
-            self._thread.join(timeout=STOP_TIMEOUT_SECONDS)
-            if self._thread.is_alive():
+            if not self._runner.stop(STOP_TIMEOUT_SECONDS):
                 raise RuntimeError(
                     f"acquisition did not stop within {STOP_TIMEOUT_SECONDS}s "
                     "-- is it blocked on a serial read? check the config's "
                     "input.arduino.timeout")
             self._stack.close()
-            self._thread = None
-            self._stop_event = None
+            self._runner = None
             self._stack = None
+            self._acquisition = None
+            self._app.state.buffers = None
+            self._app.state.metrics = None
+            self._app.state.alarms = None
+
+    def _publish_alarm(self, event):
+        "Sends an alarm that fired or cleared to the browsers."
+        self._app.state.broadcaster.publish(dict(event, __aves_alarm__=True))
+
+    def _plot_window_shrunk(self, maxlen):
+        """
+        Shows the window the memory budget shrank the buffers to at GET
+        /api/plot_window. Called from the acquisition, which stop() may
+        be waiting for while holding the lock, so it does not take it.
+        """
+        self._app.state.plot_window = maxlen
+
+    def set_plot_window(self, maxlen):
+        """
+        Resizes the running acquisition's buffers to keep maxlen samples
+        (None: unlimited), and remembers it for later restarts. The resize
+        itself happens in the acquisition thread, between two steps.
+        """
+        with self._lock:
+            self._args.plot_win_size = maxlen
+            if self._acquisition is not None:
+                self._acquisition.call_soon(self._acquisition.buffers.set_maxlen, maxlen)
+        return maxlen
+
+    def trigger(self):
+        """
+        Fires the running acquisition's triggered recording (see
+        aves.trigger). Returns whether there was one to fire.
+        """
+        with self._lock:
+            outfile = self._acquisition.outfile if self._acquisition is not None else None
+            if not hasattr(outfile, "fire"):
+                return False
+            outfile.fire()
+            return True
 
     def restart(self, config_path=None):
         """
@@ -209,6 +474,8 @@ def main():
     app = create_app(config["gui"], config_path=args.config_file, token=token)
     manager = AcquisitionManager(app, args)
     app.state.restart_callback = manager.restart
+    app.state.plot_window_callback = manager.set_plot_window
+    app.state.trigger_callback = manager.trigger
 
     manager.start(config)
     url = f"http://{args.host}:{args.web_port}/"
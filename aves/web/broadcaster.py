@@ -11,38 +11,116 @@ publish() is called from the thread running the blocking acquisition
 loop (see aves.wiring/aves.acquisition), not from the event loop's own
 thread. asyncio.Queue is not thread-safe, so publish() schedules
 delivery via loop.call_soon_threadsafe() instead of touching the queues
-directly.
+directly -- unless it is called from the loop's own thread (e.g. by an
+aves.acquisition.AsyncAcquisition running as a task on it), which puts
+messages in the queues right away.
+
+Publishers that only send what changed since their last message (see
+aves.web.__main__) need to know when a client arrives that has seen
+none of it: subscribe() sets resync_requested, and the publisher
+answers by sending everything again.
+
+A client that reads slower than messages are published accumulates
+them in its queue. Each queue keeps count of the bytes it holds, for
+memory_usage() (see aves.memory), and drop() disconnects a client,
+freeing them: the client's queue is emptied and then handed CLOSE,
+telling whoever reads it to close the connection.
 """
 
 import asyncio
+import itertools
 import threading
+from collections import deque
+
+from aves.memory import approximate_size
+
+#: What a dropped client's queue gets instead of further messages.
+CLOSE = object()
+
+
+class _ClientQueue(asyncio.Queue):
+    "An asyncio.Queue that keeps count of the bytes of the messages in it."
+
+    def _init(self, maxsize):
+        super()._init(maxsize)
+        self.client = None
+        self.nbytes = 0
+        self._sizes = deque()
+
+    def put_sized(self, message, size):
+        "put_nowait(message), for a message of size bytes."
+        self.put_nowait(message)
+        self._sizes.append(size)
+        self.nbytes += size
+
+    def _get(self):
+        if self._sizes:
+            self.nbytes -= self._sizes.popleft()
+        return super()._get()
+
+    def close(self):
+        "Drops every queued message, then queues CLOSE."
+        while not self.empty():
+            self.get_nowait()
+        self.put_nowait(CLOSE)
 
 
 class Broadcaster:
     def __init__(self):
         self._loop = None
+        self._loop_thread = None
+        self._when_ready = []
+        self._ready_lock = threading.Lock()
         self._clients = set()
+        self._client_ids = itertools.count(1)
         #: Set once bind_loop() has run. A producer thread started before
         #: the server's event loop exists (e.g. an acquisition thread
         #: launched right before uvicorn.run()) should wait on this
         #: before calling publish(), instead of racing bind_loop().
         self.ready = threading.Event()
+        #: Set whenever a client subscribes. A publisher that sends deltas
+        #: should clear it and publish a full snapshot instead.
+        self.resync_requested = threading.Event()
 
     def bind_loop(self, loop=None):
         """
         Call once, from the event loop's own thread (e.g. at server
         startup), so publish() knows which loop to schedule delivery on.
         """
-        self._loop = loop if loop is not None else asyncio.get_running_loop()
-        self.ready.set()
+        with self._ready_lock:
+            self._loop = loop if loop is not None else asyncio.get_running_loop()
+            self._loop_thread = threading.get_ident()
+            self.ready.set()
+            for callback in self._when_ready:
+                self._loop.call_soon(callback)
+            self._when_ready = []
+
+    @property
+    def loop(self):
+        "The event loop bound by bind_loop() (None until then)."
+        return self._loop
+
+    def call_when_ready(self, callback):
+        """
+        Calls callback() in the event loop's thread, as soon as there is
+        one (see bind_loop). Safe to call from any thread, e.g. to start
+        a task on the loop before the server has started it.
+        """
+        with self._ready_lock:
+            if self._loop is None:
+                self._when_ready.append(callback)
+                return
+        self._loop.call_soon_threadsafe(callback)
 
     async def subscribe(self):
         """
         Registers a new client, returning the queue it should read
         published messages from. Call from the event loop's thread.
         """
-        queue = asyncio.Queue()
+        queue = _ClientQueue()
+        queue.client = next(self._client_ids)
         self._clients.add(queue)
+        self.resync_requested.set()
         return queue
 
     def unsubscribe(self, queue):
@@ -56,5 +134,34 @@ class Broadcaster:
         """
         if self._loop is None:
             raise RuntimeError("Broadcaster.bind_loop() was never called")
+        clients = list(self._clients)
+        if not clients:
+            return
+        size = approximate_size(message)
+        on_loop = threading.get_ident() == self._loop_thread
+        for queue in clients:
+            if on_loop:
+                queue.put_sized(message, size)
+            else:
+                self._loop.call_soon_threadsafe(queue.put_sized, message, size)
+
+    def memory_usage(self):
+        """
+        How far behind each client is: a list of {"client": id,
+        "messages": n, "bytes": n}. Safe to call from any thread, as an
+        estimate.
+        """
+        return [{"client": queue.client, "messages": queue.qsize(), "bytes": queue.nbytes}
+                for queue in list(self._clients)]
+
+    def drop(self, client):
+        """
+        Disconnects the client with the given id (see memory_usage()),
+        freeing its queued messages. Safe to call from any thread: the
+        client stops counting right away, and its queue is emptied in the
+        event loop's thread.
+        """
         for queue in list(self._clients):
-            self._loop.call_soon_threadsafe(queue.put_nowait, message)
+            if queue.client == client:
+                self._clients.discard(queue)
+                self._loop.call_soon_threadsafe(queue.close)
@@ -41,6 +41,35 @@ create_app(gui_config, token=...) returns a FastAPI app exposing:
    output through parse_config_text before writing, so a config the
    form can produce but this module's own reader would reject can
    never reach disk.
+ - GET/PUT /api/plot_window: how many samples the running acquisition
+   keeps for the charts ({"maxlen": n}, null meaning unlimited). PUT
+   resizes it right away, through whatever plot_window_callback the
+   caller wires up (aves.web.__main__ wires this to the running
+   acquisition's buffers; like restart, it reports itself unsupported
+   otherwise). This is runtime state, not part of the config file.
+ - GET /api/data?since=seq: the running acquisition's buffered samples
+   appended after seq, or all of them (see DataBuffers.read_since), for
+   scripts that would rather poll than hold a WebSocket open. "length"
+   is how many samples the buffers hold: a script appending the new
+   samples to what it already had should keep that many. It reads
+   app.state.buffers directly from the server's thread while the
+   acquisition thread appends to them, which DataBuffers' seqlock makes
+   safe without ever holding up the acquisition.
+ - GET /api/memory: the bytes held by each column of the running
+   acquisition's buffers and by each connected client's queue (see
+   aves.memory.report), to find out what a process that grew too large
+   spends its memory on.
+ - POST /api/trigger: fires the running acquisition's triggered
+   recording (see aves.trigger) through trigger_callback, as if its
+   condition had been met; 409 if the config has no [trigger] section.
+ - GET /api/metrics: how long each part of the running acquisition's
+   steps takes (read, transform and each of its stages, write, buffer,
+   publish) and how many samples and bytes it reads per second (see
+   aves.metrics).
+ - GET /api/alarms: the running acquisition's active alarms and latest
+   alarm events ({"active": [...], "events": [...]}, see
+   aves.alarms.Alarms.snapshot), empty without any. Events are also
+   streamed over /ws/data as they happen, marked "__aves_alarm__".
  - /, /settings.html: the frontend's two pages, rendered (not served
    verbatim) so the auth token can be embedded for the page's own JS to
    send back. /app.js, /settings.js, /style.css, /vendor/*: plain
@@ -72,8 +101,9 @@ from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
+from aves import memory
 from aves.utils import parse_config_text
-from aves.web.broadcaster import Broadcaster
+from aves.web.broadcaster import CLOSE, Broadcaster
 
 STATIC_DIR = Path(__file__).parent / "static"
 TOKEN_COOKIE = "aves_token"
@@ -97,6 +127,10 @@ class SettingsStructured(BaseModel):
     config: dict
 
 
+class PlotWindow(BaseModel):
+    maxlen: int | None = None
+
+
 def _token_matches(expected, given):
     return bool(given) and secrets.compare_digest(given, expected)
 
@@ -129,6 +163,20 @@ def create_app(gui_config, config_path=None, token=None):
     # endpoint reports restarting as unsupported rather than pretending
     # to succeed. Signature: restart_callback(config_path) -> gui_config.
     app.state.restart_callback = None
+    # Same idea for /api/plot_window: plot_window_callback(maxlen) ->
+    # maxlen resizes the running acquisition's buffers, and plot_window
+    # is what GET reports.
+    app.state.plot_window_callback = None
+    app.state.plot_window = None
+    # ... and for /api/trigger: trigger_callback() -> whether a triggered
+    # recording was running to fire
+    app.state.trigger_callback = None
+    # The running acquisition's aves.io.DataBuffers, for /api/data
+    app.state.buffers = None
+    # ... and its aves.metrics.Metrics, for /api/metrics
+    app.state.metrics = None
+    # ... and its aves.alarms.Alarms, for /api/alarms
+    app.state.alarms = None
 
     def require_token(request: Request):
         if app.state.token is None:
@@ -182,6 +230,11 @@ def create_app(gui_config, config_path=None, token=None):
         try:
             while True:
                 message = await queue.get()
+                if message is CLOSE:
+                    # Dropped to stay within the memory budget: it may
+                    # reconnect, and will be sent everything afresh
+                    await websocket.close(code=1013)
+                    break
                 await websocket.send_json(message)
         except WebSocketDisconnect:
             pass
@@ -288,6 +341,64 @@ def create_app(gui_config, config_path=None, token=None):
         broadcaster.publish(CONFIG_CHANGED_MESSAGE)
         return {"status": "restarted"}
 
+    @app.get("/api/data", dependencies=[Depends(require_token)])
+    async def get_data(since: int | None = None):
+        buffers = app.state.buffers
+        if buffers is None:
+            raise HTTPException(status_code=404, detail="no acquisition is running")
+        data, seq, reset = buffers.read_since(since)
+        return {
+            "reset": reset,
+            "seq": seq,
+            "maxlen": buffers.maxlen,
+            "length": len(buffers),
+            "data": {name: values.tolist() for name, values in data.items()},
+        }
+
+    @app.get("/api/memory", dependencies=[Depends(require_token)])
+    async def get_memory():
+        return memory.report(app.state.buffers, broadcaster)
+
+    @app.get("/api/metrics", dependencies=[Depends(require_token)])
+    async def get_metrics():
+        if app.state.metrics is None:
+            return {"seconds": 0.0, "stages": {}, "counters": {}}
+        return app.state.metrics.snapshot()
+
+    @app.get("/api/alarms", dependencies=[Depends(require_token)])
+    async def get_alarms():
+        if app.state.alarms is None:
+            return {"active": [], "events": []}
+        return app.state.alarms.snapshot()
+
+    @app.get("/api/plot_window", dependencies=[Depends(require_token)])
+    async def get_plot_window():
+        return {"maxlen": app.state.plot_window}
+
+    @app.put("/api/plot_window", dependencies=[Depends(require_token)])
+    async def set_plot_window(payload: PlotWindow):
+        if app.state.plot_window_callback is None:
+            raise HTTPException(
+                status_code=400,
+                detail="this server was not started with plot window support")
+        if payload.maxlen is not None and payload.maxlen < 0:
+            raise HTTPException(
+                status_code=400, detail="maxlen must be 0 or more (0: unlimited)")
+        # 0 means unlimited, like --plot_win_size 0
+        app.state.plot_window = app.state.plot_window_callback(payload.maxlen or None)
+        return {"maxlen": app.state.plot_window}
+
+    @app.post("/api/trigger", dependencies=[Depends(require_token)])
+    async def fire_trigger():
+        if app.state.trigger_callback is None:
+            raise HTTPException(
+                status_code=400, detail="this server was not started with trigger support")
+        if not app.state.trigger_callback():
+            raise HTTPException(
+                status_code=409,
+                detail="no triggered recording is running: add a [trigger] section to the config")
+        return {"fired": True}
+
     # Mounted last, and no longer covers index.html/settings.html (served
     # above instead, so the token can be embedded): /api/*, /ws/data, /,
     # and /settings.html are all matched first since routes are tried in
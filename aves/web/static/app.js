@@ -8,6 +8,7 @@
 
 const statusEl = document.getElementById("status");
 const chartsEl = document.getElementById("charts");
+const alarmsEl = document.getElementById("alarms");
 
 function setStatus(text, isError) {
     statusEl.textContent = text;
@@ -82,6 +83,42 @@ function buildChart(axisConfig, syncKey) {
     return { plot, columns };
 }
 
+// The alarms active now (see aves/alarms.py), by name: the latest event
+// that fired each one. Filled from /api/alarms when the page loads, then
+// kept up to date by the events streamed over /ws/data.
+const activeAlarms = new Map();
+
+function renderAlarms() {
+    alarmsEl.replaceChildren(...Array.from(activeAlarms.values(), (event) => {
+        const item = document.createElement("li");
+        item.textContent = `${event.name}: ${event.column} = ${event.value}`
+            + (event.time ? ` (${event.time})` : "");
+        return item;
+    }));
+}
+
+function applyAlarm(event) {
+    if (event.active) {
+        activeAlarms.set(event.name, event);
+    } else {
+        activeAlarms.delete(event.name);
+    }
+    renderAlarms();
+}
+
+async function loadAlarms() {
+    try {
+        const response = await fetch("/api/alarms", { headers: authHeaders() });
+        const { active } = await response.json();
+        for (const event of active) {
+            activeAlarms.set(event.name, event);
+        }
+        renderAlarms();
+    } catch (err) {
+        // Alarms are shown as they fire anyway
+    }
+}
+
 async function main() {
     let config;
     try {
@@ -107,6 +144,8 @@ async function main() {
     // this module itself.
     window.__avesCharts = charts;
 
+    loadAlarms();
+
     const xColumn = config.x_column;
     const proto = location.protocol === "https:" ? "wss:" : "ws:";
     const ws = new WebSocket(`${proto}//${location.host}/ws/data`);
@@ -115,16 +154,57 @@ async function main() {
     ws.addEventListener("close", () => setStatus("disconnected", true));
     ws.addEventListener("error", () => setStatus("connection error", true));
 
+    // What the charts show, one array per column. Messages from
+    // aves.web.__main__ are deltas (see _data_message there): only the
+    // samples added since the previous message, appended here, unless
+    // "reset" says to start over from the whole window. Deltas that
+    // arrive before the first reset (sent when a page connects) are
+    // ignored, since there is nothing to append them to yet.
+    let columnsData = null;
+
+    function applyMessage(message) {
+        if (!message.__aves_delta__) {
+            // A plain {column: values} message is the whole data.
+            columnsData = message;
+            return true;
+        }
+        if (message.reset) {
+            columnsData = message.data;
+            return true;
+        }
+        if (columnsData === null) {
+            return false;
+        }
+        for (const [name, values] of Object.entries(message.data)) {
+            let merged = (columnsData[name] || []).concat(values);
+            // Keep as many samples as the server's window holds now,
+            // whether it is bounded in samples or in seconds
+            if (merged.length > message.length) {
+                merged = merged.slice(merged.length - message.length);
+            }
+            columnsData[name] = merged;
+        }
+        return true;
+    }
+
     window.__avesRenderCount = 0;
     ws.addEventListener("message", (event) => {
-        const data = JSON.parse(event.data);
-        if (data.__aves_config_changed__) {
+        const message = JSON.parse(event.data);
+        if (message.__aves_config_changed__) {
             // The config was edited and the acquisition restarted (see
             // settings.html) -- axes/columns may have changed shape, so
             // reload rather than try to patch the existing charts.
             window.location.reload();
             return;
         }
+        if (message.__aves_alarm__) {
+            applyAlarm(message);
+            return;
+        }
+        if (!applyMessage(message)) {
+            return;
+        }
+        const data = columnsData;
         const xValues = data[xColumn] || [];
         for (const { plot, columns } of charts) {
             const chartData = [xValues].concat(columns.map((name) => data[name] || []));
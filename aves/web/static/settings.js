@@ -98,6 +98,12 @@ function availableColumns() {
             columns.push(column.name);
         }
     }
+    // Columns added by [[transforms]] stages, e.g. expressions
+    for (const transform of configData.transforms || []) {
+        if (transform.column && !columns.includes(transform.column)) {
+            columns.push(transform.column);
+        }
+    }
     return columns;
 }
 
@@ -147,17 +153,36 @@ function renderInput() {
         tbody.appendChild(el("tr", {}, [
             el("td", {}, [textInput(column.name, (v) => { column.name = v; renderAll(); })]),
             el("td", {}, [numberInput(column.conversion_factor, (v) => { column.conversion_factor = v; renderAll(); }, { step: "any" })]),
+            el("td", {}, [dtypeSelect(column)]),
             el("td", {}, [removeButton(() => { arduino.columns.splice(index, 1); renderAll(); })]),
         ]));
     });
     inputFieldsEl.appendChild(el("table", { class: "rows-table" }, [
-        el("thead", {}, [el("tr", {}, [el("th", { text: "Name" }), el("th", { text: "Conversion factor" }), el("th", { text: "" })])]),
+        el("thead", {}, [el("tr", {}, [el("th", { text: "Name" }), el("th", { text: "Conversion factor" }), el("th", { text: "Storage" }), el("th", { text: "" })])]),
         tbody,
     ]));
 
     inputFieldsEl.appendChild(renderInputPreview(arduino.columns));
 }
 
+// Compact storage for raw integer readings (see "dtype" in aves/io.py):
+// the default keeps converted values as 64-bit floats.
+const COLUMN_DTYPES = [["", "float64 (default)"], ["uint16", "uint16"], ["int16", "int16"],
+    ["int32", "int32"], ["float32", "float32"]];
+
+function dtypeSelect(column) {
+    const select = el("select");
+    select.addEventListener("change", () => {
+        if (select.value) { column.dtype = select.value; } else { delete column.dtype; }
+    });
+    for (const [value, text] of COLUMN_DTYPES) {
+        const option = el("option", { value: value, text: text });
+        option.selected = value === (column.dtype || "");
+        select.appendChild(option);
+    }
+    return select;
+}
+
 // Illustrates what the Arduino sketch needs to print, and what aves turns
 // it into, without requiring an actual serial connection to look at.
 const EXAMPLE_RAW_VALUE = 1000;
@@ -517,4 +542,34 @@ restartBtn.addEventListener("click", async () => {
     setTimeout(() => { window.location.href = "/"; }, 500);
 });
 
+// ---- plot window (runtime state of the running acquisition) ----
+
+const plotWindowEl = document.getElementById("plot-window");
+
+async function refreshPlotWindow() {
+    const response = await fetch("/api/plot_window", { headers: authHeaders() });
+    if (response.ok) {
+        const data = await response.json();
+        plotWindowEl.value = data.maxlen === null ? 0 : data.maxlen;
+    }
+}
+
+document.getElementById("plot-window-btn").addEventListener("click", async () => {
+    const maxlen = plotWindowEl.value === "" ? 0 : Number(plotWindowEl.value);
+    const response = await fetch("/api/plot_window", {
+        method: "PUT",
+        headers: { "Content-Type": "application/json", ...authHeaders() },
+        body: JSON.stringify({ maxlen }),
+    });
+    if (!response.ok) {
+        setStatus("Could not change the plot window: " + await errorDetail(response), true);
+        return;
+    }
+    const data = await response.json();
+    setStatus(data.maxlen === null
+        ? "Charts now keep every sample."
+        : "Charts now keep the last " + data.maxlen + " samples.");
+});
+
 refreshFromServer();
+refreshPlotWindow();
@@ -11,10 +11,16 @@ that entry point parses its own arguments.
 import os
 
 from aves import io
+from aves.alarms import Alarms
+from aves.gaps import GapDetector
+from aves.history import TieredHistory, parse_tiers
+from aves.sharedbuffers import SharedDataBuffers
+from aves.transforms import TransformPipeline, added_columns
+from aves.trigger import TriggeredWriter
 from aves.utils import require_keys
 
 
-def build_input_device(port, config, config_file="config.toml"):
+def build_input_device(port, config, config_file="config.toml", follow=False):
     """
     Reads from the serial port, or replays a previously recorded file if
     ``port`` happens to be an existing file path.
@@ -24,21 +30,202 @@ def build_input_device(port, config, config_file="config.toml"):
             file to replay.
         config (dict): Parsed config (see aves.utils.parse_config).
         config_file (str): Only used to name the file in error messages.
+        follow (bool): When replaying a file, keep reading lines appended
+            to it (e.g. by another aves process still recording it)
+            instead of stopping at its end.
     """
     if os.path.isfile(port):
         require_keys(
             config, ["output"],
             f"{config_file} (its 'output' section describes the "
             "columns of the recorded file being replayed as input)")
-        return io.ReadSensorFile(filename=port, config=config["output"])
+        return io.ReadSensorFile(filename=port, config=config["output"],
+                                 follow=follow)
+    if follow:
+        raise ValueError(
+            f"--follow only applies when replaying a recorded file, but "
+            f"{port!r} is not an existing file")
     require_keys(
         config, ["input"],
         f"{config_file} (needed to read live from the serial port)")
     return io.ReadSensorSerial(port=port, config=config["input"])
 
 
-def build_output_device(outfile, config):
-    """Returns a WriteSensorFile, or None if the config has no output section."""
+def build_output_device(outfile, config, scales=None, config_file="config.toml"):
+    """
+    Returns a WriteSensorFile, or None if the config has no output section.
+    scales are the input device's column_scales, applied before writing.
+    With a ``trigger`` section, returns a TriggeredWriter instead, writing
+    only the samples around events (see aves.trigger).
+    """
     if "output" not in config:
         return None
-    return io.WriteSensorFile(filename=outfile, config=config["output"])
+    _check_integer_dtypes(config, config_file)
+    if "trigger" in config:
+        writer = TriggeredWriter(outfile, config["output"], config["trigger"], scales=scales)
+        _check_column(writer.trigger.column, config, f"{config_file}'s 'trigger' section")
+        return writer
+    return io.WriteSensorFile(filename=outfile, config=config["output"], scales=scales)
+
+
+def _check_integer_dtypes(config, config_file):
+    """
+    Raises a ValueError if an integer output dtype is declared for an
+    input column with a conversion_factor, whose converted values (e.g.
+    512 counts times 0.0048828125 V) would be rounded to whole units.
+    """
+    factors = {column.get("name"): column.get("conversion_factor", 1.0)
+               for column in config.get("input", {}).get("arduino", {}).get("columns", [])}
+    for name, dtype in config["output"].get("dtypes", {}).items():
+        where = f"{config_file}'s 'output.dtypes.{name}' entry"
+        if io.parse_dtype(dtype, where).kind in "iu" and factors.get(name, 1.0) != 1.0:
+            raise ValueError(
+                f"{where}: {name!r} is written converted by its conversion_factor, "
+                f"which an integer dtype would round; use a float dtype such as 'float32'")
+
+
+def build_alarms(config, idev=None, config_file="config.toml"):
+    """
+    Returns the Alarms declared by the config's ``[[alarms]]`` tables
+    (see aves.alarms), on the values idev reads, or None if it has none.
+    """
+    if "alarms" not in config:
+        return None
+    if not isinstance(config["alarms"], list):
+        raise ValueError(
+            f"{config_file}'s 'alarms' entry must be a list of tables ([[alarms]])")
+    scales = idev.column_scales if idev is not None else None
+    alarms = Alarms(config["alarms"], scales=scales, config_file=config_file)
+    for i, alarm in enumerate(alarms.alarms):
+        _check_column(alarm.column, config, f"{config_file}'s 'alarms[{i}]' entry")
+    return alarms
+
+
+def build_buffers(plot_win_size, config, history_tiers=None, shm_name=None,
+                  idev=None, plot_win_seconds=None, config_file="config.toml"):
+    """
+    Returns the DataBuffers the plots are drawn from.
+
+    Args:
+        plot_win_size (int): Samples kept at full rate (None: all). With
+            plot_win_seconds, only the most the window may hold.
+        config (dict): Parsed config (see aves.utils.parse_config).
+        plot_win_seconds (float): Keep the samples within this many units
+            of the gui's x_column of the newest one, instead of a number
+            of samples. None for a window of plot_win_size samples.
+        history_tiers (str): Also keep a coarser history of older samples,
+            bucketed along the gui's x_column, e.g. "1:3600,60:1440" (see
+            aves.history.parse_tiers). None for no history.
+        shm_name (str): Also share the numeric columns with other
+            processes, in shared memory under this name (see
+            aves.sharedbuffers). None to keep them private.
+        idev: The input device the buffers are filled from, whose
+            column_dtypes and column_scales the buffers store and scale
+            the columns with.
+        config_file (str): Only used to name the file in error messages.
+    """
+    time_column = None
+    if plot_win_seconds is not None:
+        if plot_win_seconds <= 0:
+            raise ValueError(
+                f"--plot_win_seconds must be positive, got {plot_win_seconds}")
+        require_keys(
+            config.get("gui", {}), ["x_column"],
+            f"{config_file}'s 'gui' section (needed for --plot_win_seconds)")
+        time_column = config["gui"]["x_column"]
+    dtypes = idev.column_dtypes if idev is not None else None
+    scales = idev.column_scales if idev is not None else None
+    history = None
+    if history_tiers:
+        require_keys(
+            config.get("gui", {}), ["x_column"],
+            f"{config_file}'s 'gui' section (needed for --history_tiers)")
+        x_column = config["gui"]["x_column"]
+        history = TieredHistory(x_column, parse_tiers(history_tiers),
+                                scale=(scales or {}).get(x_column, 1.0))
+    # Room to grow the window a couple of times at runtime without
+    # reallocating
+    capacity = 4 * plot_win_size if plot_win_size else None
+    if shm_name:
+        if capacity is None:
+            raise ValueError(
+                "--shm-name needs a bounded window: give a --plot_win_size other than 0")
+        return SharedDataBuffers(
+            shm_name, _numeric_columns(config, idev, config_file), capacity,
+            maxlen=plot_win_size, history=history, dtypes=dtypes, scales=scales,
+            time_window=plot_win_seconds, time_column=time_column)
+    return io.DataBuffers(maxlen=plot_win_size, capacity=capacity, history=history,
+                          dtypes=dtypes, scales=scales,
+                          time_window=plot_win_seconds, time_column=time_column)
+
+
+def build_gap_detector(config, idev, config_file="config.toml"):
+    """
+    Returns the GapDetector checking what idev reads from the serial port
+    for lost samples, if the config's ``input.arduino`` section names a
+    ``time_column`` (see aves.gaps), or None.
+    """
+    if not isinstance(idev, io.ReadSensorSerial):
+        return None
+    return GapDetector.from_config(
+        config["input"]["arduino"], scales=idev.column_scales, config_file=config_file)
+
+
+def build_transforms(config, idev=None, config_file="config.toml"):
+    """
+    Returns the TransformPipeline declared by the config's
+    ``[[transforms]]`` tables (see aves.transforms), or None if it has
+    none. idev is the input device, whose column_scales the stages get.
+    """
+    if "transforms" not in config:
+        return None
+    if not isinstance(config["transforms"], list):
+        raise ValueError(
+            f"{config_file}'s 'transforms' entry must be a list of tables ([[transforms]])")
+    return TransformPipeline.from_config(
+        config["transforms"], scales=idev.column_scales if idev is not None else None,
+        config_file=config_file)
+
+
+def _known_columns(config):
+    """
+    Names of the columns the samples can have: the input's, the output's
+    and those the transforms add. None if the config has neither an
+    input nor an output section to tell.
+    """
+    if "input" not in config and "output" not in config:
+        return None
+    arduino = config.get("input", {}).get("arduino", {})
+    columns = [column["name"] for column in arduino.get("columns", [])]
+    columns += config.get("output", {}).get("columns", [])
+    columns += added_columns(config.get("transforms", []))
+    return columns
+
+
+def _check_column(name, config, where):
+    "Raises a ValueError naming where if name is not a column of the samples."
+    known = _known_columns(config)
+    if known is not None and name not in known:
+        raise ValueError(f"{where} refers to the unknown column {name!r}")
+
+
+def _numeric_columns(config, idev=None, config_file="config.toml"):
+    """
+    The columns of the samples that hold numbers, i.e. all but
+    time_computer: the ones read from the input (the recorded file's when
+    replaying one), those the transforms add, and those the gui plots.
+    """
+    if isinstance(idev, io.ReadSensorFile) or "input" not in config:
+        require_keys(
+            config, ["output"], f"{config_file} (needed to know the columns to share)")
+        require_keys(config["output"], ["columns"], f"{config_file}'s 'output' section")
+        columns = list(config["output"]["columns"])
+    else:
+        columns = [column["name"] for column in config["input"]["arduino"]["columns"]]
+    columns += added_columns(config.get("transforms", []))
+    gui = config.get("gui", {})
+    for axis in gui.get("axes", []):
+        columns += axis.get("columns", [])
+    if "x_column" in gui:
+        columns.append(gui["x_column"])
+    return [name for name in dict.fromkeys(columns) if name != io.TIME_COMPUTER]
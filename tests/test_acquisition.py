@@ -1,8 +1,17 @@
+import asyncio
+import fcntl
+import logging
+import os
+import struct
 import subprocess
 import sys
+import termios
+import time
 
-from aves.acquisition import Acquisition
-from aves.io import DataBuffers, ReadSensorFile, WriteSensorFile
+import pytest
+
+from aves.acquisition import AdaptiveBatching, Acquisition, AsyncAcquisition, can_wait_on
+from aves.io import DataBuffers, ReadSensorFile, ReadSensorSerial, WriteSensorFile
 
 COLUMNS_CONFIG = {"columns": ["a", "b"]}
 
@@ -36,9 +45,10 @@ def test_acquisition_step_reads_writes_and_buffers(tmp_path):
         samples = acquisition.step()
 
     assert len(samples) == 2
-    # extendleft prepends each sample in turn, so the batch ends up reversed
-    assert list(buffers.data["a"]) == ["3", "1"]
-    assert list(buffers.data["b"]) == [4.0, 2.0]
+    # buffered in the order they were read
+    assert list(buffers.data["a"]) == ["1", "3"]
+    assert list(buffers.data["b"]) == [2.0, 4.0]
+    assert buffers.seq == 2
 
     written_lines = outfile_path.read_text().splitlines()
     assert written_lines[2:] == ["1\t2.0", "3\t4.0"]
@@ -78,3 +88,244 @@ def test_acquisition_should_stop_when_time_limit_exceeded():
     buffers = DataBuffers()
     acquisition = Acquisition(idev=NeverEndingSource(), buffers=buffers, tmeas=-1)
     assert acquisition.should_stop()
+
+
+def test_acquisition_call_soon_runs_before_the_next_step(tmp_path):
+    infile = tmp_path / "in.txt"
+    infile.write_text("1\t2.0\n3\t4.0\n5\t6.0\n")
+
+    buffers = DataBuffers(maxlen=3)
+    with ReadSensorFile(filename=str(infile), config=COLUMNS_CONFIG) as idev:
+        acquisition = Acquisition(idev=idev, buffers=buffers, samples_per_step=2)
+        acquisition.step()
+        acquisition.call_soon(buffers.set_maxlen, 1)
+        assert list(buffers.data["b"]) == [2.0, 4.0]
+        acquisition.step()
+
+    assert list(buffers.data["b"]) == [6.0]
+
+
+class PipeSerialPort:
+    """Stands in for a pyserial Serial object, reading what is written to a pipe."""
+
+    def __init__(self):
+        self._read_fd, self.write_fd = os.pipe()
+
+    def fileno(self):
+        return self._read_fd
+
+    @property
+    def in_waiting(self):
+        waiting = fcntl.ioctl(self._read_fd, termios.FIONREAD, struct.pack("i", 0))
+        return struct.unpack("i", waiting)[0]
+
+    def read(self, size):
+        return os.read(self._read_fd, size)
+
+    def close(self):
+        os.close(self._read_fd)
+        os.close(self.write_fd)
+
+
+@pytest.fixture
+def serial_reader():
+    config = {"arduino": {"baudrate": 9600, "timeout": 0.2,
+                          "columns": [{"name": "a"}, {"name": "b"}]}}
+    reader = ReadSensorSerial(port="/dev/fake", config=config)
+    reader._inputdata = PipeSerialPort()
+    yield reader
+    reader._inputdata.close()
+
+
+def test_async_acquisition_waits_for_the_port_without_blocking_the_loop(serial_reader):
+    port = serial_reader._inputdata
+    buffers = DataBuffers()
+    acquisition = AsyncAcquisition(idev=serial_reader, buffers=buffers, samples_per_step=1)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.02, os.write, port.write_fd, b"1 2\n3 ")
+        loop.call_later(0.04, os.write, port.write_fd, b"4\n")
+        first = await acquisition.step_async()
+        second = await acquisition.step_async()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert [sample["b"] for sample in first] == [2.0]
+    assert [sample["b"] for sample in second] == [4.0]
+    assert list(buffers.data["a"]) == [1.0, 3.0]
+
+
+def test_async_acquisition_waits_for_samples_per_step(serial_reader):
+    port = serial_reader._inputdata
+    os.write(port.write_fd, b"".join(b"%d 0\n" % i for i in range(15)))
+    acquisition = AsyncAcquisition(idev=serial_reader, buffers=DataBuffers(),
+                                   samples_per_step=10)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        first = await acquisition.step_async()
+        loop.call_later(0.02, os.write, port.write_fd, b"15 0\n16 0\n")
+        loop.call_later(0.04, os.write, port.write_fd, b"17 0\n18 0\n19 0\n20 0\n")
+        second = await acquisition.step_async()
+        # Only 1 more sample: the port times out with what it has
+        third = await acquisition.step_async()
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+
+    assert [sample["a"] for sample in first] == list(range(10))
+    assert [sample["a"] for sample in second] == list(range(10, 20))
+    assert [sample["a"] for sample in third] == [20]
+    assert acquisition.should_stop()
+
+
+def test_async_acquisition_stops_when_the_port_times_out(serial_reader):
+    acquisition = AsyncAcquisition(idev=serial_reader, buffers=DataBuffers())
+
+    assert asyncio.run(acquisition.step_async()) == []
+    assert acquisition.should_stop()
+
+
+def test_async_acquisition_is_stopped_by_cancelling_it(serial_reader):
+    acquisition = AsyncAcquisition(idev=serial_reader, buffers=DataBuffers())
+
+    async def scenario():
+        task = asyncio.ensure_future(acquisition.step_async())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # Stops watching the port
+        assert not asyncio.get_running_loop().remove_reader(serial_reader.fileno())
+
+    asyncio.run(scenario())
+
+
+def test_async_acquisition_reads_files_in_an_executor(tmp_path):
+    infile = tmp_path / "in.txt"
+    infile.write_text("1\t2.0\n3\t4.0\n5\t6.0\n")
+    buffers = DataBuffers()
+
+    with ReadSensorFile(filename=str(infile), config=COLUMNS_CONFIG) as idev:
+        acquisition = AsyncAcquisition(idev=idev, buffers=buffers, samples_per_step=2)
+        asyncio.run(acquisition.step_async())
+
+    assert list(buffers.data["b"]) == [2.0, 4.0]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_adaptive_batching_sizes_batches_to_the_measured_rate(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr("aves.acquisition.time.monotonic", clock)
+    batching = AdaptiveBatching(0.1, min_samples=2, max_samples=50)
+    assert batching.size() == 2  # nothing measured yet
+    batching.finished(0)
+    clock.now = 1.0
+    batching.finished(100)
+    assert batching.rate == 100
+    assert batching.size() == 10
+    clock.now = 1.1
+    batching.finished(1000)  # 10000 samples/s, smoothed
+    assert batching.size() == 50
+    with pytest.raises(ValueError):
+        AdaptiveBatching(0.1, min_samples=5, max_samples=2)
+
+
+def test_adaptive_batching_waits_for_the_batch_until_the_deadline(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr("aves.acquisition.time.monotonic", clock)
+    batching = AdaptiveBatching(0.1, min_samples=1, max_samples=100, deadline=0.3)
+    batching.rate = 100.0
+    batching.start()
+    assert batching.wait(4) == pytest.approx(0.06)  # 6 more samples at 100/s
+    assert batching.wait(10) is None
+    clock.now = 0.25
+    assert batching.wait(4) == pytest.approx(0.05)  # only until the deadline
+    clock.now = 0.3
+    assert batching.wait(0) is None
+
+
+def test_adaptive_step_reads_what_arrived_within_the_bounds(serial_reader):
+    port = serial_reader._inputdata
+    os.write(port.write_fd, b"".join(b"%d 0\n" % i for i in range(30)))
+    batching = AdaptiveBatching(0.01, min_samples=1, max_samples=20, deadline=0.05)
+    acquisition = Acquisition(idev=serial_reader, buffers=DataBuffers(), batching=batching)
+
+    first = acquisition.step()
+    second = acquisition.step()
+    start = time.monotonic()
+    third = acquisition.step()
+
+    assert [sample["a"] for sample in first] == list(range(20))
+    assert [sample["a"] for sample in second] == list(range(20, 30))
+    # Nothing more arrives: an empty batch at the deadline, well before
+    # the port's timeout
+    assert third == []
+    assert 0.04 <= time.monotonic() - start < 0.2
+    assert not acquisition.should_stop()
+
+
+def test_adaptive_async_step_waits_for_a_batch(serial_reader):
+    port = serial_reader._inputdata
+    batching = AdaptiveBatching(0.05, min_samples=3, max_samples=100, deadline=0.15)
+    acquisition = AsyncAcquisition(idev=serial_reader, buffers=DataBuffers(), batching=batching)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        for i in range(3):
+            loop.call_later(0.01 * (i + 1), os.write, port.write_fd, b"%d 0\n" % i)
+        return await acquisition.step_async()
+
+    assert [sample["a"] for sample in asyncio.run(scenario())] == [0, 1, 2]
+
+
+def test_adaptive_step_sizes_reads_of_other_devices(tmp_path):
+    infile = tmp_path / "in.txt"
+    infile.write_text("".join(f"{i}\t0.0\n" for i in range(30)))
+    batching = AdaptiveBatching(0.1, min_samples=4, max_samples=100)
+
+    with ReadSensorFile(filename=str(infile), config=COLUMNS_CONFIG) as idev:
+        acquisition = Acquisition(idev=idev, buffers=DataBuffers(), batching=batching)
+        # Until a rate is measured, batches have min_samples
+        assert [len(acquisition.step()) for _ in range(2)] == [4, 4]
+        assert len(acquisition.step()) > 4  # read almost instantly: a high rate
+
+
+def test_adaptive_step_drops_the_oldest_samples_it_cannot_keep_up_with(serial_reader, caplog):
+    port = serial_reader._inputdata
+    os.write(port.write_fd, b"".join(b"%d 0\n" % i for i in range(30)))
+    batching = AdaptiveBatching(0.01, min_samples=1, max_samples=2, deadline=0.05)
+    batching.MAX_BACKLOG_BATCHES = 5
+    acquisition = Acquisition(idev=serial_reader, buffers=DataBuffers(), batching=batching)
+
+    with caplog.at_level(logging.WARNING, logger="aves.acquisition"):
+        first = acquisition.step()
+        second = acquisition.step()
+
+    # 2 samples per batch, and 5 batches' worth waiting: 18 of 28 dropped
+    assert [sample["a"] for sample in first] == [0, 1]
+    assert [sample["a"] for sample in second] == [20, 21]
+    assert acquisition.metrics.counters["dropped_samples"] == 18
+    assert "Dropping 18 samples" in caplog.text
+
+
+def test_only_ports_with_a_file_descriptor_are_waited_on(serial_reader, monkeypatch, tmp_path):
+    assert can_wait_on(serial_reader)
+    infile = tmp_path / "in.txt"
+    infile.write_text("1\t2.0\n")
+    assert not can_wait_on(ReadSensorFile(filename=str(infile), config=COLUMNS_CONFIG))
+    # pyserial's Windows ports have no fileno()
+    monkeypatch.setattr(serial_reader, "fileno", lambda: serial_reader._missing)
+    assert not can_wait_on(serial_reader)
+    monkeypatch.undo()
+    monkeypatch.setattr("aves.acquisition.sys.platform", "win32")
+    assert not can_wait_on(serial_reader)
@@ -0,0 +1,174 @@
+import logging
+
+import numpy as np
+import pytest
+
+from aves.acquisition import Acquisition
+from aves.alarms import Alarm, Alarms, describe
+from aves.io import DataBuffers, WriteSensorFile
+from aves.wiring import build_alarms, build_transforms
+
+
+def _states(table, values, batch_size=None):
+    "Whether one alarm is active at each sample, checking values in batches."
+    alarm = Alarm(dict(table, name="alarm", column="a"), "test")
+    values = np.asarray(values, dtype=float)
+    batch_size = batch_size or len(values)
+    states, active = [], False
+    for start in range(0, len(values), batch_size):
+        batch = values[start:start + batch_size]
+        changes, now = alarm.update(batch)
+        switches = dict(zip(changes.tolist(), now.tolist()))
+        for index in range(len(batch)):
+            active = switches.get(index, active)
+            states.append(active)
+    return states
+
+
+def test_above_fires_and_clears_at_the_level_without_hysteresis():
+    assert _states({"above": 5}, [0, 5, 6, 4, 7]) == [False, True, True, False, True]
+
+
+def test_hysteresis_keeps_the_alarm_active_near_the_level():
+    values = [0, 5, 4, 5, 4, 2.9, 3.5, 5]
+    assert _states({"above": 5, "hysteresis": 2}, values) \
+        == [False, True, True, True, True, False, False, True]
+
+
+def test_debounce_waits_for_samples_in_a_row():
+    values = [9, 9, 0, 9, 9, 9, 9, 0]
+    assert _states({"above": 5, "debounce": 3}, values) \
+        == [False, False, False, False, False, True, True, False]
+
+
+def test_below_outside_rising_and_falling():
+    assert _states({"below": 1}, [2, 1, 0, 3]) == [False, True, True, False]
+    assert _states({"outside": [0, 10]}, [5, -1, 5, 11]) == [False, True, False, True]
+    assert _states({"rising": 2}, [0, 1, 4, 5]) == [False, False, True, False]
+    assert _states({"falling": 2}, [5, 4, 1, 0]) == [False, False, True, False]
+
+
+@pytest.mark.parametrize("table", [
+    {"above": 5, "hysteresis": 1.5, "debounce": 4},
+    {"outside": [-1, 1], "hysteresis": 0.2, "debounce": 2},
+    {"falling": 0.5, "debounce": 2},
+], ids=lambda table: next(iter(table)))
+def test_alarms_do_not_depend_on_batching(table):
+    values = np.random.default_rng(0).normal(size=400).cumsum()
+    whole = _states(table, values)
+    assert any(whole)
+    assert _states(table, values, batch_size=7) == whole
+    assert _states(table, values, batch_size=1) == whole
+
+
+def test_check_returns_the_events_of_all_alarms_in_order():
+    alarms = Alarms([
+        {"name": "hot", "column": "t", "above": 50},
+        {"name": "low", "column": "v", "below": 3},
+    ])
+    events = alarms.check({"t": np.array([10.0, 60.0, 60.0, 40.0]),
+                           "v": np.array([5.0, 5.0, 2.0, 2.0]),
+                           "time_computer": np.array(["t0", "t1", "t2", "t3"])})
+    assert [(event["name"], event["active"], event["value"], event["time"])
+            for event in events] == [
+        ("hot", True, 60.0, "t1"), ("low", True, 2.0, "t2"), ("hot", False, 40.0, "t3")]
+    assert alarms.active == ["low"]
+    snapshot = alarms.snapshot()
+    assert [event["name"] for event in snapshot["active"]] == ["low"]
+    assert len(snapshot["events"]) == 3
+    assert describe(events[0]) == "alarm 'hot' fired: t=60.0"
+
+
+def test_levels_are_in_converted_units():
+    alarms = Alarms([{"name": "high", "column": "a", "above": 2.5}], scales={"a": 0.005})
+    assert [event["value"] for event in alarms.check({"a": np.array([100, 600])})] == [3.0]
+
+
+@pytest.mark.parametrize("table, message", [
+    ({"name": "x", "column": "a"}, "exactly one of"),
+    ({"name": "x", "column": "a", "above": 1, "below": 0}, "exactly one of"),
+    ({"name": "x", "column": "a", "outside": [2, 1]}, r"\[low, high\]"),
+    ({"name": "x", "column": "a", "above": 1, "hysteresis": -1}, "0 or more"),
+    ({"name": "x", "column": "a", "above": 1, "debounce": 0}, "positive integer"),
+    ({"column": "a", "above": 1}, "name"),
+])
+def test_invalid_alarms_are_rejected(table, message):
+    with pytest.raises(ValueError, match=message):
+        Alarms([table])
+
+
+def test_alarm_names_are_unique():
+    with pytest.raises(ValueError, match="more than one named 'x'"):
+        Alarms([{"name": "x", "column": "a", "above": 1},
+                {"name": "x", "column": "b", "above": 1}])
+
+
+def test_build_alarms_is_none_without_alarms():
+    assert build_alarms({}) is None
+    with pytest.raises(ValueError, match="list of tables"):
+        build_alarms({"alarms": {"name": "x"}})
+
+
+def test_build_alarms_rejects_unknown_columns():
+    config = {"input": {"arduino": {"columns": [{"name": "t"}, {"name": "a"}]}},
+              "output": {"columns": ["t", "a", "b"]},
+              "transforms": [{"type": "expression", "column": "c", "expression": "a"}],
+              "alarms": [{"name": "ok", "column": "c", "above": 1},
+                         {"name": "typo", "column": "aa", "above": 1}]}
+    with pytest.raises(ValueError, match=r"'alarms\[1\]' entry refers to the unknown column 'aa'"):
+        build_alarms(config)
+    config["alarms"].pop()
+    assert build_alarms(config) is not None
+
+
+class _ListDevice(object):
+    def __init__(self, samples):
+        self.samples = list(samples)
+
+    def readsamples(self, num_samples):
+        batch, self.samples = self.samples[:num_samples], self.samples[num_samples:]
+        return batch
+
+
+def test_acquisition_reports_alarms(tmp_path, caplog):
+    outfile_path = tmp_path / "out.txt"
+    device = _ListDevice([{"t": float(i), "a": value} for i, value in enumerate([1, 9, 9, 1])])
+    alarms = build_alarms({"alarms": [{"name": "high", "column": "a", "above": 5}]})
+    reported = []
+    with WriteSensorFile(filename=str(outfile_path), config={"columns": ["t", "a"]}) as outfile:
+        acquisition = Acquisition(idev=device, buffers=DataBuffers(), outfile=outfile,
+                                  samples_per_step=2, alarms=alarms,
+                                  on_alarm=reported.append)
+        with caplog.at_level(logging.WARNING, logger="aves.acquisition"):
+            acquisition.step()
+            acquisition.step()
+    assert [(event["name"], event["active"]) for event in reported] \
+        == [("high", True), ("high", False)]
+    assert outfile_path.read_text().splitlines()[2:] == [
+        "# alarm 'high' fired: a=9.0", "0.0\t1", "1.0\t9",
+        "# alarm 'high' cleared: a=1.0", "2.0\t9", "3.0\t1"]
+    assert acquisition.metrics.counters["alarms"] == 1
+    assert "alarm 'high' fired" in caplog.text
+
+
+def test_alarms_on_a_filtered_dtype_column_compare_converted_values():
+    # "a" is read raw as uint16 counts of 0.5 units, and smoothed into a
+    # new column, in units
+    idev = _ListDevice([{"t": float(i), "a": value} for i, value in enumerate([2, 2, 20, 20])])
+    idev.column_dtypes = {"a": np.dtype("uint16")}
+    idev.column_scales = {"a": 0.5}
+    config = {
+        "transforms": [{"type": "moving_average", "input": "a", "column": "smooth",
+                        "window": 2}],
+        "alarms": [{"name": "raw", "column": "a", "above": 8},
+                   {"name": "smooth", "column": "smooth", "above": 8}],
+    }
+    reported = []
+    acquisition = Acquisition(
+        idev=idev, buffers=DataBuffers(dtypes=idev.column_dtypes, scales=idev.column_scales),
+        samples_per_step=4, transforms=build_transforms(config, idev),
+        alarms=build_alarms(config, idev), on_alarm=reported.append)
+    acquisition.step()
+    assert [(event["name"], event["value"]) for event in reported] \
+        == [("raw", 10.0), ("smooth", 10.0)]
+    assert acquisition.buffers.snapshot()["smooth"].tolist() == [1.0, 1.0, 5.5, 10.0]
@@ -0,0 +1,131 @@
+import os
+
+import numpy as np
+import pytest
+
+from aves import cache as cache_module
+from aves.cache import RecordingCache
+
+CONFIG = {"columns": ["time_computer", "t", "a"]}
+
+
+def _write_recording(path, num_samples):
+    lines = ["# header", "#time_computer\tt\ta"]
+    lines += [f"2020-01-01T00:00:{i:02d}\t{i}\t{i % 7}" for i in range(num_samples)]
+    path.write_text("\n".join(lines) + "\n")
+
+
+def test_cache_miss_parses_the_recording(tmp_path):
+    infile = tmp_path / "in.txt"
+    _write_recording(infile, 3)
+    recording = RecordingCache(cache_dir=str(tmp_path / "cache")).load(str(infile), CONFIG)
+
+    assert len(recording) == 3
+    assert list(recording.data["time_computer"]) == [
+        "2020-01-01T00:00:00", "2020-01-01T00:00:01", "2020-01-01T00:00:02"]
+    assert list(recording.data["t"]) == [0.0, 1.0, 2.0]
+    assert list(recording.data["a"]) == [0.0, 1.0, 2.0]
+
+
+def test_cache_hit_does_not_parse_again(tmp_path, monkeypatch):
+    infile = tmp_path / "in.txt"
+    _write_recording(infile, 3)
+    cache = RecordingCache(cache_dir=str(tmp_path / "cache"))
+    cache.load(str(infile), CONFIG)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("parsed a cached recording again")
+    monkeypatch.setattr(cache_module, "_parse_columns", fail)
+    recording = cache.load(str(infile), CONFIG)
+
+    assert isinstance(recording.data["t"], np.memmap)
+    assert list(recording.data["t"]) == [0.0, 1.0, 2.0]
+
+
+def test_cache_is_invalidated_when_the_recording_changes(tmp_path):
+    infile = tmp_path / "in.txt"
+    _write_recording(infile, 3)
+    cache = RecordingCache(cache_dir=str(tmp_path / "cache"))
+    cache.load(str(infile), CONFIG)
+
+    _write_recording(infile, 5)
+    assert len(cache.load(str(infile), CONFIG)) == 5
+
+
+def test_cache_empty_recording(tmp_path):
+    infile = tmp_path / "in.txt"
+    _write_recording(infile, 0)
+    recording = RecordingCache(cache_dir=str(tmp_path / "cache")).load(str(infile), CONFIG)
+    assert len(recording) == 0
+
+
+def test_cache_evicts_least_recently_used_entries(tmp_path):
+    cache = RecordingCache(cache_dir=str(tmp_path / "cache"))
+    paths = []
+    for i in range(3):
+        infile = tmp_path / f"in{i}.txt"
+        _write_recording(infile, 100)
+        paths.append(str(infile))
+        cache.load(paths[-1], CONFIG)
+        # Distinct "last used" times, however coarse the filesystem's are
+        for entry in os.scandir(cache.cache_dir):
+            meta = os.path.join(entry.path, "meta.json")
+            os.utime(meta, (os.stat(meta).st_mtime - 10,) * 2)
+    entry_size = cache.size() // 3
+
+    cache.max_bytes = 2 * entry_size
+    cache.evict()
+
+    assert len(os.listdir(cache.cache_dir)) == 2
+    # in0.txt was the least recently used one
+    survivors = {cache_module._entry_key(path, CONFIG["columns"]) for path in paths[1:]}
+    assert set(os.listdir(cache.cache_dir)) == survivors
+
+
+def test_cache_builds_a_min_max_lod_pyramid(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, "LOD_MIN_POINTS", 2)
+    infile = tmp_path / "in.txt"
+    _write_recording(infile, 64)
+    recording = RecordingCache(cache_dir=str(tmp_path / "cache")).load(str(infile), CONFIG)
+
+    # 64 samples -> 16 buckets of 4 -> 4 buckets of 16 (then 1 < 2: stop)
+    assert [len(level["a"][0]) for level in recording.lod] == [16, 4]
+    low, high = recording.lod[0]["a"]
+    assert list(low[:2]) == [0.0, 0.0]  # a = 0 1 2 3 | 4 5 6 0 | ...
+    assert list(high[:2]) == [3.0, 6.0]
+    assert "time_computer" not in recording.lod[0]
+
+
+def test_cache_decimated_keeps_the_envelope(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, "LOD_MIN_POINTS", 2)
+    infile = tmp_path / "in.txt"
+    _write_recording(infile, 64)
+    recording = RecordingCache(cache_dir=str(tmp_path / "cache")).load(str(infile), CONFIG)
+
+    decimated = recording.decimated(max_points=8)
+
+    assert len(decimated["a"]) == 8
+    assert len(decimated["time_computer"]) == 8
+    assert decimated["a"].max() == 6.0
+    assert decimated["a"].min() == 0.0
+    # Short enough already: returned untouched
+    assert recording.decimated(max_points=100) is recording.data
+
+
+def test_cache_requires_columns(tmp_path):
+    infile = tmp_path / "in.txt"
+    _write_recording(infile, 1)
+    with pytest.raises(ValueError, match="'output' section.*columns"):
+        RecordingCache(cache_dir=str(tmp_path / "cache")).load(str(infile), {})
+
+
+def test_cache_stores_columns_with_their_declared_dtype(tmp_path):
+    infile = tmp_path / "in.txt"
+    _write_recording(infile, 10)
+    cache = RecordingCache(cache_dir=str(tmp_path / "cache"))
+
+    compact = cache.load(str(infile), dict(CONFIG, dtypes={"a": "int16"}))
+    assert compact.data["a"].dtype == np.int16
+    assert list(compact.data["a"]) == [i % 7 for i in range(10)]
+    # A different dtype is a different cache entry
+    assert cache.load(str(infile), CONFIG).data["a"].dtype == np.float64
@@ -0,0 +1,64 @@
+import numpy as np
+
+from aves.explorer import _follow_file
+from aves.io import WriteSensorFile
+
+CONFIG = {
+    "gui": {"x_column": "t", "zoom_all_together": True, "axes": []},
+    "output": {"columns": ["time_computer", "t", "a"]},
+}
+
+
+class _FakeWindow(object):
+    "Calls the tick on every 'refresh', appending to the file in between."
+
+    def __init__(self, append):
+        self.append = append
+        self.rendered = []
+
+    def render(self, data):
+        self.rendered.append({name: np.asarray(values).tolist() for name, values in data.items()})
+
+    def run(self, tick):
+        for refresh in range(5):
+            tick()
+            self.append(refresh)
+
+
+def test_following_a_file_keeps_only_the_plot_window(tmp_path):
+    path = tmp_path / "run.txt"
+    writer = WriteSensorFile(str(path), CONFIG["output"])
+    writer.__enter__()
+    writer.write([{"time_computer": "x", "t": float(i), "a": 0.0} for i in range(10)])
+
+    def append(refresh):
+        start = 10 + 10 * refresh
+        writer.write([{"time_computer": "x", "t": float(i), "a": 1.0} for i in range(start, start + 10)])
+
+    window = _FakeWindow(append)
+    try:
+        _follow_file(window, str(path), CONFIG, plot_win_size=15)
+    finally:
+        writer.__exit__(None, None, None)
+    assert [len(data["t"]) for data in window.rendered] == [10, 15, 15, 15, 15]
+    assert window.rendered[-1]["t"] == [float(i) for i in range(35, 50)]
+
+
+def test_following_a_file_can_keep_a_time_window(tmp_path):
+    path = tmp_path / "run.txt"
+    with WriteSensorFile(str(path), CONFIG["output"]) as writer:
+        writer.write([{"time_computer": "x", "t": float(i), "a": 0.0} for i in range(100)])
+    window = _FakeWindow(lambda refresh: None)
+    _follow_file(window, str(path), CONFIG, plot_win_size=None, plot_win_seconds=9.5)
+    assert window.rendered[0]["t"] == [float(i) for i in range(90, 100)]
+
+
+def test_following_a_file_catches_up_a_bounded_number_of_samples_at_a_time(
+        tmp_path, monkeypatch):
+    monkeypatch.setattr("aves.explorer.FOLLOW_SAMPLES_PER_REFRESH", 4)
+    path = tmp_path / "run.txt"
+    with WriteSensorFile(str(path), CONFIG["output"]) as writer:
+        writer.write([{"time_computer": "x", "t": float(i), "a": 0.0} for i in range(10)])
+    window = _FakeWindow(lambda refresh: None)
+    _follow_file(window, str(path), CONFIG, plot_win_size=3)
+    assert [data["t"][-1] for data in window.rendered] == [3.0, 7.0, 9.0]
@@ -0,0 +1,98 @@
+import logging
+
+import pytest
+
+from aves.acquisition import Acquisition
+from aves.gaps import GapDetector
+from aves.io import DataBuffers, WriteSensorFile
+from aves.wiring import build_gap_detector
+
+ARDUINO_CONFIG = {"columns": [{"name": "t"}, {"name": "a"}]}
+
+
+def _samples(times):
+    return [{"t": t, "a": 0.0} for t in times]
+
+
+def test_gaps_are_found_with_how_many_samples_they_lost():
+    detector = GapDetector("t", period=1.0)
+    assert detector.check(_samples([0, 1, 2, 5, 6, 8])) == [(2.0, 5.0, 2), (6.0, 8.0, 1)]
+    assert detector.samples == 6
+    assert detector.lost == 3
+    assert detector.loss_rate == pytest.approx(3 / 9)
+
+
+def test_gaps_between_batches_are_found():
+    detector = GapDetector("t", period=1.0)
+    assert detector.check(_samples([0, 1, 2])) == []
+    assert detector.check(_samples([6, 7])) == [(2.0, 6.0, 3)]
+    assert detector.check(_samples([])) == []
+
+
+def test_jitter_within_the_tolerance_is_no_gap():
+    detector = GapDetector("t", period=1.0, tolerance=1.5)
+    assert detector.check(_samples([0, 1.4, 2.3, 3.7])) == []
+
+
+def test_the_period_is_measured_from_the_first_samples():
+    detector = GapDetector("t")
+    assert detector.check(_samples([0.01 * i for i in range(17)])) == []
+    assert detector.period == pytest.approx(0.01)
+    assert detector.check(_samples([0.2, 0.21])) == [(pytest.approx(0.16), 0.2, 3)]
+
+
+def test_times_are_scaled_to_the_column_units():
+    detector = GapDetector("t", period=0.01, scale=0.001)
+    assert detector.check(_samples([0, 10, 40])) == [(0.01, 0.04, 2)]
+
+
+def test_from_config():
+    assert GapDetector.from_config(ARDUINO_CONFIG) is None
+    detector = GapDetector.from_config(
+        dict(ARDUINO_CONFIG, time_column="t", sample_period=0.5, tolerance=2),
+        scales={"t": 0.001})
+    assert (detector.column, detector.period, detector.tolerance, detector.scale) \
+        == ("t", 0.5, 2, 0.001)
+
+
+@pytest.mark.parametrize("extra, message", [
+    ({"time_column": "nope"}, "must be one of its columns"),
+    ({"time_column": "t", "sample_period": 0}, "must be positive"),
+    ({"time_column": "t", "tolerance": 1}, "more than 1 period"),
+])
+def test_invalid_gap_settings_are_rejected(extra, message):
+    with pytest.raises(ValueError, match=message):
+        GapDetector.from_config(dict(ARDUINO_CONFIG, **extra))
+
+
+def test_gaps_are_only_checked_on_serial_devices():
+    config = {"input": {"arduino": dict(ARDUINO_CONFIG, time_column="t")}}
+    assert build_gap_detector(config, object()) is None
+
+
+class _ListDevice(object):
+    def __init__(self, samples):
+        self.samples = list(samples)
+
+    def readsamples(self, num_samples):
+        batch, self.samples = self.samples[:num_samples], self.samples[num_samples:]
+        return batch
+
+
+def test_acquisition_marks_gaps_in_the_recording(tmp_path, caplog):
+    outfile_path = tmp_path / "out.txt"
+    device = _ListDevice(_samples([0.0, 1.0, 2.0, 4.0, 5.0, 9.0]))
+    with WriteSensorFile(filename=str(outfile_path), config={"columns": ["t"]}) as outfile:
+        acquisition = Acquisition(idev=device, buffers=DataBuffers(), outfile=outfile,
+                                  samples_per_step=3,
+                                  gap_detector=GapDetector("t", period=1.0))
+        with caplog.at_level(logging.WARNING, logger="aves.acquisition"):
+            acquisition.step()
+            acquisition.step()
+    assert outfile_path.read_text().splitlines()[2:] == [
+        "0.0", "1.0", "2.0",
+        "# gap: 1 samples lost between t=2.0 and t=4.0",
+        "# gap: 3 samples lost between t=5.0 and t=9.0",
+        "4.0", "5.0", "9.0"]
+    assert acquisition.metrics.counters["lost_samples"] == 4
+    assert "4 samples lost in 2 gaps" in caplog.text
@@ -1,5 +1,6 @@
 import subprocess
 import sys
+import types
 
 import matplotlib
 matplotlib.use("Agg")
@@ -106,3 +107,25 @@ def test_gui_rejects_unknown_axis_keys():
     }
     with pytest.raises(ValueError, match="unknown key.*facecolor"):
         SensorViewerGUI(config=config)
+
+
+def test_gui_plus_and_minus_keys_scale_the_plot_window():
+    scales = []
+    window = SensorViewerGUI(config=GUI_CONFIG, on_plot_window_scale=scales.append)
+    try:
+        for key in ("+", "-", "x"):
+            window._on_key_press(types.SimpleNamespace(key=key))
+    finally:
+        plt.close(window.fig)
+    assert scales == [2.0, 0.5]
+
+
+def test_gui_t_key_fires_the_trigger():
+    fired = []
+    window = SensorViewerGUI(config=GUI_CONFIG, on_trigger=lambda: fired.append(True))
+    try:
+        for key in ("t", "+", "x"):
+            window._on_key_press(types.SimpleNamespace(key=key))
+    finally:
+        plt.close(window.fig)
+    assert fired == [True]
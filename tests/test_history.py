@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from aves.history import TieredHistory, parse_tiers
+from aves.io import DataBuffers
+
+
+def _samples(times):
+    return [{"when": f"t{t}", "t": float(t), "a": float(t) * 10} for t in times]
+
+
+def test_parse_tiers():
+    assert parse_tiers("1:3600,60:1440") == [(1.0, 3600), (60.0, 1440)]
+    with pytest.raises(ValueError, match="finest to coarsest"):
+        parse_tiers("60:10,1:10")
+    with pytest.raises(ValueError, match="must look like"):
+        parse_tiers("1-3600")
+
+
+def test_tiers_are_built_incrementally_across_batches():
+    history = TieredHistory("t", [(2, 100), (4, 100)])
+    buffers = DataBuffers(maxlen=2, history=history)
+    # Batches that split buckets in arbitrary places
+    for batch in ([0, 1, 2], [3], [4, 5, 6, 7, 8]):
+        buffers.extend(_samples(batch))
+
+    fine, coarse = history.tiers
+    # [0, 1], [2, 3], [4, 5], [6, 7] are closed; [8] is still open
+    assert fine.count.tolist() == [2.0, 2.0, 2.0, 2.0]
+    assert fine.low["a"].tolist() == [0.0, 20.0, 40.0, 60.0]
+    assert fine.high["a"].tolist() == [10.0, 30.0, 50.0, 70.0]
+    assert (fine.total["a"].view() / fine.count.view()).tolist() == [5.0, 25.0, 45.0, 65.0]
+    assert fine.first["when"].tolist() == ["t0", "t2", "t4", "t6"]
+    # The coarse tier is fed the closed fine buckets: [0..3] is closed
+    assert coarse.count.tolist() == [4.0]
+    assert coarse.low["t"].tolist() == [0.0]
+    assert coarse.high["t"].tolist() == [3.0]
+
+
+def test_tiers_keep_a_bounded_number_of_buckets():
+    history = TieredHistory("t", [(1, 3)])
+    buffers = DataBuffers(maxlen=1, history=history)
+    buffers.extend(_samples(np.arange(0, 100, 0.5)))
+    assert history.tiers[0].low["t"].tolist() == [96.0, 97.0, 98.0]
+
+
+def test_stitched_puts_coarser_history_before_the_window():
+    history = TieredHistory("t", [(2, 2), (4, 10)])
+    buffers = DataBuffers(maxlen=2, history=history)
+    buffers.extend(_samples(range(12)))
+
+    data = buffers.stitched()
+
+    # Coarse [0..3], [4..7] as (min, max) pairs; fine [8, 9] (the fine
+    # tier keeps [6, 7] too, but it is already covered by the coarse
+    # one); then the window itself, [10, 11].
+    assert data["t"].tolist() == [0.0, 3.0, 4.0, 7.0, 8.0, 9.0, 10.0, 11.0]
+    assert data["a"].tolist() == [0.0, 30.0, 40.0, 70.0, 80.0, 90.0, 100.0, 110.0]
+    assert data["when"].tolist() == ["t0", "t0", "t4", "t4", "t8", "t8", "t10", "t11"]
+
+    recent = buffers.stitched(span=3)
+    assert recent["t"].tolist() == [8.0, 9.0, 10.0, 11.0]
+
+
+def test_stitched_means():
+    history = TieredHistory("t", [(2, 10)])
+    buffers = DataBuffers(maxlen=1, history=history)
+    buffers.extend(_samples(range(5)))
+    data = history.stitched(buffers.last(), envelope=False)
+    assert data["a"].tolist() == [5.0, 25.0, 40.0]
+
+
+def test_stitched_without_history_is_the_window():
+    buffers = DataBuffers(maxlen=2)
+    buffers.extend(_samples(range(5)))
+    assert buffers.stitched()["t"].tolist() == [3.0, 4.0]
+
+
+def test_history_needs_a_numeric_x_column():
+    buffers = DataBuffers(history=TieredHistory("when", [(1, 10)]))
+    with pytest.raises(ValueError, match="numeric"):
+        buffers.extend(_samples(range(3)))
+
+
+def test_widths_and_span_are_in_the_x_columns_converted_units():
+    # The device time in milliseconds, stored raw and scaled to seconds
+    history = TieredHistory("t", [(2, 10)], scale=0.001)
+    buffers = DataBuffers(maxlen=2, history=history, scales={"t": 0.001})
+    buffers.extend(_samples(range(0, 6000, 500)))
+
+    assert history.tiers[0].low["t"].tolist() == [0.0, 2000.0]
+    assert buffers.stitched()["t"].tolist() == [0.0, 1.5, 2.0, 3.5, 5.0, 5.5]
+    assert buffers.stitched(span=1)["t"].tolist() == [5.0, 5.5]
@@ -1,3 +1,4 @@
+import numpy as np
 import pytest
 
 from aves.io import DataBuffers, ReadSensorFile, ReadSensorSerial, WriteSensorFile
@@ -29,6 +30,31 @@ def test_databuffers_extend_and_extendleft():
     assert list(buffers.data["x"]) == [0, -1, 1, 2]
 
 
+def test_databuffers_keeps_each_column_in_a_ring_buffer():
+    buffers = DataBuffers(maxlen=3)
+    buffers.extend([{"t": "a", "x": 1}, {"t": "b", "x": 2}])
+    buffers.extend([{"t": "c", "x": 3}, {"t": "d", "x": 4}])
+    assert buffers.data["x"].view().tolist() == [2.0, 3.0, 4.0]
+    assert buffers.data["t"].tolist() == ["b", "c", "d"]
+
+
+def test_databuffers_last_and_since():
+    buffers = DataBuffers(maxlen=4)
+    buffers.extend([{"x": 1}, {"x": 2}, {"x": 3}])
+    seen = buffers.seq
+    buffers.append({"x": 4})
+    buffers.extend([{"x": 5}])
+
+    assert buffers.seq == 5
+    assert len(buffers) == 4
+    assert buffers.last()["x"].tolist() == [2.0, 3.0, 4.0, 5.0]
+    assert buffers.last(2)["x"].tolist() == [4.0, 5.0]
+    assert buffers.since(seen)["x"].tolist() == [4.0, 5.0]
+    assert buffers.since(buffers.seq)["x"].tolist() == []
+    # Older than what is still buffered: only what is left
+    assert buffers.since(0)["x"].tolist() == [2.0, 3.0, 4.0, 5.0]
+
+
 def test_databuffers_maxlen_drops_oldest_samples():
     buffers = DataBuffers(maxlen=2)
     buffers.extend([{"x": 1}, {"x": 2}, {"x": 3}])
@@ -124,6 +150,64 @@ def test_readsample_returns_none_at_eof(tmp_path):
     assert second is None
 
 
+def _follow_reader(infile, config):
+    return ReadSensorFile(filename=str(infile), config=config, follow=True,
+                          follow_timeout=0.05, poll_interval=0.001)
+
+
+def test_follow_keeps_reading_appended_lines(tmp_path):
+    infile = tmp_path / "in.txt"
+    infile.write_text("1\t2.0\n")
+    config = {"columns": ["a", "b"]}
+    with _follow_reader(infile, config) as reader:
+        assert reader.readsamples() == [{"a": "1", "b": 2.0}]
+        # Nothing new yet: no sample, but no end of input either
+        assert reader.readsample() is None
+        assert not reader.stop_sampling
+        with open(infile, "a") as stream:
+            stream.write("3\t4.0\n")
+        assert reader.readsamples() == [{"a": "3", "b": 4.0}]
+        assert not reader.stop_sampling
+
+
+def test_follow_waits_for_the_end_of_a_partially_written_line(tmp_path):
+    infile = tmp_path / "in.txt"
+    infile.write_text("1\t2")
+    config = {"columns": ["a", "b"]}
+    with _follow_reader(infile, config) as reader:
+        assert reader.readsample() is None
+        with open(infile, "a") as stream:
+            stream.write(".5\n")
+        assert reader.readsample() == {"a": "1", "b": 2.5}
+
+
+def test_follow_starts_over_when_the_file_is_truncated(tmp_path):
+    infile = tmp_path / "in.txt"
+    infile.write_text("1\t2.0\n3\t4.0\n")
+    config = {"columns": ["a", "b"]}
+    with _follow_reader(infile, config) as reader:
+        assert len(reader.readsamples()) == 2
+        infile.write_text("5\t6.0\n")
+        assert reader.readsamples() == [{"a": "5", "b": 6.0}]
+
+
+def test_follow_switches_to_the_new_file_after_rotation(tmp_path):
+    infile = tmp_path / "in.txt"
+    infile.write_text("1\t2.0\n")
+    config = {"columns": ["a", "b"]}
+    with _follow_reader(infile, config) as reader:
+        assert len(reader.readsamples()) == 1
+        # Written to the old file right before it is rotated away
+        with open(infile, "a") as stream:
+            stream.write("3\t4.0\n")
+        infile.rename(tmp_path / "in.txt.1")
+        infile.write_text("# header\n5\t6.0\n")
+        assert reader.readsamples() == [
+            {"a": "3", "b": 4.0},
+            {"a": "5", "b": 6.0},
+        ]
+
+
 def test_read_sensor_file_requires_columns(tmp_path):
     infile = tmp_path / "in.txt"
     infile.write_text("1\t2.0\n")
@@ -237,3 +321,208 @@ def test_readsensorserial_resets_garbage_count_after_a_good_sample(caplog):
     assert first["a"] == 1.0
     assert second["a"] == 2.0
     assert not reader.stop_sampling
+
+
+def test_databuffers_read_since_returns_deltas_or_asks_for_a_resync():
+    buffers = DataBuffers(maxlen=3)
+    data, seq, resync = buffers.read_since(None)
+    assert (data, seq, resync) == ({}, 0, True)
+
+    buffers.extend([{"a": 1}, {"a": 2}])
+    data, seq, resync = buffers.read_since(seq)
+    assert (data["a"].tolist(), seq, resync) == ([1.0, 2.0], 2, False)
+
+    buffers.extend([{"a": 3}])
+    data, seq, resync = buffers.read_since(seq)
+    assert (data["a"].tolist(), seq, resync) == ([3.0], 3, False)
+    data, seq, resync = buffers.read_since(seq)
+    assert (data["a"].tolist(), resync) == ([], False)
+
+    # Falling behind by more than the window holds
+    buffers.extend([{"a": 4}, {"a": 5}, {"a": 6}, {"a": 7}])
+    data, seq, resync = buffers.read_since(seq)
+    assert (data["a"].tolist(), seq, resync) == ([5.0, 6.0, 7.0], 7, True)
+
+
+def test_databuffers_snapshot_is_consistent_while_another_thread_appends():
+    import threading
+
+    buffers = DataBuffers(maxlen=50)
+    done = threading.Event()
+
+    def write():
+        for start in range(0, 20000, 7):
+            buffers.extend([{"a": i, "b": -i} for i in range(start, start + 7)])
+        done.set()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    torn = 0
+    reads = 0
+    while not done.is_set() or reads == 0:
+        data = buffers.snapshot()
+        reads += 1
+        if not data:
+            continue
+        a, b = data["a"], data["b"]
+        # Both columns from the same instant, with consecutive samples
+        if len(a) != len(b) or (a != -b).any() or (len(a) and (a[-1] - a[0] != len(a) - 1)):
+            torn += 1
+    writer.join()
+    assert torn == 0
+    assert buffers.version % 2 == 0
+
+
+def test_databuffers_read_consistent_retries_a_read_that_overlapped_a_write():
+    buffers = DataBuffers()
+    buffers.extend([{"a": 1}])
+    attempts = []
+
+    def read():
+        attempts.append(buffers.version)
+        if len(attempts) == 1:
+            # As if the writer had appended while this read was copying
+            buffers.extend([{"a": 2}])
+        return buffers.last()["a"].copy()
+
+    assert buffers._read_consistent(read).tolist() == [1.0, 2.0]
+    assert len(attempts) == 2
+
+
+def test_readsensorserial_keeps_columns_with_a_dtype_raw():
+    reader = _make_serial_reader([
+        {"name": "t", "conversion_factor": 0.001},
+        {"name": "v", "conversion_factor": 0.5, "dtype": "uint16"},
+    ])
+    reader._inputdata = FakeSerialPort([b"2000 1023\n"])
+
+    sample = reader.readsample()
+
+    assert sample["t"] == 2.0
+    assert sample["v"] == 1023.0
+    assert reader.column_dtypes == {"v": np.dtype("uint16")}
+    assert reader.column_scales == {"v": 0.5}
+
+
+def test_readsensorserial_discards_readings_that_do_not_fit_their_dtype(caplog):
+    reader = _make_serial_reader([
+        {"name": "t", "conversion_factor": 0.001},
+        {"name": "v", "conversion_factor": 0.5, "dtype": "uint16"},
+    ], max_consecutive_garbage_lines=4)
+    reader._inputdata = FakeSerialPort(
+        [b"1000 -1\n", b"2000 70000\n", b"3000 2.5\n", b"4000 65535\n"])
+
+    with caplog.at_level("WARNING"):
+        sample = reader.readsample()
+
+    assert (sample["t"], sample["v"]) == (4.0, 65535.0)
+    assert caplog.text.count("does not fit its dtype uint16") == 3
+    assert not reader.stop_sampling
+
+
+def test_readsensorserial_rejects_non_numeric_dtypes():
+    with pytest.raises(ValueError, match=r"columns\[0\].*dtype"):
+        _make_serial_reader([{"name": "v", "dtype": "str"}])
+
+
+def test_databuffers_store_compact_columns_and_scale_them_on_the_way_out():
+    buffers = DataBuffers(dtypes={"v": np.dtype("uint16")}, scales={"v": 0.5})
+    buffers.extend([{"t": 0.0, "v": 1023}, {"t": 1.0, "v": 7}])
+
+    assert buffers.data["v"].dtype == np.uint16
+    # last() hands out what is stored; the rest, scaled values
+    assert buffers.last()["v"].tolist() == [1023, 7]
+    assert buffers.snapshot()["v"].tolist() == [511.5, 3.5]
+    assert buffers.stitched()["v"].tolist() == [511.5, 3.5]
+    assert buffers.read_since(1)[0]["v"].tolist() == [3.5]
+    assert buffers.snapshot()["t"].tolist() == [0.0, 1.0]
+
+
+def test_write_sensor_file_scales_raw_columns_and_formats_dtypes(tmp_path):
+    config = {"columns": ["time_computer", "t", "v", "w"],
+              "dtypes": {"t": "int32", "w": "float32"}}
+    outfile = tmp_path / "out.txt"
+    with WriteSensorFile(filename=str(outfile), config=config, scales={"v": 0.5}) as writer:
+        writer.write([{"time_computer": "x", "t": 12.0, "v": 1023, "w": 0.1}])
+
+    assert outfile.read_text().splitlines()[2] == "x\t12\t511.5\t0.1"
+    with ReadSensorFile(filename=str(outfile), config=config) as reader:
+        assert reader.column_dtypes == {"t": np.dtype("int32"), "w": np.dtype("float32")}
+        assert reader.readsample()["v"] == 511.5
+
+
+def _timed_samples(times):
+    return [{"t": t, "v": 2 * t} for t in times]
+
+
+def test_databuffers_time_window_follows_the_time_column_not_the_rate():
+    buffers = DataBuffers(time_window=2.0, time_column="t")
+    # 10 Hz, then 100 Hz: the window still spans the last 2 units of t
+    buffers.extend(_timed_samples(np.arange(0, 5, 0.1)))
+    assert buffers.last()["t"][0] == pytest.approx(2.9)
+    assert len(buffers) == 21
+    buffers.extend(_timed_samples(np.arange(5, 10, 0.01)))
+    assert buffers.last()["t"][0] == pytest.approx(7.99)
+    assert buffers.rate == pytest.approx(100.0)
+    assert buffers.seq == 550
+
+
+def test_databuffers_time_window_sizes_storage_from_the_measured_rate(caplog):
+    buffers = DataBuffers(time_window=10.0, time_column="t")
+    for start in range(20):
+        buffers.extend(_timed_samples(start + np.arange(100) / 100))
+    # Room for what 10 units hold at 100 per unit, plus some slack and a
+    # batch, rather than the 2048 that doubling would have reached
+    capacity = buffers.data["v"].capacity
+    assert 1000 * 1.25 < capacity <= 1001 * 1.25 + 100
+    assert not caplog.records
+
+    # A faster rate needs more room, and says so
+    buffers.extend(_timed_samples(np.arange(20, 30, 0.001)))
+    assert buffers.data["v"].capacity > capacity
+    assert "sample rate went up" in caplog.text
+
+
+def test_databuffers_time_window_capped_by_maxlen_says_so(caplog):
+    buffers = DataBuffers(maxlen=5, time_window=10.0, time_column="t")
+    buffers.extend(_timed_samples(range(8)))
+    assert buffers.last()["t"].tolist() == [3.0, 4.0, 5.0, 6.0, 7.0]
+    assert "only cover" in caplog.text
+
+    buffers.set_time_window(2.0)
+    assert buffers.last()["t"].tolist() == [5.0, 6.0, 7.0]
+
+
+def test_databuffers_time_window_uses_the_scaled_time_column():
+    # A uint32 milliseconds column: the window is in scaled units (s)
+    buffers = DataBuffers(dtypes={"t": np.dtype("uint32")}, scales={"t": 0.001},
+                          time_window=1.5, time_column="t")
+    buffers.extend(_timed_samples(range(0, 5000, 500)))
+    assert buffers.snapshot()["t"].tolist() == [3.0, 3.5, 4.0, 4.5]
+
+
+class FakeNonBlockingSerialPort:
+    """Stands in for a pyserial Serial object that has received chunks of bytes."""
+
+    def __init__(self, chunks):
+        self._chunks = list(chunks)
+
+    @property
+    def in_waiting(self):
+        return len(self._chunks[0]) if self._chunks else 0
+
+    def read(self, size):
+        assert size == len(self._chunks[0])
+        return self._chunks.pop(0)
+
+
+def test_readsensorserial_readsamples_nowait_keeps_partial_lines():
+    reader = _make_serial_reader([{"name": "a"}, {"name": "b", "conversion_factor": 2.0}])
+    reader._inputdata = FakeNonBlockingSerialPort([b"1 2\n3 ", b"4\n5", b""])
+
+    assert [(s["a"], s["b"]) for s in reader.readsamples_nowait()] == [(1.0, 4.0)]
+    assert [(s["a"], s["b"]) for s in reader.readsamples_nowait()] == [(3.0, 8.0)]
+    assert reader.readsamples_nowait() == []
+    assert not reader.stop_sampling
+    reader.timed_out()
+    assert reader.stop_sampling
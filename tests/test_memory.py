@@ -0,0 +1,97 @@
+import logging
+
+import numpy as np
+import pytest
+
+from aves.history import TieredHistory
+from aves.io import DataBuffers
+from aves.memory import (
+    MemoryBudget, buffers_usage, format_report, parse_policy, parse_size, report)
+
+
+def _samples(num_samples):
+    return [{"time_computer": "2020-01-01T00:00:00", "t": float(i), "a": float(i)}
+            for i in range(num_samples)]
+
+
+def test_parse_size_and_policy():
+    assert parse_size("1024") == 1024
+    assert parse_size("64K") == 64 * 1024
+    assert parse_size("1.5m") == 1536 * 1024
+    assert parse_size("2GB") == 2 * 1024 ** 3
+    with pytest.raises(ValueError, match="Memory sizes"):
+        parse_size("lots")
+    assert parse_policy("clients, buffers") == ["clients", "buffers"]
+    with pytest.raises(ValueError, match="Unknown memory policy"):
+        parse_policy("swap")
+
+
+def test_buffers_usage_lists_every_column_and_the_history():
+    buffers = DataBuffers(maxlen=100, capacity=400,
+                          dtypes={"a": np.dtype("uint16")},
+                          history=TieredHistory("t", [(10, 10)]))
+    buffers.extend(_samples(50))
+    usage = buffers_usage(buffers)
+
+    # Twice the capacity (see aves.ringbuffer), of 8 or 2 bytes
+    assert usage["columns"]["t"] == 800 * 8
+    assert usage["columns"]["a"] == 800 * 2
+    assert usage["columns"]["time_computer"] > 800 * 8
+    assert usage["history"] > 0
+    assert usage["total"] == sum(usage["columns"].values()) + usage["history"]
+    assert "column 'a'" in format_report(report(buffers))
+
+
+def test_budget_shrinks_the_buffers_to_fit(caplog):
+    buffers = DataBuffers(maxlen=1000, capacity=4000)
+    buffers.extend([{"a": float(i)} for i in range(1000)])
+    shrunk = []
+    budget = MemoryBudget(limit=20000, policy=["buffers"], on_shrink=shrunk.append)
+
+    with caplog.at_level(logging.WARNING):
+        assert budget.check(buffers) == 8000 * 8
+    assert buffers_usage(buffers)["total"] <= 20000
+    assert buffers.last()["a"][-1] == 999.0
+    assert "shrinking the plot window" in caplog.text
+    assert shrunk[-1] == buffers.maxlen < 1000
+    # Not checked again until the interval has passed
+    assert budget.check(buffers) is None
+
+
+class FakeBroadcaster:
+    def __init__(self, sizes):
+        self.sizes = dict(sizes)
+        self.dropped = []
+
+    def memory_usage(self):
+        return [{"client": client, "messages": 1, "bytes": size}
+                for client, size in self.sizes.items()]
+
+    def drop(self, client):
+        self.dropped.append(client)
+        del self.sizes[client]
+
+
+def test_budget_drops_the_client_furthest_behind_first():
+    buffers = DataBuffers(maxlen=10)
+    buffers.extend([{"a": 1.0}])
+    broadcaster = FakeBroadcaster({1: 5000, 2: 50000, 3: 100})
+    budget = MemoryBudget(limit=10000, broadcaster=broadcaster)
+
+    budget.check(buffers)
+
+    assert broadcaster.dropped == [2]
+    assert buffers.maxlen == 10
+
+
+def test_budget_shrinks_the_buffers_rather_than_drop_idle_clients():
+    buffers = DataBuffers(maxlen=1000, capacity=4000)
+    buffers.extend([{"a": float(i)} for i in range(1000)])
+    broadcaster = FakeBroadcaster({1: 0, 2: 0, 3: 0})
+    budget = MemoryBudget(limit=20000, broadcaster=broadcaster)
+
+    budget.check(buffers)
+
+    assert broadcaster.dropped == []
+    assert buffers.maxlen < 1000
+    assert report(buffers, broadcaster)["total"] <= 20000
@@ -0,0 +1,53 @@
+import pytest
+
+from aves.acquisition import Acquisition
+from aves.io import DataBuffers, ReadSensorFile, WriteSensorFile
+from aves.metrics import Histogram, Metrics
+
+
+def test_histogram_buckets_by_powers_of_two():
+    histogram = Histogram()
+    for value in [0, 1, 3, 900, 1000, 1023, 5000]:
+        histogram.record(value)
+    assert histogram.count == 7
+    assert histogram.total == 7927
+    assert histogram.max == 5000
+    assert histogram.buckets[10] == 3  # 512 <= value < 1024
+    assert histogram.quantile(0.5) == 1023
+    assert histogram.quantile(1.0) == 5000  # capped at the largest value
+    assert Histogram().quantile(0.5) == 0
+
+
+def test_metrics_snapshot_and_format():
+    metrics = Metrics()
+    metrics.record("read", 2000)
+    metrics.record("read", 4000)
+    metrics.add("samples", 10)
+    with metrics.timer("render"):
+        pass
+    snapshot = metrics.snapshot()
+    assert snapshot["stages"]["read"]["count"] == 2
+    assert snapshot["stages"]["read"]["mean_us"] == pytest.approx(3.0)
+    assert snapshot["stages"]["read"]["max_us"] == pytest.approx(4.0)
+    assert snapshot["stages"]["render"]["count"] == 1
+    assert snapshot["counters"]["samples"]["total"] == 10
+    assert snapshot["counters"]["samples"]["per_second"] > 0
+    text = metrics.format()
+    assert "read: 2 times" in text and "samples: 10" in text
+
+
+def test_acquisition_records_its_steps(tmp_path):
+    infile = tmp_path / "in.txt"
+    infile.write_text("1\t2.0\n3\t4.0\n5\t6.0\n")
+    config = {"columns": ["a", "b"]}
+    with ReadSensorFile(filename=str(infile), config=config) as idev, \
+            WriteSensorFile(filename=str(tmp_path / "out.txt"), config=config) as outfile:
+        acquisition = Acquisition(idev=idev, buffers=DataBuffers(), outfile=outfile,
+                                  samples_per_step=2)
+        acquisition.step()
+        acquisition.step()
+    snapshot = acquisition.metrics.snapshot()
+    assert {name: stage["count"] for name, stage in snapshot["stages"].items()} == {
+        "read": 2, "write": 2, "buffer": 2}
+    assert snapshot["counters"]["samples"]["total"] == 3
+    assert snapshot["counters"]["bytes"]["total"] == len(infile.read_text())
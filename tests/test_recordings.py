@@ -0,0 +1,101 @@
+import os
+
+import pytest
+
+from aves.io import ReadSensorFile
+from aves.recordings import (
+    INDEX_SUFFIX, RecordingIndex, main, merge_samples, slice_samples, write_samples)
+
+OUTPUT_CONFIG = {"columns": ["time_computer", "t", "a"]}
+
+
+def _write_recording(path, times):
+    lines = ["# 2020-01-01", "#time_computer\tt\ta"]
+    lines += [f"2020-01-01T00:00:{int(t):02d}\t{t}\t{t * 10}" for t in times]
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def _read_all(filename):
+    with ReadSensorFile(filename=filename, config=OUTPUT_CONFIG) as reader:
+        return reader.readsamples()
+
+
+def test_index_points_at_every_stride_th_sample(tmp_path):
+    infile = _write_recording(tmp_path / "in.txt", range(10))
+    index = RecordingIndex.build(infile, OUTPUT_CONFIG, "t", stride=4)
+
+    assert index.keys == [0.0, 4.0, 8.0]
+    with open(infile, "rb") as stream:
+        stream.seek(index.offsets[1])
+        assert stream.readline().split()[1] == b"4"
+    # Read from the last indexed sample below 6
+    assert index.offset_for(6.0) == index.offsets[1]
+    assert index.offset_for(4.0) == index.offsets[0]
+    assert index.offset_for(-1.0) == 0
+
+
+def test_index_is_saved_and_rebuilt_when_the_recording_changes(tmp_path):
+    infile = _write_recording(tmp_path / "in.txt", range(10))
+    RecordingIndex.load_or_build(infile, OUTPUT_CONFIG, "t", stride=4)
+    assert os.path.exists(infile + INDEX_SUFFIX)
+
+    _write_recording(tmp_path / "in.txt", range(20))
+    index = RecordingIndex.load_or_build(infile, OUTPUT_CONFIG, "t", stride=4)
+    assert index.keys[-1] == 16.0
+
+
+def test_slice_samples_keeps_the_half_open_range(tmp_path):
+    infile = _write_recording(tmp_path / "in.txt", range(10))
+    index = RecordingIndex.build(infile, OUTPUT_CONFIG, "t", stride=3)
+
+    samples = list(slice_samples(infile, OUTPUT_CONFIG, "t", start="4", stop="7", index=index))
+
+    assert [sample["t"] for sample in samples] == [4.0, 5.0, 6.0]
+
+
+def test_slice_samples_by_the_text_time_column(tmp_path):
+    infile = _write_recording(tmp_path / "in.txt", range(10))
+    samples = list(slice_samples(infile, OUTPUT_CONFIG, "time_computer",
+                                 start="2020-01-01T00:00:08"))
+    assert [sample["t"] for sample in samples] == [8.0, 9.0]
+
+
+def test_merge_samples_interleaves_in_order(tmp_path):
+    first = _write_recording(tmp_path / "a.txt", [0, 2, 4])
+    second = _write_recording(tmp_path / "b.txt", [1, 2, 3, 5])
+
+    samples = list(merge_samples([first, second], OUTPUT_CONFIG, "t", chunk_size=2))
+
+    assert [sample["t"] for sample in samples] == [0, 1, 2, 2, 3, 4, 5]
+
+
+def test_write_samples_round_trips(tmp_path):
+    infile = _write_recording(tmp_path / "in.txt", range(5))
+    outfile = str(tmp_path / "out.txt")
+    assert write_samples(iter(_read_all(infile)), outfile, OUTPUT_CONFIG, chunk_size=2) == 5
+    assert _read_all(outfile) == _read_all(infile)
+
+
+def test_main_slice_and_merge(tmp_path, capsys):
+    config_file = tmp_path / "config.toml"
+    config_file.write_text(
+        'version = 3\n\n[gui]\nx_column = "t"\nzoom_all_together = true\naxes = []\n\n'
+        '[output]\ncolumns = ["time_computer", "t", "a"]\n')
+    first = _write_recording(tmp_path / "a.txt", range(0, 10, 2))
+    second = _write_recording(tmp_path / "b.txt", range(1, 10, 2))
+    merged = str(tmp_path / "merged.txt")
+    cut = str(tmp_path / "cut.txt")
+
+    main(["--config", str(config_file), "merge", first, second, "--outfile", merged])
+    main(["--config", str(config_file), "slice", merged, "--start", "3", "--outfile", cut])
+
+    assert [sample["t"] for sample in _read_all(merged)] == list(range(10))
+    assert [sample["t"] for sample in _read_all(cut)] == list(range(3, 10))
+    assert "Wrote 7 samples" in capsys.readouterr().out
+
+
+def test_unknown_column_is_reported(tmp_path):
+    infile = _write_recording(tmp_path / "in.txt", range(3))
+    with pytest.raises(ValueError, match="Unknown column"):
+        list(slice_samples(infile, OUTPUT_CONFIG, "nope", start=1))
@@ -0,0 +1,147 @@
+from collections import deque
+
+import numpy as np
+import pytest
+
+from aves.ringbuffer import RingBuffer
+
+
+def test_ringbuffer_view_is_chronological_after_wrapping_around():
+    ring = RingBuffer(maxlen=4)
+    ring.extend([1, 2, 3])
+    ring.extend([4, 5, 6])
+    assert ring.view().tolist() == [3.0, 4.0, 5.0, 6.0]
+    assert len(ring) == 4
+    assert ring[0] == 3.0 and ring[-1] == 6.0
+
+
+def test_ringbuffer_view_does_not_copy():
+    ring = RingBuffer(maxlen=4)
+    ring.extend([1, 2, 3, 4, 5])
+    view = ring.view()
+    assert np.shares_memory(view, ring._storage)
+    assert np.asarray(ring).base is view.base
+    with pytest.raises(ValueError):
+        view[0] = 0.0  # read-only
+
+
+def test_ringbuffer_batch_larger_than_maxlen_keeps_its_tail():
+    ring = RingBuffer(maxlen=3)
+    ring.extend(np.arange(10))
+    assert ring.tolist() == [7.0, 8.0, 9.0]
+
+
+def test_ringbuffer_unlimited_grows():
+    ring = RingBuffer()
+    for start in range(0, 100, 7):
+        ring.extend(list(range(start, start + 7)))
+    assert ring.tolist() == list(range(105))
+
+
+def test_ringbuffer_keeps_text_as_objects():
+    ring = RingBuffer(maxlen=2)
+    ring.extend(["a", "b", "c"])
+    assert ring.dtype == object
+    assert ring.tolist() == ["b", "c"]
+
+
+def test_ringbuffer_switches_to_objects_when_text_follows_numbers():
+    ring = RingBuffer(maxlen=3)
+    ring.extend([1.0])
+    ring.extend(["x"])
+    assert ring.tolist() == [1.0, "x"]
+
+
+@pytest.mark.parametrize("maxlen", [None, 3])
+def test_ringbuffer_mixed_appends_behave_like_a_deque(maxlen):
+    ring = RingBuffer(maxlen=maxlen)
+    reference = deque(maxlen=maxlen)
+    operations = [
+        ("extend", [1, 2]), ("appendleft", 0), ("extendleft", [-1, -2]),
+        ("append", 3), ("extend", [4, 5, 6, 7]), ("extendleft", [8, 9, 10, 11]),
+    ]
+    for name, argument in operations:
+        getattr(ring, name)(argument)
+        getattr(reference, name)(argument)
+        assert ring.tolist() == list(reference)
+
+
+def test_ringbuffer_set_maxlen():
+    ring = RingBuffer(maxlen=None)
+    ring.extend([1, 2, 3, 4])
+    ring.set_maxlen(2)
+    assert ring.tolist() == [3.0, 4.0]
+    ring.append(5)
+    assert ring.tolist() == [4.0, 5.0]
+    ring.set_maxlen(None)
+    ring.extend([6, 7])
+    assert ring.tolist() == [4.0, 5.0, 6.0, 7.0]
+
+
+def test_ringbuffer_maxlen_zero_stays_empty():
+    ring = RingBuffer(maxlen=0)
+    ring.extend([1, 2])
+    assert len(ring) == 0
+    assert ring.tolist() == []
+
+
+def test_ringbuffer_resizing_within_capacity_does_not_reallocate():
+    ring = RingBuffer(maxlen=4, capacity=8)
+    ring.extend([1, 2, 3, 4, 5])
+    storage = ring._storage
+    ring.set_maxlen(2)
+    assert ring.tolist() == [4.0, 5.0]
+    ring.set_maxlen(8)
+    # Dropped values don't come back when the window grows again
+    assert ring.tolist() == [4.0, 5.0]
+    ring.extend([6, 7, 8, 9, 10, 11])
+    assert ring.tolist() == [4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0, 11.0]
+    assert ring._storage is storage
+
+
+def test_ringbuffer_growing_beyond_capacity_keeps_values():
+    ring = RingBuffer(maxlen=3)
+    ring.extend([1, 2, 3, 4])
+    ring.set_maxlen(5)
+    assert ring.capacity == 5
+    ring.extend([5, 6])
+    assert ring.tolist() == [2.0, 3.0, 4.0, 5.0, 6.0]
+
+
+def test_ringbuffer_with_given_storage_never_reallocates():
+    storage = np.zeros(6)
+    ring = RingBuffer(storage=storage)
+    ring.extend([1, 2, 3, 4, 5])
+    assert ring.tolist() == [3.0, 4.0, 5.0]
+    ring.set_maxlen(10)
+    ring.append(6)
+    assert ring.tolist() == [4.0, 5.0, 6.0]
+    assert ring._storage is storage
+    assert np.shares_memory(ring.view(), storage)
+
+
+def test_ringbuffer_drop_and_set_capacity():
+    ring = RingBuffer()
+    ring.extend(np.arange(20))
+    ring.drop(15)
+    assert ring.tolist() == [15.0, 16.0, 17.0, 18.0, 19.0]
+    ring.set_capacity(6)
+    assert ring.capacity == 6
+    ring.extend([20, 21])
+    assert ring.tolist() == [15.0, 16.0, 17.0, 18.0, 19.0, 20.0, 21.0]
+    ring.drop(100)
+    assert len(ring) == 0
+
+
+def test_ringbuffer_rounds_and_clips_what_does_not_fit_an_integer_dtype(caplog):
+    buffer = RingBuffer(maxlen=8, dtype=np.uint16)
+    with caplog.at_level("WARNING", logger="aves.ringbuffer"):
+        buffer.extend(np.array([1.0, 2.6, -1.0, 70000.0]))
+    assert buffer.tolist() == [1, 3, 0, 65535]
+    assert "do not fit uint16" in caplog.text
+    caplog.clear()
+    with caplog.at_level("WARNING", logger="aves.ringbuffer"):
+        buffer.extend([4, 5])
+        buffer.extendleft(np.array([7], dtype=np.uint8))
+    assert buffer.tolist() == [7, 1, 3, 0, 65535, 4, 5]
+    assert caplog.text == ""
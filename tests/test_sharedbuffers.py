@@ -0,0 +1,91 @@
+import os
+import subprocess
+import sys
+import uuid
+
+import numpy as np
+import pytest
+
+from aves.sharedbuffers import SharedBuffersReader, SharedDataBuffers
+
+
+@pytest.fixture
+def name():
+    return "aves_test_" + uuid.uuid4().hex[:8]
+
+
+def _samples(values):
+    return [{"time_computer": "2020-01-01T00:00:00", "a": v, "b": -v} for v in values]
+
+
+def test_reader_sees_what_the_writer_appends(name):
+    with SharedDataBuffers(name, ["a", "b"], capacity=8, maxlen=4) as buffers:
+        buffers.extend(_samples(range(6)))
+        with SharedBuffersReader(name) as reader:
+            assert reader.columns == ["a", "b"]
+            data, seq, resync = reader.read_since(None)
+            assert (data["a"].tolist(), seq, resync) == ([2.0, 3.0, 4.0, 5.0], 6, True)
+
+            buffers.append(_samples([9])[0])
+            data, seq, resync = reader.read_since(seq)
+            assert (data["b"].tolist(), seq, resync) == ([-9.0], 7, False)
+            # The window can be resized within the capacity
+            buffers.set_maxlen(8)
+            buffers.extend(_samples([10, 11, 12]))
+            assert reader.snapshot()["a"].tolist() == [3, 4, 5, 9, 10, 11, 12]
+        # Text columns stay in the writing process
+        assert buffers.last()["time_computer"][-1] == "2020-01-01T00:00:00"
+
+
+def test_reader_views_are_read_only(name):
+    with SharedDataBuffers(name, ["a"], capacity=4) as buffers:
+        buffers.extend([{"a": 1.0}])
+        with SharedBuffersReader(name) as reader:
+            view = reader.last()["a"]
+            with pytest.raises(ValueError):
+                view[0] = 2.0
+            del view
+
+
+def test_reader_in_another_process(name, tmp_path):
+    with SharedDataBuffers(name, ["a", "b"], capacity=4) as buffers:
+        buffers.extend(_samples([1, 2, 3]))
+        result = subprocess.run(
+            [sys.executable, "-c",
+             "from aves.sharedbuffers import SharedBuffersReader\n"
+             f"with SharedBuffersReader({name!r}) as reader:\n"
+             "    print(reader.snapshot()['b'].tolist())\n"],
+            capture_output=True, text=True,
+            env=dict(os.environ, PYTHONPATH=os.getcwd()))
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip() == "[-1.0, -2.0, -3.0]"
+        # The reader exiting does not remove the block
+        with SharedBuffersReader(name) as reader:
+            assert reader.seq == 3
+
+
+def test_writer_keeps_its_data_after_closing(name):
+    buffers = SharedDataBuffers(name, ["a"], capacity=4)
+    buffers.extend([{"a": 1.0}, {"a": 2.0}])
+    buffers.close()
+    buffers.append({"a": 3.0})
+    assert buffers.last()["a"].tolist() == [1.0, 2.0, 3.0]
+    with pytest.raises(FileNotFoundError):
+        SharedBuffersReader(name)
+
+
+def test_shared_columns_keep_their_dtype_and_scale(name):
+    with SharedDataBuffers(name, ["v"], capacity=4, dtypes={"v": np.dtype("uint16")},
+                           scales={"v": 0.5}) as buffers:
+        buffers.extend([{"v": 1023}, {"v": 7}])
+        with SharedBuffersReader(name) as reader:
+            assert reader.last()["v"].dtype == np.uint16
+            assert reader.snapshot()["v"].tolist() == [511.5, 3.5]
+
+
+def test_shared_time_window_is_what_readers_see(name):
+    with SharedDataBuffers(name, ["a"], capacity=16, maxlen=8,
+                           time_window=2.0, time_column="a") as buffers:
+        buffers.extend([{"a": v} for v in range(10)])
+        with SharedBuffersReader(name) as reader:
+            assert reader.snapshot()["a"].tolist() == [7.0, 8.0, 9.0]
@@ -0,0 +1,77 @@
+import json
+
+import numpy as np
+import pytest
+
+from aves.stats import compute, main, parse_arguments
+
+OUTPUT_CONFIG = {"columns": ["time_computer", "t", "a"]}
+
+
+def _write_recording(path, values, start=0):
+    lines = ["#time_computer\tt\ta"]
+    lines += [f"2020-01-01T00:00:00\t{start + i}\t{value}" for i, value in enumerate(values)]
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+@pytest.fixture
+def recordings(tmp_path):
+    return [
+        _write_recording(tmp_path / "one.txt", [1.0, 2.0, 3.0]),
+        _write_recording(tmp_path / "two.txt", [4.0, 5.0], start=3),
+    ]
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_compute_merges_statistics_over_files(recordings, jobs):
+    result = compute(recordings, OUTPUT_CONFIG, ["a"], chunk_size=2, jobs=jobs)
+    stats = result["stats"]["a"]
+    assert (stats.count, stats.minimum, stats.maximum, stats.mean) == (5, 1.0, 5.0, 3.0)
+    assert stats.std == pytest.approx(np.std([1.0, 2.0, 3.0, 4.0, 5.0]))
+
+
+def test_compute_histograms(recordings):
+    result = compute(recordings, OUTPUT_CONFIG, ["a"], chunk_size=2, bins=2, jobs=1)
+    edges, counts = result["histograms"]["a"]
+    assert list(edges) == [1.0, 3.0, 5.0]
+    assert list(counts) == [2, 3]
+
+
+def test_compute_time_buckets(recordings):
+    result = compute(recordings, OUTPUT_CONFIG, ["a"], chunk_size=2,
+                     bucket_column="t", bucket_width=2.0, jobs=1)
+    buckets = result["buckets"]["a"]
+    assert sorted(buckets) == [0.0, 2.0, 4.0]
+    assert buckets[2.0].count == 2
+    assert buckets[2.0].mean == 3.5
+
+
+def test_main_prints_json(tmp_path, recordings, capsys):
+    config_file = tmp_path / "config.toml"
+    config_file.write_text(
+        'version = 3\n\n[gui]\nx_column = "t"\nzoom_all_together = true\naxes = []\n\n'
+        '[output]\ncolumns = ["time_computer", "t", "a"]\n')
+    main(["--config", str(config_file), "--bucket", "10", "--jobs", "1",
+          "--json"] + recordings)
+    result = json.loads(capsys.readouterr().out)
+    assert result["stats"]["a"]["count"] == 5
+    assert result["stats"]["t"]["max"] == 4.0
+    # Bucketed by the gui's x_column by default
+    assert result["buckets"]["a"] == [
+        {"start": 0.0, "count": 5, "min": 1.0, "max": 5.0, "mean": 3.0,
+         "std": pytest.approx(np.std([1.0, 2.0, 3.0, 4.0, 5.0]))}]
+
+
+def test_main_rejects_unknown_columns(tmp_path, recordings):
+    config_file = tmp_path / "config.toml"
+    config_file.write_text('version = 3\n\n[output]\ncolumns = ["time_computer", "t", "a"]\n')
+    with pytest.raises(ValueError, match="Unknown column"):
+        main(recordings + ["--config", str(config_file), "--columns", "nope"])
+
+
+@pytest.mark.parametrize("chunk_size", ["0", "-1"])
+def test_chunk_sizes_below_one_are_rejected(chunk_size, capsys):
+    with pytest.raises(SystemExit):
+        parse_arguments(["in.txt", "--chunk-size", chunk_size])
+    assert "--chunk-size must be at least 1" in capsys.readouterr().err
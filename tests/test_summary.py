@@ -0,0 +1,98 @@
+import json
+import math
+
+import numpy as np
+import pytest
+
+from aves.io import WriteSensorFile
+from aves.summary import RecordingSummary, RunningStats
+
+CONFIG = {"columns": ["time_computer", "t", "a"], "summary_chunk_size": 4}
+
+
+def _record(path, values, config=CONFIG):
+    with WriteSensorFile(filename=str(path), config=config) as writer:
+        writer.write([
+            {"time_computer": f"2020-01-01T00:00:{i:02d}", "t": float(i), "a": value}
+            for i, value in enumerate(values)])
+
+
+def test_running_stats_update_and_merge():
+    first = RunningStats()
+    for value in [1.0, 2.0, 3.0]:
+        first.update(value)
+    second = RunningStats()
+    second.update_array(np.array([4.0, 5.0]))
+    first.merge(second)
+
+    assert first.count == 5
+    assert (first.minimum, first.maximum) == (1.0, 5.0)
+    assert first.mean == 3.0
+    assert first.std == pytest.approx(np.std([1.0, 2.0, 3.0, 4.0, 5.0]))
+
+
+def test_running_stats_empty():
+    stats = RunningStats()
+    assert math.isnan(stats.mean)
+    assert math.isnan(stats.std)
+
+
+def test_writer_keeps_a_summary_sidecar_per_chunk(tmp_path):
+    outfile = tmp_path / "out.txt"
+    _record(outfile, [1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
+
+    lines = (tmp_path / "out.txt.summary").read_text().splitlines()
+    assert json.loads(lines[0]) == {"columns": CONFIG["columns"], "chunk_size": 4}
+    chunks = [json.loads(line) for line in lines[1:]]
+    # 4 samples, then the incomplete last chunk written on close
+    assert [(chunk["first"], chunk["count"]) for chunk in chunks] == [(0, 4), (4, 2)]
+    assert chunks[0]["stats"]["a"] == [4, 1.0, 4.0, 10.0, 30.0]
+    # Text columns are not summarized
+    assert "time_computer" not in chunks[0]["stats"]
+
+
+def test_writer_without_summary_chunk_size_writes_no_sidecar(tmp_path):
+    outfile = tmp_path / "out.txt"
+    _record(outfile, [1.0], config={"columns": CONFIG["columns"]})
+    assert not (tmp_path / "out.txt.summary").exists()
+
+
+def test_writer_rejects_a_non_positive_chunk_size(tmp_path):
+    with pytest.raises(ValueError, match="summary_chunk_size"):
+        WriteSensorFile(filename=str(tmp_path / "out.txt"),
+                        config={"columns": ["a"], "summary_chunk_size": -1})
+
+
+def test_summary_range_stats_by_index_and_by_column(tmp_path):
+    outfile = tmp_path / "out.txt"
+    _record(outfile, [1.0, 2.0, 3.0, 4.0, 10.0, 20.0, 30.0, 40.0, 0.0])
+    summary = RecordingSummary(str(outfile))
+
+    assert summary.num_samples == 9
+    whole = summary.range_stats("a")
+    assert (whole.count, whole.minimum, whole.maximum) == (9, 0.0, 40.0)
+    # Samples 4..7 are exactly the second chunk
+    second = summary.range_stats("a", start=4, stop=8)
+    assert (second.count, second.mean) == (4, 25.0)
+    # t in [5, 6) only touches the second chunk, which counts as a whole
+    by_time = summary.range_stats("a", start=5.0, stop=6.0, by="t")
+    assert (by_time.count, by_time.maximum) == (4, 40.0)
+
+
+def test_summary_bucketed_stats(tmp_path):
+    outfile = tmp_path / "out.txt"
+    _record(outfile, [1.0, 2.0, 3.0, 4.0, 10.0, 20.0, 30.0, 40.0, 0.0])
+    summary = RecordingSummary(str(outfile) + ".summary")
+
+    buckets = summary.bucketed_stats("a", by="t", width=8.0)
+
+    assert [start for start, _ in buckets] == [0.0, 8.0]
+    assert buckets[0][1].count == 8
+    assert buckets[1][1].maximum == 0.0
+
+
+def test_summary_rejects_an_unknown_range_column(tmp_path):
+    outfile = tmp_path / "out.txt"
+    _record(outfile, [1.0])
+    with pytest.raises(ValueError, match="not a numeric column"):
+        RecordingSummary(str(outfile)).range_stats("a", by="time_computer")
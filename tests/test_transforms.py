@@ -0,0 +1,277 @@
+import numpy as np
+import pytest
+
+from aves.acquisition import Acquisition
+from aves.io import DataBuffers, ReadSensorAbstract, WriteSensorFile
+from aves.metrics import Metrics
+from aves.transforms import (
+    CompiledExpression, TransformPipeline, added_columns, to_columns, to_rows)
+from aves.wiring import build_transforms
+
+
+def _batch(**columns):
+    return {name: np.asarray(values) for name, values in columns.items()}
+
+
+def _pipeline(*tables):
+    return TransformPipeline.from_config(list(tables))
+
+
+def test_to_columns_and_to_rows_round_trip():
+    samples = [{"t": 0.0, "a": 1}, {"t": 0.5, "a": 2}]
+    columns = to_columns(samples)
+    assert columns["a"].tolist() == [1, 2]
+    assert to_rows(columns) == samples
+    assert to_columns([]) == {}
+
+
+def test_calibrate_applies_gain_and_offset_to_its_columns_only():
+    pipeline = _pipeline({"type": "calibrate", "columns": ["a"], "gain": 2, "offset": -1})
+    columns = pipeline(_batch(t=[0.0, 1.0], a=[1.0, 3.0]))
+    assert columns["a"].tolist() == [1.0, 5.0]
+    assert columns["t"].tolist() == [0.0, 1.0]
+
+
+def test_clip_limits_values():
+    pipeline = _pipeline({"type": "clip", "columns": ["a"], "min": 0, "max": 10})
+    assert pipeline(_batch(a=[-5.0, 5.0, 15.0]))["a"].tolist() == [0.0, 5.0, 10.0]
+
+
+def test_decimate_keeps_one_in_factor_across_batches():
+    pipeline = _pipeline({"type": "decimate", "factor": 4})
+    kept = []
+    for start in range(0, 30, 7):
+        kept += pipeline(_batch(a=np.arange(start, min(start + 7, 30))))["a"].tolist()
+    assert kept == list(range(0, 30, 4))
+
+
+def test_stages_run_in_order():
+    pipeline = _pipeline(
+        {"type": "calibrate", "columns": ["a"], "gain": 10},
+        {"type": "clip", "columns": ["a"], "max": 25},
+    )
+    assert pipeline(_batch(a=[1.0, 2.0, 3.0]))["a"].tolist() == [10.0, 20.0, 25.0]
+
+
+@pytest.mark.parametrize("table, message", [
+    ({"type": "smooth"}, "unknown type 'smooth'"),
+    ({"columns": ["a"]}, "type"),
+    ({"type": "clip", "columns": ["a"]}, "'min', a 'max'"),
+    ({"type": "calibrate", "columns": "a"}, "list of column names"),
+    ({"type": "decimate", "factor": 0}, "positive integer"),
+])
+def test_invalid_stages_are_rejected(table, message):
+    with pytest.raises(ValueError, match=message):
+        _pipeline(table)
+
+
+@pytest.mark.parametrize("kind", ["calibrate", "clip"])
+def test_stages_may_not_change_columns_kept_raw(kind):
+    table = {"type": kind, "columns": ["b", "a"], "gain": 2, "max": 1}
+    assert TransformPipeline.from_config([table], scales={"t": 0.001})
+    with pytest.raises(ValueError, match="cannot change 'a', which is kept in its raw dtype"):
+        TransformPipeline.from_config([table], scales={"a": 0.5})
+
+
+def test_unknown_columns_are_reported_when_a_batch_arrives():
+    pipeline = _pipeline({"type": "calibrate", "columns": ["nope"], "gain": 2})
+    with pytest.raises(ValueError, match="unknown column 'nope'"):
+        pipeline(_batch(a=[1.0]))
+
+
+def test_stage_times_are_recorded_in_the_metrics():
+    pipeline = _pipeline(
+        {"type": "decimate", "factor": 2},
+        {"type": "clip", "columns": ["a"], "min": 0},
+        {"type": "clip", "columns": ["a"], "max": 5},
+    )
+    metrics = Metrics()
+    pipeline(_batch(a=np.arange(10.0)), metrics=metrics)
+    pipeline(_batch(a=np.arange(4.0)), metrics=metrics)
+    pipeline(_batch(a=np.arange(4.0)))
+    assert pipeline.names == ["transform:decimate", "transform:clip", "transform:clip#2"]
+    assert {name: histogram.count for name, histogram in metrics.histograms.items()} \
+        == {"transform:decimate": 2, "transform:clip": 2, "transform:clip#2": 2}
+
+
+def test_expressions_read_backticked_and_plain_column_names():
+    expression = CompiledExpression("`Sensor 1` * b / 2 - sqrt(abs(b))")
+    assert expression.columns == ["Sensor 1", "b"]
+    values = expression(_batch(**{"Sensor 1": [1, 2], "b": [4, 9]}))
+    assert values.dtype == np.float64
+    assert values.tolist() == [0.0, 6.0]
+
+
+def test_expressions_do_integer_columns_arithmetic_in_floats():
+    difference = CompiledExpression("a - b")
+    batch = _batch(a=np.array([1, 5], dtype=np.uint16), b=np.array([3, 2], dtype=np.uint16))
+    assert difference(batch).tolist() == [-2.0, 3.0]
+
+
+def test_constant_expressions_fill_the_batch():
+    assert CompiledExpression("2 ** 3")(_batch(a=[1.0, 2.0, 3.0])).tolist() == [8.0] * 3
+
+
+@pytest.mark.parametrize("text", [
+    "a.real", "a[0]", "'text'", "True", "__import__('os')", "open('f')",
+    "sqrt(x=a)", "lambda: a", "a if b else c", "a < b", "[a]", "a +",
+])
+def test_expressions_reject_anything_but_arithmetic(text):
+    with pytest.raises(ValueError, match="expression"):
+        CompiledExpression(text)
+
+
+def test_expressions_read_columns_kept_raw_in_their_units():
+    pipeline = TransformPipeline.from_config(
+        [{"type": "expression", "column": "P", "expression": "v * 2"}], scales={"v": 0.5})
+    columns = pipeline(_batch(v=np.array([1023, 7], dtype=np.uint16)))
+    assert columns["P"].tolist() == [1023.0, 7.0]
+    assert columns["v"].dtype == np.uint16
+    with pytest.raises(ValueError, match="cannot change 'v'"):
+        TransformPipeline.from_config(
+            [{"type": "expression", "column": "v", "expression": "v * 2"}], scales={"v": 0.5})
+
+
+def test_expression_stage_adds_its_column():
+    pipeline = _pipeline(
+        {"type": "expression", "column": "power", "expression": "v * i"})
+    columns = pipeline(_batch(v=[1.0, 2.0], i=[3.0, 4.0]))
+    assert columns["power"].tolist() == [3.0, 8.0]
+    assert list(columns) == ["v", "i", "power"]
+    with pytest.raises(ValueError, match="unknown column 'i'"):
+        pipeline(_batch(v=[1.0]))
+    assert added_columns([{"type": "clip"}, {"type": "expression", "column": "power"}]) \
+        == ["power"]
+
+
+FILTERS = [
+    {"type": "moving_average", "window": 5},
+    {"type": "median", "window": 4},
+    {"type": "ema", "alpha": 0.1},
+    {"type": "lowpass", "cutoff": 5.0, "sample_rate": 100.0},
+]
+
+
+def _filtered(table, values, batch_sizes):
+    pipeline = _pipeline(dict(table, input="a", column="smooth"))
+    out = []
+    for part in np.split(values, np.cumsum(batch_sizes)[:-1]):
+        columns = pipeline(_batch(a=part))
+        assert columns["a"] is not columns["smooth"]
+        out += columns["smooth"].tolist()
+    return np.array(out)
+
+
+@pytest.mark.parametrize("table", FILTERS, ids=lambda table: table["type"])
+def test_filters_carry_their_state_across_batches(table):
+    values = np.random.default_rng(0).normal(size=300).cumsum()
+    whole = _filtered(table, values, [300])
+    assert _filtered(table, values, [1, 2, 50, 7, 240]) == pytest.approx(whole, abs=1e-9)
+
+
+@pytest.mark.parametrize("table", FILTERS, ids=lambda table: table["type"])
+def test_filters_start_settled_on_the_first_value(table):
+    assert _filtered(table, np.full(20, 3.0), [20]) == pytest.approx([3.0] * 20)
+
+
+def test_boxcar_median_and_ema_match_their_definitions():
+    values = np.array([0.0, 10.0, 0.0, 0.0, 6.0, 3.0])
+    assert _filtered({"type": "moving_average", "window": 2}, values, [6]).tolist() \
+        == [0.0, 5.0, 5.0, 0.0, 3.0, 4.5]
+    assert _filtered({"type": "median", "window": 3}, values, [6]).tolist() \
+        == [0.0, 0.0, 0.0, 0.0, 0.0, 3.0]
+    expected, state = [], values[0]
+    for value in values:
+        state = 0.5 * value + 0.5 * state
+        expected.append(state)
+    assert _filtered({"type": "ema", "alpha": 0.5}, values, [6]) == pytest.approx(expected)
+
+
+def test_lowpass_matches_the_direct_form_recursion():
+    table = {"type": "lowpass", "cutoff": 10.0, "sample_rate": 100.0, "q": 2.0}
+    values = np.random.default_rng(1).normal(size=200)
+    stage = _pipeline(dict(table, input="a", column="y")).stages[0]
+    b = stage._b
+    a1, a2 = np.poly(stage._poles).real[1:]
+    expected, x1, x2, y1, y2 = [], values[0], values[0], values[0], values[0]
+    for x in values:
+        y = b[0] * x + b[1] * x1 + b[2] * x2 - a1 * y1 - a2 * y2
+        x1, x2, y1, y2 = x, x1, y, y1
+        expected.append(y)
+    assert _filtered(table, values, [64, 136]) == pytest.approx(expected, abs=1e-9)
+
+
+def test_lowpass_lets_slow_changes_through_and_removes_fast_ones():
+    t = np.arange(2000) / 1000.0
+    slow = np.sin(2 * np.pi * 0.2 * t)
+    fast = np.sin(2 * np.pi * 200 * t)
+    out = _filtered({"type": "lowpass", "cutoff": 20.0, "sample_rate": 1000.0},
+                    slow + fast, [500] * 4)
+    assert np.abs(out[500:] - slow[500:]).max() < 0.05
+
+
+def test_filters_read_columns_kept_raw_in_their_units():
+    pipeline = TransformPipeline.from_config(
+        [{"type": "moving_average", "input": "v", "column": "smooth", "window": 2}],
+        scales={"v": 0.5})
+    columns = pipeline(_batch(v=np.array([2, 4, 8], dtype=np.uint16)))
+    assert columns["smooth"].tolist() == [1.0, 1.5, 3.0]
+
+
+@pytest.mark.parametrize("table, message", [
+    ({"type": "ema", "column": "y", "alpha": 0.1}, "input"),
+    ({"type": "ema", "input": "a", "column": "y", "alpha": 0}, "alpha"),
+    ({"type": "median", "input": "a", "column": "y", "window": 2.5}, "positive integer"),
+    ({"type": "lowpass", "input": "a", "column": "y", "cutoff": 60, "sample_rate": 100},
+     "half the 'sample_rate'"),
+])
+def test_invalid_filters_are_rejected(table, message):
+    with pytest.raises(ValueError, match=message):
+        _pipeline(table)
+
+
+def test_build_transforms_is_none_without_transforms():
+    assert build_transforms({}) is None
+    with pytest.raises(ValueError, match="list of tables"):
+        build_transforms({"transforms": {"type": "clip"}})
+
+
+def test_build_transforms_knows_the_columns_read_raw():
+    idev = ReadSensorAbstract()
+    idev.column_scales = {"a": 0.5}
+    config = {"transforms": [{"type": "calibrate", "columns": ["a"], "gain": 2}]}
+    with pytest.raises(ValueError, match="transforms\\[0\\].*raw dtype"):
+        build_transforms(config, idev)
+
+
+class _ListDevice(object):
+    def __init__(self, samples):
+        self.samples = list(samples)
+
+    def readsamples(self, num_samples):
+        batch, self.samples = self.samples[:num_samples], self.samples[num_samples:]
+        return batch
+
+
+def test_acquisition_writes_and_buffers_transformed_samples(tmp_path):
+    samples = [{"t": float(i), "a": float(i) * 10} for i in range(6)]
+    transforms = build_transforms({"transforms": [
+        {"type": "decimate", "factor": 2},
+        {"type": "calibrate", "columns": ["a"], "gain": 0.1},
+        {"type": "expression", "column": "twice a", "expression": "2 * a"},
+    ]})
+    buffers = DataBuffers()
+    outfile_path = tmp_path / "out.txt"
+    output_config = {"columns": ["t", "a", "twice a"]}
+    with WriteSensorFile(filename=str(outfile_path), config=output_config) as outfile:
+        acquisition = Acquisition(idev=_ListDevice(samples), buffers=buffers, outfile=outfile,
+                                  samples_per_step=3, transforms=transforms)
+        stored = acquisition.step() + acquisition.step()
+    assert [sample["t"] for sample in stored] == [0.0, 2.0, 4.0]
+    assert buffers.data["a"].tolist() == pytest.approx([0.0, 2.0, 4.0])
+    assert buffers.data["twice a"].tolist() == pytest.approx([0.0, 4.0, 8.0])
+    assert buffers.seq == 3
+    assert {"transform", "transform:decimate", "transform:expression"} \
+        <= set(acquisition.metrics.histograms)
+    assert outfile_path.read_text().splitlines()[2:] == [
+        "0.0\t0.0\t0.0", "2.0\t2.0\t4.0", "4.0\t4.0\t8.0"]
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from aves.trigger import Trigger, TriggeredWriter, segment_filename
+from aves.wiring import build_output_device
+
+OUTPUT_CONFIG = {"columns": ["t", "a"]}
+
+
+def _record(tmp_path, values, trigger, batch_size=3, fire_at=(), scales=None):
+    writer = TriggeredWriter(str(tmp_path / "run.txt"), OUTPUT_CONFIG, trigger, scales=scales)
+    with writer:
+        for start in range(0, len(values), batch_size):
+            if start in fire_at:
+                writer.fire()
+            writer.write([{"t": i, "a": values[i]}
+                          for i in range(start, min(start + batch_size, len(values)))])
+    return [[int(line.split("\t")[0]) for line in open(name).read().splitlines()[2:]]
+            for name in writer.segments]
+
+
+def test_segments_hold_the_samples_around_each_crossing(tmp_path):
+    values = [0, 1, 6, 7, 0, 0, 0, 9, 9, 9, 9, 9, 9, 9, 0, 8]
+    trigger = {"column": "a", "above": 5, "pre_samples": 2, "post_samples": 3}
+    # The column staying above 5 after the second segment does not fire
+    # again: only crossing the level does
+    assert _record(tmp_path, values, trigger) == [
+        [0, 1, 2, 3, 4], [5, 6, 7, 8, 9], [13, 14, 15]]
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "run-001.txt", "run-002.txt", "run-003.txt"]
+
+
+def test_segments_do_not_depend_on_batching(tmp_path):
+    values = list(np.random.default_rng(0).integers(0, 10, size=200))
+    trigger = {"column": "a", "rising": 6, "pre_samples": 4, "post_samples": 7}
+    whole = _record(tmp_path / "whole", values, trigger, batch_size=200)
+    assert len(whole) > 3
+    assert _record(tmp_path / "batched", values, trigger, batch_size=5) == whole
+
+
+def test_firing_from_outside_starts_a_segment_at_the_next_sample(tmp_path):
+    trigger = {"column": "a", "below": -100, "pre_samples": 1, "post_samples": 2}
+    assert _record(tmp_path, [0] * 12, trigger, fire_at=(6,)) == [[5, 6, 7]]
+
+
+def test_levels_are_in_converted_units(tmp_path):
+    trigger = {"column": "a", "above": 2.5, "pre_samples": 0, "post_samples": 1}
+    assert _record(tmp_path, [100, 400, 600], trigger, scales={"a": 0.005}) == [[2]]
+
+
+def test_falling_fires_on_a_drop():
+    trigger = Trigger({"column": "a", "falling": 2})
+    assert trigger.first(np.array([5.0, 4.0])) is None
+    assert trigger.first(np.array([1.5, 1.0])) == 0
+
+
+@pytest.mark.parametrize("trigger, message", [
+    ({"column": "a", "pre_samples": 1, "post_samples": 1}, "exactly one of"),
+    ({"column": "a", "above": 1, "below": 0, "pre_samples": 1, "post_samples": 1},
+     "exactly one of"),
+    ({"column": "a", "above": 1, "pre_samples": -1, "post_samples": 1}, "whole number"),
+    ({"column": "a", "above": 1, "pre_samples": 1, "post_samples": 0}, "at least 1"),
+    ({"above": 1, "pre_samples": 1, "post_samples": 1}, "column"),
+])
+def test_invalid_triggers_are_rejected(trigger, message):
+    with pytest.raises(ValueError, match=message):
+        TriggeredWriter("run.txt", OUTPUT_CONFIG, trigger)
+
+
+def test_segment_filenames():
+    assert segment_filename("data/run.txt", 1) == "data/run-001.txt"
+    assert segment_filename("data/run", 12) == "data/run-012.txt"
+
+
+def test_build_output_device_records_triggered_with_a_trigger_section(tmp_path):
+    config = {"output": OUTPUT_CONFIG,
+              "trigger": {"column": "a", "above": 1, "pre_samples": 1, "post_samples": 1}}
+    assert isinstance(build_output_device(str(tmp_path / "run.txt"), config), TriggeredWriter)
+
+
+def test_build_output_device_rejects_an_unknown_trigger_column(tmp_path):
+    config = {"output": OUTPUT_CONFIG,
+              "trigger": {"column": "nope", "above": 1, "pre_samples": 1, "post_samples": 1}}
+    with pytest.raises(ValueError, match="'trigger' section refers to the unknown column 'nope'"):
+        build_output_device(str(tmp_path / "run.txt"), config)
@@ -0,0 +1,83 @@
+import multiprocessing
+import queue
+import threading
+import time
+import uuid
+
+import matplotlib
+matplotlib.use("Agg")
+
+import pytest
+
+from aves.gui import SensorViewerGUI
+from aves.sharedbuffers import SharedDataBuffers
+from aves.viewer import ViewerProcess, _view
+
+GUI_CONFIG = {
+    "x_column": "t",
+    "zoom_all_together": True,
+    "axes": [{"name": "A", "row": 0, "col": 0, "columns": ["a"]}],
+}
+
+
+@pytest.fixture
+def buffers():
+    with SharedDataBuffers("aves_test_" + uuid.uuid4().hex[:8], ["t", "a"],
+                           capacity=8, maxlen=4) as buffers:
+        yield buffers
+
+
+def test_the_viewer_draws_the_newest_shared_samples(buffers, monkeypatch):
+    rendered = []
+    events = queue.Queue()
+    done = threading.Event()
+
+    def run(window, tick):
+        # What the refresh timer would do, with samples arriving in between
+        assert tick()
+        buffers.extend([{"t": float(i), "a": 2.0 * i} for i in range(6)])
+        assert tick()
+        assert tick()
+        done.set()
+        buffers.extend([{"t": 6.0, "a": 12.0}])
+        assert not tick()
+    monkeypatch.setattr(SensorViewerGUI, "run", run)
+    monkeypatch.setattr(SensorViewerGUI, "render",
+                        lambda window, data: rendered.append(data["a"].tolist()))
+    _view(GUI_CONFIG, buffers.name, events, done)
+    # Nothing while there are no samples, and once per new samples
+    assert rendered == [[4.0, 6.0, 8.0, 10.0], [6.0, 8.0, 10.0, 12.0]]
+    assert events.get_nowait() == ("ready", None)
+
+
+def test_the_viewer_process_sends_keys_back(buffers, monkeypatch):
+    # With the Agg backend, the window "closes" as soon as it is shown
+    monkeypatch.setenv("MPLBACKEND", "Agg")
+    scaled, triggered = [], []
+    viewer = ViewerProcess(GUI_CONFIG, buffers.name,
+                           on_plot_window_scale=scaled.append,
+                           on_trigger=lambda: triggered.append(True))
+    with viewer:
+        viewer._events.put(("scale", 2.0))
+        viewer._events.put(("trigger", None))
+        viewer._process.join(timeout=30)
+        assert viewer.closed
+        viewer.poll()
+    assert scaled == [2.0]
+    assert triggered == [True]
+
+
+def test_an_error_closes_the_viewer_without_waiting_for_the_window():
+    # A viewer whose window would stay open for a minute
+    viewer = ViewerProcess.__new__(ViewerProcess)
+    context = multiprocessing.get_context("spawn")
+    viewer._events = context.Queue()
+    viewer._done = context.Event()
+    viewer._process = context.Process(target=time.sleep, args=(60,))
+    viewer._process.start()
+    start = time.monotonic()
+    with pytest.raises(RuntimeError):
+        with viewer:
+            raise RuntimeError("acquisition failed")
+    assert viewer.closed
+    assert time.monotonic() - start < 30
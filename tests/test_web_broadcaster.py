@@ -3,7 +3,7 @@ import threading
 
 import pytest
 
-from aves.web.broadcaster import Broadcaster
+from aves.web.broadcaster import CLOSE, Broadcaster
 
 
 def test_broadcaster_delivers_to_a_subscribed_queue():
@@ -71,3 +71,35 @@ def test_broadcaster_publish_is_safe_from_a_different_thread():
         message = await asyncio.wait_for(queue.get(), timeout=2)
         assert message == {"x": 1}
     asyncio.run(scenario())
+
+
+def test_broadcaster_subscribe_requests_a_resync():
+    async def scenario():
+        broadcaster = Broadcaster()
+        broadcaster.bind_loop()
+        assert not broadcaster.resync_requested.is_set()
+        await broadcaster.subscribe()
+        assert broadcaster.resync_requested.is_set()
+    asyncio.run(scenario())
+
+
+def test_broadcaster_counts_queued_bytes_and_drops_a_client():
+    async def scenario():
+        broadcaster = Broadcaster()
+        broadcaster.bind_loop()
+        slow = await broadcaster.subscribe()
+        fast = await broadcaster.subscribe()
+        for i in range(3):
+            broadcaster.publish({"data": [float(i)] * 100})
+        await asyncio.sleep(0)
+        await fast.get()
+        usage = {client["client"]: client for client in broadcaster.memory_usage()}
+        assert usage[slow.client]["messages"] == 3
+        assert usage[slow.client]["bytes"] > usage[fast.client]["bytes"] > 0
+
+        broadcaster.drop(slow.client)
+        assert [client["client"] for client in broadcaster.memory_usage()] == [fast.client]
+        await asyncio.sleep(0)  # the queue is emptied in the loop's thread
+        assert await slow.get() is CLOSE
+        assert slow.nbytes == 0
+    asyncio.run(scenario())
@@ -268,7 +268,9 @@ def _make_settings_app(tmp_path, window_title="Before", token=None, config_forma
     app = create_app(initial_config["gui"], config_path=str(config_file), token=token)
     args = types.SimpleNamespace(
         port=str(infile), config_file=str(config_file), outfile=None,
-        plot_win_size=200, tmeas=float("inf"), plot_every_n_samples=1)
+        plot_win_size=200, tmeas=float("inf"), plot_every_n_samples=1,
+        follow=False, history_tiers=None, shm_name=None, plot_win_seconds=None,
+        memory_budget=None, target_latency=None)
     manager = AcquisitionManager(app, args)
     app.state.restart_callback = manager.restart
     manager.start(initial_config)
@@ -3,20 +3,27 @@ import types
 
 import pytest
 
-from aves.io import DataBuffers, ReadSensorFile
-from aves.acquisition import Acquisition
-from aves.web.__main__ import AcquisitionManager, _acquisition_loop
+from aves.io import DataBuffers, ReadSensorAbstract, ReadSensorFile, ReadSensorSerial
+from aves.acquisition import Acquisition, AsyncAcquisition
+from aves.web.__main__ import (
+    AcquisitionManager, _AcquisitionTask, _acquisition_loop, _data_message)
+from aves.web.broadcaster import Broadcaster
+from tests.test_acquisition import PipeSerialPort
 
 
 class FakeBroadcaster:
     def __init__(self):
         self.ready = threading.Event()
         self.ready.set()
+        self.resync_requested = threading.Event()
         self.published = []
 
     def publish(self, message):
         self.published.append(message)
 
+    def memory_usage(self):
+        return []
+
 
 def test_acquisition_loop_publishes_each_batch_until_input_exhausted(tmp_path):
     infile = tmp_path / "in.txt"
@@ -29,16 +36,53 @@ def test_acquisition_loop_publishes_each_batch_until_input_exhausted(tmp_path):
         stop_event = threading.Event()
         _acquisition_loop(acquisition, broadcaster, stop_event)
 
-    # 3 publishes for 2 lines: buffers.data guard checks "has ever had
-    # data", not "changed this step", so the step that discovers EOF
-    # (empty batch, but buffers still non-empty from before) publishes
-    # once more before should_stop() finally trips -- same accepted
-    # pattern already in realtime.py's _tick(), not new here.
-    assert len(broadcaster.published) == 3
-    assert broadcaster.published[1] == broadcaster.published[2] == {
-        "a": ["3", "1"], "b": [4.0, 2.0]}
-    # values are plain lists (JSON-serializable), not deques
-    assert isinstance(broadcaster.published[-1]["a"], list)
+    # One publish per step that added samples: the first one is a full
+    # snapshot, the rest only what the step added. The step that discovers
+    # EOF adds nothing, so it publishes nothing.
+    assert broadcaster.published == [
+        {"__aves_delta__": True, "reset": True, "seq": 1, "maxlen": None, "length": 1,
+         "data": {"a": ["1"], "b": [2.0]}},
+        {"__aves_delta__": True, "reset": False, "seq": 2, "maxlen": None, "length": 2,
+         "data": {"a": ["3"], "b": [4.0]}},
+    ]
+    # values are plain lists (JSON-serializable), not numpy arrays
+    assert isinstance(broadcaster.published[-1]["data"]["a"], list)
+
+
+def test_acquisition_loop_resends_everything_when_a_client_subscribes(tmp_path):
+    infile = tmp_path / "in.txt"
+    infile.write_text("1\t2.0\n3\t4.0\n5\t6.0\n")
+    config = {"columns": ["a", "b"]}
+
+    class SubscribingBroadcaster(FakeBroadcaster):
+        def publish(self, message):
+            super().publish(message)
+            if len(self.published) == 1:
+                # What Broadcaster.subscribe() does
+                self.resync_requested.set()
+
+    broadcaster = SubscribingBroadcaster()
+    with ReadSensorFile(filename=str(infile), config=config) as idev:
+        acquisition = Acquisition(idev=idev, buffers=DataBuffers(maxlen=2),
+                                  samples_per_step=1)
+        _acquisition_loop(acquisition, broadcaster, threading.Event())
+
+    assert [(m["reset"], m["data"]["b"]) for m in broadcaster.published] == [
+        (True, [2.0]), (True, [2.0, 4.0]), (False, [6.0])]
+    assert broadcaster.published[-1]["length"] == 2
+
+
+def test_data_messages_carry_the_length_of_a_time_window():
+    # Bounded in seconds, not samples: maxlen is null, but what the
+    # buffers hold is still bounded
+    buffers = DataBuffers(time_window=2, time_column="t")
+    buffers.extend([{"t": float(t)} for t in range(3)])
+    first, seq = _data_message(buffers, None)
+    buffers.extend([{"t": float(t)} for t in range(3, 6)])
+    delta, seq = _data_message(buffers, seq)
+
+    assert (first["reset"], first["length"], first["maxlen"]) == (True, 3, None)
+    assert (delta["reset"], delta["data"]["t"], delta["length"]) == (False, [3.0, 4.0, 5.0], 3)
 
 
 def test_acquisition_loop_waits_for_broadcaster_ready(tmp_path):
@@ -75,11 +119,8 @@ def test_acquisition_loop_waits_for_broadcaster_ready(tmp_path):
         _acquisition_loop(acquisition, broadcaster, stop_event)
         releaser.join()
 
-    # 2, not 1: see the comment in the previous test -- the
-    # EOF-detecting step re-publishes the same (by-then-unchanged)
-    # data once more.
-    assert len(broadcaster.published) == 2
-    assert broadcaster.was_ready_at_publish == [True, True]
+    assert len(broadcaster.published) == 1
+    assert broadcaster.was_ready_at_publish == [True]
 
 
 def test_acquisition_loop_stops_when_stop_event_is_set_between_batches(tmp_path):
@@ -104,6 +145,50 @@ def test_acquisition_loop_stops_when_stop_event_is_set_between_batches(tmp_path)
     assert len(broadcaster.published) == 3
 
 
+def test_acquisition_task_runs_on_the_server_loop_once_there_is_one():
+    import asyncio
+    import os
+
+    config = {"arduino": {"baudrate": 9600, "timeout": 5, "columns": [{"name": "a"}]}}
+    idev = ReadSensorSerial(port="/dev/fake", config=config)
+    idev._inputdata = port = PipeSerialPort()
+    published = []
+    loop_threads = []
+
+    class RecordingBroadcaster(Broadcaster):
+        def publish(self, message):
+            loop_threads.append(threading.get_ident())
+            published.append(message)
+            super().publish(message)
+
+    broadcaster = RecordingBroadcaster()
+    runner = _AcquisitionTask(
+        AsyncAcquisition(idev=idev, buffers=DataBuffers(), samples_per_step=2), broadcaster)
+    # Started before the server's loop exists, as main() does
+    runner.start()
+
+    loop = asyncio.new_event_loop()
+    server = threading.Thread(target=loop.run_forever)
+    server.start()
+    try:
+        loop.call_soon_threadsafe(broadcaster.bind_loop, loop)
+        os.write(port.write_fd, b"1\n2\n")
+        for _ in range(100):
+            if published:
+                break
+            threading.Event().wait(0.01)
+        # Cancels the task, which was waiting for more samples
+        assert runner.stop(timeout=1)
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        server.join()
+        loop.close()
+        port.close()
+
+    assert [message["data"]["a"] for message in published] == [[1.0, 2.0]]
+    assert loop_threads == [server.ident]
+
+
 def _write_config(path, x_column="a", columns=("a", "b")):
     columns_toml = ", ".join(f'"{c}"' for c in columns)
     path.write_text(
@@ -117,11 +202,18 @@ def _write_config(path, x_column="a", columns=("a", "b")):
 
 
 def _make_args(port, config_file, outfile=None, plot_win_size=None,
-               tmeas=float('inf'), plot_every_n_samples=1):
+               tmeas=float('inf'), plot_every_n_samples=1, follow=False,
+               history_tiers=None, shm_name=None, plot_win_seconds=None,
+               memory_budget=None, memory_policy=("clients", "buffers"),
+               target_latency=None, min_batch=1, max_batch=1000, batch_deadline=None):
     return types.SimpleNamespace(
         port=port, config_file=config_file, outfile=outfile,
         plot_win_size=plot_win_size, tmeas=tmeas,
-        plot_every_n_samples=plot_every_n_samples)
+        plot_every_n_samples=plot_every_n_samples, follow=follow,
+        history_tiers=history_tiers, shm_name=shm_name,
+        plot_win_seconds=plot_win_seconds, memory_budget=memory_budget,
+        memory_policy=memory_policy, target_latency=target_latency,
+        min_batch=min_batch, max_batch=max_batch, batch_deadline=batch_deadline)
 
 
 def _make_app():
@@ -151,6 +243,52 @@ def test_acquisition_manager_start_and_stop(tmp_path):
     assert app.state.broadcaster.published
 
 
+def test_acquisition_manager_fires_a_triggered_recording(tmp_path):
+    from aves.utils import parse_config
+
+    config_file = tmp_path / "config.toml"
+    _write_config(config_file)
+    infile = tmp_path / "in.txt"
+    infile.write_text("1\t2.0\n")
+    args = _make_args(port=str(infile), config_file=str(config_file),
+                      outfile=str(tmp_path / "out.txt"))
+    manager = AcquisitionManager(_make_app(), args)
+    config = parse_config(config_file=str(config_file))
+
+    assert not manager.trigger()
+    manager.start(config)
+    assert not manager.trigger()  # recording everything, nothing to fire
+    manager.stop()
+    config["trigger"] = {"column": "b", "above": 100, "pre_samples": 1, "post_samples": 1}
+    manager.start(config)
+    assert manager.trigger()
+    manager.stop()
+
+
+def test_acquisition_manager_publishes_alarms(tmp_path):
+    from aves.utils import parse_config
+
+    config_file = tmp_path / "config.toml"
+    _write_config(config_file)
+    infile = tmp_path / "in.txt"
+    infile.write_text("1\t2.0\n3\t9.0\n")
+    args = _make_args(port=str(infile), config_file=str(config_file))
+    app = _make_app()
+    manager = AcquisitionManager(app, args)
+    config = parse_config(config_file=str(config_file))
+    config["alarms"] = [{"name": "high", "column": "b", "above": 5}]
+
+    manager.start(config)
+    assert app.state.alarms is not None
+    manager._runner._thread.join(timeout=5)
+    manager.stop()
+    assert app.state.alarms is None
+    alarms = [message for message in app.state.broadcaster.published
+              if message.get("__aves_alarm__")]
+    assert [(message["name"], message["active"], message["value"]) for message in alarms] \
+        == [("high", True, 9.0)]
+
+
 def test_acquisition_manager_start_twice_raises(tmp_path):
     from aves.utils import parse_config
 
@@ -270,3 +408,90 @@ def test_acquisition_manager_restart_failure_leaves_nothing_running(tmp_path):
     with pytest.raises(ValueError):
         manager.restart(config_path=str(broken_config_file))
     assert not manager.is_running
+
+
+def test_acquisition_manager_set_plot_window_resizes_running_buffers(tmp_path):
+    from aves.utils import parse_config
+
+    config_file = tmp_path / "config.toml"
+    _write_config(config_file)
+    infile = tmp_path / "in.txt"
+    infile.write_text("1\t2.0\n3\t4.0\n")
+
+    args = _make_args(port=str(infile), config_file=str(config_file), plot_win_size=10)
+    app = _make_app()
+    manager = AcquisitionManager(app, args)
+    manager.start(parse_config(config_file=str(config_file)))
+    assert app.state.plot_window == 10
+    buffers = manager._acquisition.buffers
+    calls = []
+    # Record what would run in the acquisition thread, rather than racing it
+    manager._acquisition.call_soon = lambda callback, *a: calls.append((callback, a))
+    try:
+        assert manager.set_plot_window(1) == 1
+    finally:
+        manager.stop()
+
+    assert args.plot_win_size == 1
+    assert calls == [(buffers.set_maxlen, (1,))]
+
+
+def test_acquisition_manager_shows_the_window_the_memory_budget_shrank_to(tmp_path):
+    from aves.utils import parse_config
+
+    config_file = tmp_path / "config.toml"
+    _write_config(config_file)
+    infile = tmp_path / "in.txt"
+    infile.write_text("".join(f"{i}\t{i}.0\n" for i in range(100)))
+
+    args = _make_args(port=str(infile), config_file=str(config_file), plot_win_size=100,
+                      plot_every_n_samples=100, memory_budget=1,
+                      memory_policy=["buffers"])
+    app = _make_app()
+    manager = AcquisitionManager(app, args)
+    manager.start(parse_config(config_file=str(config_file)))
+    manager._runner._thread.join(timeout=5)
+    buffers = manager._acquisition.buffers
+    manager.stop()
+
+    assert app.state.plot_window == buffers.maxlen < 100
+
+
+class _WindowsSerialPort(ReadSensorAbstract):
+    "A serial port as on Windows: readable without blocking, but with no fileno()."
+
+    timeout = 1.0
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def readsamples(self, num_samples=-1):
+        self._stop_sampling = True
+        return []
+
+    def readsamples_nowait(self):
+        return []
+
+    def fileno(self):
+        raise AttributeError("'Serial' object has no attribute 'fileno'")
+
+
+def test_acquisition_manager_reads_ports_it_cannot_wait_on_in_a_thread(tmp_path, monkeypatch):
+    from aves.utils import parse_config
+    from aves.web.__main__ import _AcquisitionThread
+
+    config_file = tmp_path / "config.toml"
+    _write_config(config_file)
+    monkeypatch.setattr("aves.web.__main__.build_input_device",
+                        lambda *args, **kwargs: _WindowsSerialPort())
+    manager = AcquisitionManager(_make_app(), _make_args(port="COM3",
+                                                         config_file=str(config_file)))
+    manager.start(parse_config(config_file=str(config_file)))
+    try:
+        assert isinstance(manager._runner, _AcquisitionThread)
+        assert type(manager._acquisition) is Acquisition
+    finally:
+        manager.stop()
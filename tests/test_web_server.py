@@ -452,3 +452,121 @@ def test_websocket_accepts_connection_with_session_cookie():
         with client.websocket_connect("/ws/data") as ws:
             app.state.broadcaster.publish({"value": 2})
             assert ws.receive_json() == {"value": 2}
+
+
+def test_plot_window_without_a_callback_reports_unsupported():
+    app = create_app({"x_column": "t", "axes": []})
+
+    with TestClient(app) as client:
+        response = client.put("/api/plot_window", json={"maxlen": 100})
+
+    assert response.status_code == 400
+
+
+def test_plot_window_calls_the_callback():
+    app = create_app({"x_column": "t", "axes": []})
+    app.state.plot_window = 200
+    calls = []
+
+    def fake_set_plot_window(maxlen):
+        calls.append(maxlen)
+        return maxlen
+
+    app.state.plot_window_callback = fake_set_plot_window
+
+    with TestClient(app) as client:
+        before = client.get("/api/plot_window").json()
+        client.put("/api/plot_window", json={"maxlen": 500})
+        # 0 means unlimited
+        response = client.put("/api/plot_window", json={"maxlen": 0})
+        after = client.get("/api/plot_window").json()
+
+    assert response.status_code == 200
+    assert calls == [500, None]
+    assert before == {"maxlen": 200}
+    assert after == {"maxlen": None}
+
+
+def test_data_reads_the_running_buffers():
+    from aves.io import DataBuffers
+
+    app = create_app({"x_column": "t", "axes": []})
+    with TestClient(app) as client:
+        assert client.get("/api/data").status_code == 404
+
+        buffers = DataBuffers(maxlen=10)
+        buffers.extend([{"t": 0, "a": 1.0}, {"t": 1, "a": 2.0}])
+        app.state.buffers = buffers
+        first = client.get("/api/data").json()
+        buffers.extend([{"t": 2, "a": 3.0}])
+        delta = client.get("/api/data", params={"since": first["seq"]}).json()
+
+    assert first == {"reset": True, "seq": 2, "maxlen": 10, "length": 2,
+                     "data": {"t": [0.0, 1.0], "a": [1.0, 2.0]}}
+    assert delta == {"reset": False, "seq": 3, "maxlen": 10, "length": 3,
+                     "data": {"t": [2.0], "a": [3.0]}}
+
+
+def test_memory_reports_the_running_buffers():
+    from aves.io import DataBuffers
+
+    app = create_app({"x_column": "t", "axes": []})
+    with TestClient(app) as client:
+        idle = client.get("/api/memory").json()
+        buffers = DataBuffers(maxlen=10)
+        buffers.extend([{"t": 0, "a": 1.0}])
+        app.state.buffers = buffers
+        running = client.get("/api/memory").json()
+
+    assert idle == {"buffers": {"columns": {}, "history": 0, "total": 0},
+                    "clients": [], "total": 0}
+    assert running["buffers"]["columns"] == {"t": 160, "a": 160}
+    assert running["total"] == 320
+
+
+def test_trigger_calls_the_callback():
+    app = create_app({"x_column": "t", "axes": []})
+    with TestClient(app) as client:
+        unsupported = client.post("/api/trigger")
+        running = []
+        app.state.trigger_callback = lambda: bool(running)
+        not_triggered = client.post("/api/trigger")
+        running.append(True)
+        fired = client.post("/api/trigger")
+
+    assert unsupported.status_code == 400
+    assert not_triggered.status_code == 409
+    assert fired.json() == {"fired": True}
+
+
+def test_metrics_reports_the_running_acquisitions_metrics():
+    from aves.metrics import Metrics
+
+    app = create_app({"x_column": "t", "axes": []})
+    with TestClient(app) as client:
+        idle = client.get("/api/metrics").json()
+        metrics = Metrics()
+        metrics.record("read", 1500)
+        app.state.metrics = metrics
+        running = client.get("/api/metrics").json()
+
+    assert idle == {"seconds": 0.0, "stages": {}, "counters": {}}
+    assert running["stages"]["read"]["count"] == 1
+
+
+def test_alarms_reports_the_running_acquisitions_alarms():
+    import numpy as np
+
+    from aves.alarms import Alarms
+
+    app = create_app({"x_column": "t", "axes": []})
+    with TestClient(app) as client:
+        idle = client.get("/api/alarms").json()
+        alarms = Alarms([{"name": "high", "column": "a", "above": 5}])
+        alarms.check({"a": np.array([1.0, 9.0])})
+        app.state.alarms = alarms
+        running = client.get("/api/alarms").json()
+
+    assert idle == {"active": [], "events": []}
+    assert [(event["name"], event["value"]) for event in running["active"]] == [("high", 9.0)]
+    assert running["events"] == running["active"]
@@ -1,7 +1,9 @@
+import numpy as np
 import pytest
 
-from aves.io import ReadSensorFile, ReadSensorSerial, WriteSensorFile
-from aves.wiring import build_input_device, build_output_device
+from aves.io import ReadSensorAbstract, ReadSensorFile, ReadSensorSerial, WriteSensorFile
+from aves.sharedbuffers import SharedBuffersReader
+from aves.wiring import build_buffers, build_input_device, build_output_device
 
 
 def test_build_input_device_replays_an_existing_file(tmp_path):
@@ -12,6 +14,20 @@ def test_build_input_device_replays_an_existing_file(tmp_path):
     assert isinstance(idev, ReadSensorFile)
 
 
+def test_build_input_device_can_follow_a_file(tmp_path):
+    infile = tmp_path / "in.txt"
+    infile.write_text("1\t2.0\n")
+    config = {"output": {"columns": ["a", "b"]}}
+    idev = build_input_device(str(infile), config, follow=True)
+    assert isinstance(idev, ReadSensorFile)
+    assert idev._follow
+
+
+def test_build_input_device_follow_requires_a_file():
+    with pytest.raises(ValueError, match="--follow"):
+        build_input_device("/dev/definitely-not-a-real-path", config={}, follow=True)
+
+
 def test_build_input_device_uses_serial_for_a_nonexistent_path():
     config = {
         "input": {
@@ -46,3 +62,69 @@ def test_build_output_device_returns_a_writer_with_output_section(tmp_path):
     config = {"output": {"columns": ["a", "b"]}}
     dev = build_output_device(str(outfile), config)
     assert isinstance(dev, WriteSensorFile)
+
+
+def test_build_buffers_reserves_room_and_adds_history():
+    config = {"gui": {"x_column": "t"}}
+    buffers = build_buffers(200, config, history_tiers="1:3600,60:1440")
+    assert buffers.maxlen == 200
+    assert buffers.capacity == 800
+    assert [(tier.width, tier.length) for tier in buffers.history.tiers] == [
+        (1.0, 3600), (60.0, 1440)]
+    assert build_buffers(None, config).history is None
+
+
+def test_build_output_device_refuses_integer_dtypes_for_converted_columns(tmp_path):
+    config = {
+        "input": {"arduino": {"columns": [
+            {"name": "t"},
+            {"name": "v", "dtype": "uint16", "conversion_factor": 0.0048828125}]}},
+        "output": {"columns": ["t", "v"], "dtypes": {"t": "uint32", "v": "uint16"}},
+    }
+    with pytest.raises(ValueError, match="'output.dtypes.v' entry.*float dtype"):
+        build_output_device(str(tmp_path / "out.txt"), config)
+    config["output"]["dtypes"]["v"] = "float32"
+    assert isinstance(build_output_device(str(tmp_path / "out.txt"), config), WriteSensorFile)
+
+
+def test_build_buffers_history_widths_follow_a_scaled_x_column():
+    idev = ReadSensorAbstract()
+    idev.column_dtypes = {"t": np.dtype("uint32")}
+    idev.column_scales = {"t": 0.001}
+    buffers = build_buffers(200, {"gui": {"x_column": "t"}}, history_tiers="1:10",
+                            idev=idev)
+    assert buffers.history.tiers[0].width == 1000.0
+
+
+def test_build_buffers_history_needs_an_x_column():
+    with pytest.raises(ValueError, match="history_tiers"):
+        build_buffers(200, {}, history_tiers="1:10")
+
+
+def test_build_buffers_shm_needs_a_bounded_window():
+    with pytest.raises(ValueError, match="--shm-name"):
+        build_buffers(None, {"output": {"columns": ["a"]}}, shm_name="aves_unused")
+
+
+def test_build_buffers_shares_the_columns_the_transforms_add():
+    config = {
+        "input": {"arduino": {"columns": [{"name": "t"}, {"name": "a"},
+                                          {"name": "time_computer"}]}},
+        "output": {"columns": ["t", "a", "time_computer"]},
+        "transforms": [{"type": "expression", "column": "double",
+                        "expression": "2 * a"}],
+        "gui": {"x_column": "t", "axes": [{"columns": ["a", "double"]}]},
+    }
+    with build_buffers(10, config, shm_name="aves_test_wiring_shm") as buffers:
+        buffers.extend([{"t": 1.0, "a": 2.0, "double": 4.0, "time_computer": "x"}])
+        with SharedBuffersReader(buffers.name) as reader:
+            snapshot = reader.snapshot()
+    assert list(snapshot) == ["t", "a", "double"]
+    assert snapshot["double"].tolist() == [4.0]
+
+
+def test_build_buffers_time_window_along_the_x_column():
+    buffers = build_buffers(None, {"gui": {"x_column": "t"}}, plot_win_seconds=30)
+    assert (buffers.time_window, buffers.time_column, buffers.maxlen) == (30, "t", None)
+    with pytest.raises(ValueError, match="plot_win_seconds"):
+        build_buffers(None, {}, plot_win_seconds=30)